@@ -0,0 +1,138 @@
+import math
+import random
+
+PATTERN_CONSTANT = 'constant'
+PATTERN_RAMP = 'ramp'
+PATTERN_STEP = 'step'
+PATTERN_POISSON = 'poisson'
+PATTERN_TRACE = 'trace'
+
+ARRIVAL_PATTERNS = [PATTERN_CONSTANT, PATTERN_RAMP, PATTERN_STEP, PATTERN_POISSON, PATTERN_TRACE]
+
+# the options every pattern needs, by their argparse destination
+REQUIRED_ARGUMENTS = {
+    PATTERN_CONSTANT: ['rate', 'duration'],
+    PATTERN_RAMP: ['rate', 'end_rate', 'duration'],
+    PATTERN_STEP: ['step_rates', 'step_duration'],
+    PATTERN_POISSON: ['rate', 'duration'],
+    PATTERN_TRACE: ['trace_file'],
+}
+
+
+def constant_arrivals(rate, duration):
+    """
+    Returns the arrival offsets in seconds of submissions that arrive every 1 / rate seconds during duration seconds.
+    """
+    num_arrivals = int(math.ceil(rate * duration))
+    return [i / rate for i in range(num_arrivals) if i / rate < duration]
+
+
+def ramp_arrivals(start_rate, end_rate, duration):
+    """
+    Returns the arrival offsets of submissions whose rate increases linearly from start_rate to end_rate.
+
+    The k-th submission arrives when the expected number of arrivals r0 * t + (r1 - r0) * t^2 / (2 * duration)
+    reaches k.
+    """
+    acceleration = (end_rate - start_rate) / duration
+
+    arrivals = []
+    k = 0
+    while True:
+        if acceleration == 0:
+            offset = k / start_rate
+        else:
+            discriminant = start_rate ** 2 + 2 * acceleration * k
+            if discriminant < 0:
+                break
+            offset = (-start_rate + math.sqrt(discriminant)) / acceleration
+
+        if offset >= duration:
+            break
+        arrivals.append(offset)
+        k += 1
+
+    return arrivals
+
+
+def step_arrivals(rates, step_duration):
+    """
+    Returns the arrival offsets of submissions with a constant rate, that changes to the next of the given rates every
+    step_duration seconds.
+    """
+    arrivals = []
+    for step, rate in enumerate(rates):
+        if rate > 0:
+            step_start = step * step_duration
+            arrivals.extend(step_start + offset for offset in constant_arrivals(rate, step_duration))
+    return arrivals
+
+
+def poisson_arrivals(rate, duration, seed=None):
+    """
+    Returns the arrival offsets of a Poisson process with the given rate during duration seconds.
+    """
+    rng = random.Random(seed)
+
+    arrivals = []
+    offset = rng.expovariate(rate)
+    while offset < duration:
+        arrivals.append(offset)
+        offset += rng.expovariate(rate)
+    return arrivals
+
+
+def read_trace(trace_path):
+    """
+    Reads a recorded arrival trace. Every non-empty line contains the arrival offset in seconds and optionally the number
+    of batches of the submission, separated by a comma. Lines starting with '#' and a non-numeric header are skipped.
+
+    :return: A list of tuples (offset, num_batches), num_batches is None if the trace does not specify it
+    """
+    arrivals = []
+    with open(trace_path, 'r') as trace_file:
+        for line in trace_file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+
+            fields = line.split(',')
+            try:
+                offset = float(fields[0])
+            except ValueError:
+                # header line
+                continue
+
+            num_batches = int(fields[1]) if len(fields) > 1 and fields[1].strip() else None
+            arrivals.append((offset, num_batches))
+
+    arrivals.sort(key=lambda arrival: arrival[0])
+    if arrivals:
+        first_offset = arrivals[0][0]
+        arrivals = [(offset - first_offset, num_batches) for offset, num_batches in arrivals]
+    return arrivals
+
+
+def get_arrivals(pattern, batches_per_submission, rate=None, duration=None, end_rate=None, step_rates=None,
+                 step_duration=None, trace_path=None, seed=None):
+    """
+    Returns the submission schedule of the given arrival pattern.
+
+    :return: A list of tuples (offset, num_batches) sorted by the offset in seconds relative to the start of the load
+    """
+    if pattern == PATTERN_CONSTANT:
+        offsets = constant_arrivals(rate, duration)
+    elif pattern == PATTERN_RAMP:
+        offsets = ramp_arrivals(rate, end_rate, duration)
+    elif pattern == PATTERN_STEP:
+        offsets = step_arrivals(step_rates, step_duration)
+    elif pattern == PATTERN_POISSON:
+        offsets = poisson_arrivals(rate, duration, seed)
+    elif pattern == PATTERN_TRACE:
+        return [
+            (offset, num_batches or batches_per_submission) for offset, num_batches in read_trace(trace_path)
+        ]
+    else:
+        raise ValueError('Unknown arrival pattern "{}"'.format(pattern))
+
+    return [(offset, batches_per_submission) for offset in offsets]
@@ -0,0 +1,439 @@
+import argparse
+import glob
+import gzip
+import hashlib
+import io
+import json
+import os
+import time
+
+from batch_cache import BatchCache
+from config import CACHE_DIRECTORY
+from instrumentation import stage, record_operation
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ARCHIVE_FORMAT = 'ccload-batch-archive'
+ARCHIVE_VERSION = 1
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+ARCHIVE_EXTENSIONS = {
+    COMPRESSION_GZIP: '.archive.gz',
+    COMPRESSION_ZSTD: '.archive.zst',
+}
+GZIP_LEVEL = 9
+ZSTD_LEVEL = 19
+# the batches of a chunk are stored column by column, a reader keeps at most one chunk in memory
+CHUNK_SIZE = 10000
+
+# the fields that differ between the batches of an experiment, all other fields are stored once per distinct value
+BATCH_FIELDS = ['_id', 'registrationTime', 'state', 'node']
+HISTORY_FIELDS = ['state', 'time', 'debugInfo', 'node']
+HISTORY_KEY = 'history'
+
+
+def get_archive_path(experiment_id, compression=COMPRESSION_GZIP, cache_directory=CACHE_DIRECTORY):
+    return os.path.join(cache_directory, experiment_id + ARCHIVE_EXTENSIONS[compression])
+
+
+def find_archive(experiment_id, cache_directory=CACHE_DIRECTORY):
+    """
+    Returns the path of the archive of the experiment, or None if it is not archived.
+    """
+    for compression in ARCHIVE_EXTENSIONS:
+        path = get_archive_path(experiment_id, compression, cache_directory)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def get_compression(path):
+    for compression, extension in ARCHIVE_EXTENSIONS.items():
+        if path.endswith(extension):
+            return compression
+    raise ValueError('Unknown archive extension of "{}", expected one of {}'.format(
+        path, ', '.join(ARCHIVE_EXTENSIONS.values())
+    ))
+
+
+def open_compressed(path, mode, compression):
+    """
+    Opens a compressed file as text stream for reading ('r') or writing ('w').
+    """
+    if compression == COMPRESSION_GZIP:
+        return gzip.open(path, mode + 't', encoding='utf-8', compresslevel=GZIP_LEVEL)
+
+    if zstandard is None:
+        raise ImportError('zstd compression requires the zstandard package, install it with pip install zstandard')
+    raw_file = open(path, mode + 'b')
+    if mode == 'w':
+        stream = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw_file, closefd=True)
+    else:
+        stream = zstandard.ZstdDecompressor().stream_reader(raw_file, closefd=True)
+    return io.TextIOWrapper(stream, encoding='utf-8')
+
+
+def get_blob(batch):
+    """
+    Returns the parts of the batch document that are not stored per batch: the order of all keys and the values of all
+    fields except BATCH_FIELDS and the history.
+    """
+    return {
+        'keys': list(batch),
+        'shared': {key: value for key, value in batch.items() if key not in BATCH_FIELDS and key != HISTORY_KEY},
+    }
+
+
+def get_blob_id(blob):
+    """
+    Returns the content address of a blob, the hash of its canonical json representation.
+    """
+    content = json.dumps(blob, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]
+
+
+def update_id_digest(id_digest, batch):
+    id_digest.update('{}\n'.format(batch.get('_id')).encode('utf-8'))
+
+
+class ArchiveWriter:
+    """
+    Writes the batch documents of an experiment into a compressed archive.
+
+    The archive is a compressed stream of json lines: a header, blobs and chunks. The fields that are the same for
+    many batches, e.g. the inputs, outputs and container settings of the template, are written once as a blob addressed
+    by the hash of its content. A chunk stores the varying fields of up to CHUNK_SIZE batches as one list per field and
+    the history entries of all its batches flattened into one list per history field, so that the compression finds
+    the repetitions within every column.
+    """
+    def __init__(self, path, experiment_id=None, num_batches=None):
+        self.path = path
+        self.compression = get_compression(path)
+        self.partial_path = path + '.partial'
+        self.archive_file = None
+        self.header = {
+            'format': ARCHIVE_FORMAT,
+            'version': ARCHIVE_VERSION,
+            'experimentId': experiment_id,
+            'batches': num_batches,
+        }
+        self.blob_ids = set()
+        # consecutive batches mostly share their blob, comparing it with the last one is cheaper than hashing it
+        self.last_blob = None
+        self.last_blob_id = None
+        self.chunk = []
+        self.num_batches = 0
+        self.id_digest = hashlib.sha1()
+
+    def __enter__(self):
+        # an existing archive is only replaced after the new one was written completely
+        self.archive_file = open_compressed(self.partial_path, 'w', self.compression)
+        self._write_record(self.header)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self._write_chunk()
+        self.archive_file.close()
+        self.archive_file = None
+        if exc_type is None:
+            os.replace(self.partial_path, self.path)
+        else:
+            os.remove(self.partial_path)
+
+    def _write_record(self, record):
+        self.archive_file.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def append(self, batch):
+        blob = get_blob(batch)
+        if blob != self.last_blob:
+            self.last_blob, self.last_blob_id = blob, get_blob_id(blob)
+            if self.last_blob_id not in self.blob_ids:
+                self.blob_ids.add(self.last_blob_id)
+                self._write_record({'blob': self.last_blob_id, 'value': blob})
+
+        self.chunk.append((self.last_blob_id, batch))
+        self.num_batches += 1
+        update_id_digest(self.id_digest, batch)
+        if len(self.chunk) == CHUNK_SIZE:
+            self._write_chunk()
+
+    def __call__(self, batch):
+        self.append(batch)
+
+    def _write_chunk(self):
+        if not self.chunk:
+            return
+
+        columns = {'blob': [blob_id for blob_id, _ in self.chunk]}
+        for field in BATCH_FIELDS:
+            columns[field] = [batch.get(field) for _, batch in self.chunk]
+
+        # -1 marks a batch without history list
+        history_lengths = []
+        history_columns = {field: [] for field in HISTORY_FIELDS}
+        # history entries that do not consist of exactly the HISTORY_FIELDS are stored as they are
+        irregular_entries = {}
+        for _, batch in self.chunk:
+            history = batch.get(HISTORY_KEY)
+            if history is None:
+                history_lengths.append(-1)
+                continue
+            history_lengths.append(len(history))
+            for history_entry in history:
+                if list(history_entry) != HISTORY_FIELDS:
+                    irregular_entries[len(history_columns['state'])] = history_entry
+                for field in HISTORY_FIELDS:
+                    history_columns[field].append(history_entry.get(field))
+
+        start_time = time.perf_counter()
+        self._write_record({
+            'chunk': len(self.chunk),
+            'columns': columns,
+            'historyLengths': history_lengths,
+            'history': history_columns,
+            'irregularHistory': irregular_entries,
+        })
+        record_operation('archive write', start_time, time.perf_counter() - start_time)
+        self.chunk = []
+
+
+class BatchArchive:
+    """
+    Reads the batch documents of an archive written by ArchiveWriter. The batches are streamed chunk by chunk, so the
+    archive of a large experiment is never read into memory completely.
+
+    Provides the same iter_batches() and len() as BatchCache, so archived experiments can be exported like cached ones.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.compression = get_compression(path)
+        with open_compressed(path, 'r', self.compression) as archive_file:
+            self.header = self._read_header(archive_file)
+        self.experiment_id = self.header['experimentId']
+
+    def _read_header(self, archive_file):
+        header = json.loads(archive_file.readline())
+        if header.get('format') != ARCHIVE_FORMAT or header.get('version') != ARCHIVE_VERSION:
+            raise ValueError('"{}" is not a batch archive of version {}'.format(self.path, ARCHIVE_VERSION))
+        return header
+
+    def __len__(self):
+        # archives written without the number of batches report 0, the number is only used for preallocation
+        return self.header['batches'] or 0
+
+    def iter_batches(self):
+        """
+        Yields the batch documents in the order they were written, with the keys in their original order.
+        """
+        blobs = {}
+        with open_compressed(self.path, 'r', self.compression) as archive_file:
+            self._read_header(archive_file)
+            for line in archive_file:
+                start_time = time.perf_counter()
+                record = json.loads(line)
+                if 'blob' in record:
+                    blobs[record['blob']] = record['value']
+                    continue
+
+                batches = list(self._decode_chunk(record, blobs))
+                record_operation('archive read', start_time, time.perf_counter() - start_time, len(line))
+                yield from batches
+
+    @staticmethod
+    def _decode_chunk(chunk, blobs):
+        columns = chunk['columns']
+        history_columns = chunk['history']
+        irregular_entries = chunk['irregularHistory']
+
+        history_offset = 0
+        for index, (blob_id, history_length) in enumerate(zip(columns['blob'], chunk['historyLengths'])):
+            history = None
+            if history_length >= 0:
+                history = []
+                for entry_index in range(history_offset, history_offset + history_length):
+                    irregular_entry = irregular_entries.get(str(entry_index))
+                    if irregular_entry is not None:
+                        history.append(irregular_entry)
+                    else:
+                        history.append({field: history_columns[field][entry_index] for field in HISTORY_FIELDS})
+                history_offset += history_length
+
+            blob = blobs[blob_id]
+            shared = blob['shared']
+            batch = {}
+            for key in blob['keys']:
+                if key == HISTORY_KEY:
+                    batch[key] = history
+                elif key in BATCH_FIELDS:
+                    batch[key] = columns[key][index]
+                else:
+                    batch[key] = shared[key]
+            yield batch
+
+
+def verify_archive(path, num_batches, id_digest):
+    """
+    Reads the archive back and checks that it contains the given number of batches with the same ids in the same
+    order as they were written.
+
+    :param id_digest: The digest of the batch ids of the ArchiveWriter that wrote the archive
+    :raise ValueError: If the archive differs
+    """
+    archive = BatchArchive(path)
+    read_digest = hashlib.sha1()
+    num_read = 0
+    for batch in archive.iter_batches():
+        update_id_digest(read_digest, batch)
+        num_read += 1
+
+    if num_read != num_batches:
+        raise ValueError('The archive "{}" contains {} of {} batches'.format(path, num_read, num_batches))
+    if read_digest.digest() != id_digest.digest():
+        raise ValueError('The batch ids of the archive "{}" differ from the cached batches'.format(path))
+
+
+def pack_experiment(cache, compression=COMPRESSION_GZIP, cache_directory=CACHE_DIRECTORY):
+    """
+    Writes the latest document of every batch in the BatchCache into an archive and verifies it by reading it back.
+
+    :return: The path of the archive
+    :raise ValueError: If the archive does not contain every cached batch
+    """
+    path = get_archive_path(cache.experiment_id, compression, cache_directory)
+
+    with stage('pack', experiment_id=cache.experiment_id, batches=len(cache)):
+        with ArchiveWriter(path, cache.experiment_id, len(cache)) as writer:
+            for batch in cache.iter_batches():
+                writer.append(batch)
+
+    with stage('verify archive', experiment_id=cache.experiment_id, batches=writer.num_batches):
+        verify_archive(path, len(cache), writer.id_digest)
+    return path
+
+
+def get_cache_path(experiment_id, cache_directory=CACHE_DIRECTORY):
+    return os.path.join(cache_directory, '{}.jsonl'.format(experiment_id))
+
+
+def unpack_experiment(experiment_id, cache_directory=CACHE_DIRECTORY):
+    """
+    Restores the batch cache cache/<experiment_id>.jsonl from the archive of the experiment. An existing batch cache
+    is never overwritten, as it may contain batches fetched after the archive was written.
+
+    :return: The path of the batch cache
+    :raise FileExistsError: If the batch cache of the experiment exists
+    """
+    cache_path = get_cache_path(experiment_id, cache_directory)
+    if os.path.exists(cache_path):
+        raise FileExistsError('The batch cache "{}" already exists'.format(cache_path))
+
+    archive = BatchArchive(find_archive(experiment_id, cache_directory))
+    partial_path = cache_path + '.partial'
+
+    with stage('unpack', experiment_id=experiment_id, batches=len(archive)):
+        with open(partial_path, 'w') as cache_file:
+            for batch in archive.iter_batches():
+                cache_file.write(json.dumps(batch) + '\n')
+        os.replace(partial_path, cache_path)
+    return cache_path
+
+
+def get_cache_files(experiment_id, cache_directory=CACHE_DIRECTORY):
+    """
+    Returns the existing files of the experiment that are replaced by its archive: the batch cache, the legacy batch
+    list and the detailed result written by earlier versions, which is derived from the batches.
+    """
+    paths = [
+        get_cache_path(experiment_id, cache_directory),
+        os.path.join(cache_directory, '{}.json'.format(experiment_id)),
+        os.path.join(cache_directory, 'result_{}.json'.format(experiment_id)),
+    ]
+    return [path for path in paths if os.path.isfile(path)]
+
+
+def get_cached_experiment_ids(cache_directory=CACHE_DIRECTORY):
+    experiment_ids = set()
+    paths = glob.glob(os.path.join(cache_directory, '*.json')) + glob.glob(os.path.join(cache_directory, '*.jsonl'))
+    for path in paths:
+        name = os.path.basename(path)
+        if not name.startswith('result_'):
+            experiment_ids.add(name.split('.')[0])
+    return sorted(experiment_ids)
+
+
+def get_archived_experiment_ids(cache_directory=CACHE_DIRECTORY):
+    experiment_ids = set()
+    for extension in ARCHIVE_EXTENSIONS.values():
+        for path in glob.glob(os.path.join(cache_directory, '*' + extension)):
+            experiment_ids.add(os.path.basename(path)[:-len(extension)])
+    return sorted(experiment_ids)
+
+
+def get_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Converts the batch caches of experiments into compressed archives and back.'
+    )
+
+    parser.add_argument('direction', choices=['pack', 'unpack'], help='Archive the caches or restore them')
+    parser.add_argument(
+        'experiment_ids', nargs='*',
+        help='The experiments to convert, all cached experiments (pack) or all archived experiments (unpack) by default'
+    )
+    parser.add_argument(
+        '--compression', choices=list(ARCHIVE_EXTENSIONS), default=COMPRESSION_GZIP,
+        help='The compression of new archives, zstd requires the zstandard package. Default: gzip'
+    )
+    parser.add_argument(
+        '--remove', action='store_true',
+        help='Remove the cache files after the archive was written and checked, or the archive after unpacking'
+    )
+
+    return parser.parse_args(argv)
+
+
+def format_size(paths):
+    return '{:.1f} MiB'.format(sum(os.path.getsize(path) for path in paths) / 2 ** 20)
+
+
+def main(argv=None):
+    args = get_arguments(argv)
+
+    if args.direction == 'pack':
+        for experiment_id in args.experiment_ids or get_cached_experiment_ids():
+            cache_files = get_cache_files(experiment_id)
+            if not cache_files:
+                print('{} is not cached'.format(experiment_id), flush=True)
+                continue
+            cache_size = format_size(cache_files)
+            cache = BatchCache(experiment_id)
+            if len(cache) == 0:
+                print('{} contains no cached batches'.format(experiment_id), flush=True)
+                continue
+            archive_path = pack_experiment(cache, args.compression)
+            print('{}: {} -> {} ({})'.format(experiment_id, cache_size, format_size([archive_path]), archive_path))
+            if args.remove:
+                for path in get_cache_files(experiment_id):
+                    os.remove(path)
+    else:
+        for experiment_id in args.experiment_ids or get_archived_experiment_ids():
+            archive_path = find_archive(experiment_id)
+            if archive_path is None:
+                print('{} is not archived'.format(experiment_id), flush=True)
+                continue
+            if os.path.exists(get_cache_path(experiment_id)):
+                print('{} is already cached in {}, remove it to unpack the archive'.format(
+                    experiment_id, get_cache_path(experiment_id)
+                ), flush=True)
+                continue
+            cache_path = unpack_experiment(experiment_id)
+            print('{}: {} -> {}'.format(experiment_id, archive_path, cache_path))
+            if args.remove:
+                os.remove(archive_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import json
+import os
+import time
+from threading import Lock
+
+from config import CACHE_DIRECTORY, FINISHED_STATES
+from instrumentation import is_enabled, stage, record_operation
+
+
+class BatchCache:
+    """
+    Append-only cache of the batch documents of one experiment.
+
+    Every batch document is stored as one line in cache/<experiment_id>.jsonl. A batch that is fetched again is appended
+    again and the latest line wins. Lines are flushed as soon as they are written, so an interrupted fetch keeps every
+    batch that arrived before the interruption.
+    """
+    def __init__(self, experiment_id, cache_directory=CACHE_DIRECTORY):
+        self.experiment_id = experiment_id
+        self.path = os.path.join(cache_directory, '{}.jsonl'.format(experiment_id))
+        self.legacy_path = os.path.join(cache_directory, '{}.json'.format(experiment_id))
+        self.lock = Lock()
+        self.cache_file = None
+
+        if not os.path.isdir(cache_directory):
+            os.mkdir(cache_directory)
+
+        if not os.path.isfile(self.path) and os.path.isfile(self.legacy_path):
+            self._convert_legacy_cache()
+
+        # maps the _id of every cached batch to the offset and state of its latest line
+        with stage('read cache index', experiment_id=experiment_id):
+            self.index, self.valid_size = self._read_index()
+
+    def _convert_legacy_cache(self):
+        print('converting {} to {}'.format(self.legacy_path, self.path), flush=True)
+        with open(self.legacy_path, 'r') as legacy_file:
+            batch_list = json.load(legacy_file)
+
+        partial_path = self.path + '.partial'
+        with open(partial_path, 'w') as cache_file:
+            for batch in batch_list:
+                cache_file.write(json.dumps(batch) + '\n')
+        os.replace(partial_path, self.path)
+
+    def _read_index(self):
+        index = {}
+        offset = 0
+        if os.path.isfile(self.path):
+            with open(self.path, 'rb') as cache_file:
+                for line in cache_file:
+                    # a line without newline was interrupted while being written and is discarded
+                    if not line.endswith(b'\n'):
+                        break
+                    batch = json.loads(line)
+                    index[batch['_id']] = (offset, batch['state'])
+                    offset += len(line)
+        return index, offset
+
+    def __len__(self):
+        return len(self.index)
+
+    def is_complete(self, batches):
+        return len(self.get_missing_batches(batches)) == 0
+
+    def get_missing_batches(self, batches):
+        """
+        Returns the batches that are not cached yet or whose cached document is not in a finished state.
+
+        :param batches: The batch list of the experiment as returned by get_batches()
+        """
+        missing_batches = []
+        for batch in batches:
+            cached = self.index.get(batch['_id'])
+            if cached is None or cached[1] not in FINISHED_STATES:
+                missing_batches.append(batch)
+        return missing_batches
+
+    def __enter__(self):
+        self.cache_file = open(self.path, 'ab')
+        # drop a line that was interrupted while being written
+        self.cache_file.truncate(self.valid_size)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.cache_file.close()
+        self.cache_file = None
+
+    def append(self, batch):
+        start_time = time.perf_counter()
+        line = (json.dumps(batch) + '\n').encode('utf-8')
+        with self.lock:
+            self.cache_file.write(line)
+            self.cache_file.flush()
+            self.index[batch['_id']] = (self.valid_size, batch['state'])
+            self.valid_size += len(line)
+        record_operation('cache write', start_time, time.perf_counter() - start_time, len(line))
+
+    def __call__(self, batch):
+        self.append(batch)
+
+    def iter_batches(self):
+        """
+        Yields the latest cached document of every batch, one at a time, in the order they were written.
+        """
+        if not os.path.isfile(self.path):
+            return
+
+        latest_offsets = set(offset for offset, _ in self.index.values())
+        # timing every line costs more than parsing small batches, so it is only done if it is recorded
+        timed = is_enabled()
+        offset = 0
+        with open(self.path, 'rb') as cache_file:
+            for line in cache_file:
+                if offset >= self.valid_size:
+                    break
+                if offset in latest_offsets:
+                    if timed:
+                        start_time = time.perf_counter()
+                        batch = json.loads(line)
+                        record_operation('cache read', start_time, time.perf_counter() - start_time, len(line))
+                    else:
+                        batch = json.loads(line)
+                    yield batch
+                offset += len(line)
@@ -0,0 +1,177 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+
+from config import RESULTS_PATH, RESULT_CSV_PATH, RESULT_STORE_PATH, TIME_REGISTERED_LABEL
+from interval_index import STATE_LABELS, BatchIntervals
+from result_store import read_results
+from state_occupancy import get_exit_times
+
+GANTT_PATH = os.path.join(RESULTS_PATH, 'gantt.png')
+# more rows than the figure has pixels in height are not visible anyway
+DEFAULT_MAX_ROWS = 2000
+NUM_PRINTED_BATCHES = 10
+STATE_LABEL = 'state'
+STATE_COLORS = {
+    'registered': 'tab:gray',
+    'scheduled': 'tab:orange',
+    'processing': 'tab:green',
+}
+
+
+def query_positions(intervals, states, at=None, between=None, entered=False):
+    """
+    Returns the positions of the batches matching the query in every state.
+
+    :param intervals: The BatchIntervals of the results
+    :param states: The states to query
+    :param at: Return the batches that were in the state at this time
+    :param between: A tuple (start, end). Return the batches that were in the state at any time in this range or, if
+                    entered is True, entered the state in this range.
+    :return: A dictionary mapping every state to the positions of the matching batches
+    """
+    if at is not None:
+        start, end = at, at
+    else:
+        start, end = between
+
+    if entered:
+        return {state: intervals.entered(state, start, end) for state in states}
+    return {state: intervals.overlapping(state, start, end) for state in states}
+
+
+def get_matching_batches(data_frame, positions):
+    """
+    Returns the rows of the matching batches of every state, with the state in an additional column.
+
+    :param positions: A dictionary mapping states to positions as returned by query_positions()
+    :rtype: pd.DataFrame
+    """
+    return pd.concat([
+        data_frame.iloc[state_positions].assign(**{STATE_LABEL: state})
+        for state, state_positions in positions.items()
+    ])
+
+
+def select_gantt_rows(data_frame, positions=None, max_rows=DEFAULT_MAX_ROWS):
+    """
+    Returns at most max_rows positions of batches, ordered by their registration and evenly spaced over all given
+    batches, so that the gantt chart of a large run shows the same shape as the one of all batches.
+    """
+    if positions is None:
+        positions = np.arange(len(data_frame))
+    positions = np.unique(positions)
+
+    registered = data_frame[TIME_REGISTERED_LABEL].values[positions]
+    positions = positions[np.argsort(registered, kind='stable')]
+    if len(positions) > max_rows:
+        positions = positions[np.linspace(0, len(positions) - 1, max_rows).astype(np.int64)]
+    return positions
+
+
+def plot_gantt(data_frame, positions, states, path=GANTT_PATH, window=None):
+    """
+    Draws one row per batch with a horizontal line for every state from its entry to its exit time.
+
+    :param positions: The rows of the data frame to draw, from the top to the bottom
+    :param window: An optional tuple (start, end) of the queried time range, which is highlighted
+    """
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots(1, 1)
+
+    rows = np.arange(len(positions))
+    selected = data_frame.iloc[positions]
+    # thinner lines for more rows, so that neighbouring batches stay distinguishable
+    linewidth = max(0.2, min(4.0, 400 / max(len(positions), 1)))
+    for state in states:
+        state_label = STATE_LABELS[state]
+        entry_times = selected[state_label].values
+        exit_times = get_exit_times(selected, state_label)
+        valid = ~np.isnan(entry_times) & ~np.isnan(exit_times)
+        ax.hlines(
+            rows[valid], entry_times[valid], exit_times[valid], colors=STATE_COLORS[state], linewidth=linewidth,
+            label=state
+        )
+
+    if window is not None:
+        if window[0] == window[1]:
+            ax.axvline(window[0], color='tab:red', linewidth=1)
+        else:
+            ax.axvspan(window[0], window[1], color='tab:red', alpha=0.15)
+
+    ax.invert_yaxis()
+    ax.set_xlabel('time in seconds')
+    ax.set_ylabel('batches ordered by registration')
+    ax.legend(loc='upper right')
+    fig.savefig(path, bbox_inches='tight', dpi=150)
+
+
+def get_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Queries which batches were in a state at a point in time or within a time range and draws a gantt '
+                    'chart of the batches. Times are given in seconds since the start of the experiment.'
+    )
+
+    parser.add_argument(
+        '--state', action='append', choices=list(STATE_LABELS), default=None,
+        help='The state to query, can be given multiple times. All states by default.'
+    )
+    query_group = parser.add_mutually_exclusive_group()
+    query_group.add_argument('--at', type=float, default=None, help='Query the batches in the state at this time')
+    query_group.add_argument(
+        '--between', type=float, nargs=2, metavar=('START', 'END'), default=None,
+        help='Query the batches in the state at any time within this range'
+    )
+    parser.add_argument(
+        '--entered', action='store_true',
+        help='With --between only query the batches that entered the state within the range'
+    )
+    parser.add_argument('--output', default=None, help='Write the matching batches to this csv file')
+    parser.add_argument(
+        '--gantt', nargs='?', const=GANTT_PATH, default=None,
+        help='Draw a gantt chart of the matching batches (or all batches without query) to this file, {} by default. '
+             'The format is given by the extension, e.g. png or pdf.'.format(GANTT_PATH)
+    )
+    parser.add_argument(
+        '--max-rows', type=int, default=DEFAULT_MAX_ROWS,
+        help='The maximal number of batches in the gantt chart, larger selections are sampled evenly'
+    )
+
+    args = parser.parse_args(argv)
+    if args.entered and args.between is None:
+        parser.error('--entered requires --between')
+    if args.at is None and args.between is None and args.gantt is None:
+        parser.error('one of --at, --between or --gantt is required')
+    return args
+
+
+def main(argv=None):
+    args = get_arguments(argv)
+    states = args.state or list(STATE_LABELS)
+
+    data_frame = read_results(RESULT_STORE_PATH, RESULT_CSV_PATH)
+
+    window = None
+    positions = None
+    if args.at is not None or args.between is not None:
+        intervals = BatchIntervals(data_frame, states)
+        state_positions = query_positions(intervals, states, args.at, args.between, args.entered)
+        matches = get_matching_batches(data_frame, state_positions)
+        window = (args.at, args.at) if args.at is not None else tuple(args.between)
+        positions = np.concatenate(list(state_positions.values()))
+
+        print(matches[STATE_LABEL].value_counts().reindex(states, fill_value=0).to_string())
+        with pd.option_context('display.width', 200, 'display.max_columns', None):
+            print(matches.head(NUM_PRINTED_BATCHES))
+        if args.output:
+            matches.to_csv(args.output)
+
+    if args.gantt:
+        plot_gantt(data_frame, select_gantt_rows(data_frame, positions, args.max_rows), states, args.gantt, window)
+
+
+if __name__ == '__main__':
+    main()
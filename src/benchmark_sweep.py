@@ -0,0 +1,448 @@
+import argparse
+import copy
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+from config import TEMPLATE_PATH, EXECUTED_EXPERIMENTS_DIR, SUBMIT_MODE_FAICE, SUBMIT_MODE_DIRECT, \
+    TERMINAL_STATE_LABEL, AuthenticationInfo
+from create_csv import DEFAULT_FETCH_CONCURRENCY, fetch_experiments, create_results
+from execute_experiment import AgencySubmitter, TimedSubmission, execute_experiment, get_run_info, run_while_working, \
+    set_authentication_info, load_yaml
+from latency_stats import ALL_EXPERIMENTS, QUEUEING_PHASE, CONTAINER_START_PHASE, RUN_PHASE, compute_latency_stats, \
+    compute_throughput_stats, compute_failure_stats
+from mock_agency import DEFAULT_NUM_NODES, DEFAULT_SLOTS_PER_NODE, DEFAULT_SCHEDULING_DELAY, DEFAULT_START_LATENCY, \
+    DEFAULT_PROCESSING_TIME, DEFAULT_JITTER, DEFAULT_FAILURE_RATE, MOCK_USERNAME, AgencyClock, MockAgency, \
+    SchedulerModel, start_mock_agency
+
+BENCHMARK_DIR = 'benchmarks'
+POINTS_DIR = 'points'
+SUMMARY_JSON_FILENAME = 'summary.json'
+POINTS_CSV_FILENAME = 'points.csv'
+PLOT_FILENAME = 'benchmark.pdf'
+
+DEFAULT_SWEEP_NUM_BATCHES = [100, 300, 1000, 3000]
+
+NUM_BATCHES_LABEL = 'num_batches'
+CONCURRENCY_LIMIT_LABEL = 'concurrency_limit'
+REPETITION_LABEL = 'repetition'
+THROUGHPUT_LABEL = 'throughput'
+PEAK_THROUGHPUT_LABEL = 'peak_throughput'
+MAKESPAN_LABEL = 'makespan'
+QUEUEING_P50_LABEL = '{}_p50'.format(QUEUEING_PHASE)
+QUEUEING_P99_LABEL = '{}_p99'.format(QUEUEING_PHASE)
+FAILURE_RATE_LABEL = 'failure_rate'
+SKEWED_NODES_LABEL = 'skewed_nodes'
+
+# the half saturation load of the throughput curve is searched between these multiples of the smallest and largest load
+HALF_SATURATION_SEARCH_RANGE = (1e-2, 1e2)
+NUM_HALF_SATURATION_CANDIDATES = 2001
+# the knee is the smallest load reaching this fraction of the maximal throughput
+KNEE_THROUGHPUT_FRACTION = 0.9
+
+
+@contextmanager
+def working_directory(path):
+    """
+    Executes the pipeline inside path, which holds the executed experiments, cache and results of one sweep point like
+    the working directory of a manual run.
+    """
+    previous_path = os.getcwd()
+    os.makedirs(path, exist_ok=True)
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous_path)
+
+
+def with_concurrency_limit(template_data, concurrency_limit):
+    """
+    Returns a copy of the template RED data with the given batchConcurrencyLimit.
+    """
+    point_template_data = copy.deepcopy(template_data)
+    point_template_data['execution']['settings']['batchConcurrencyLimit'] = concurrency_limit
+    return point_template_data
+
+
+class MockAgencyFactory:
+    """
+    Starts a new mock agency with a fresh cluster for every sweep point, so that the points do not influence each other.
+    Every agency uses the same seed, so the sweep is reproducible.
+    """
+    def __init__(self, num_nodes, slots_per_node, scheduling_delay, start_latency, processing_time, jitter,
+                 failure_rate, time_scale, seed):
+        self.scheduler_args = (
+            num_nodes, slots_per_node, scheduling_delay, start_latency, processing_time, jitter, failure_rate, seed
+        )
+        self.time_scale = time_scale
+
+    @contextmanager
+    def __call__(self):
+        clock = AgencyClock(self.time_scale or 1.0, instant=not self.time_scale)
+        server, url = start_mock_agency(MockAgency(SchedulerModel(*self.scheduler_args), clock))
+        try:
+            yield AuthenticationInfo(url, MOCK_USERNAME, MOCK_USERNAME)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class StaticAgency:
+    """
+    Runs every sweep point on the same agency.
+    """
+    def __init__(self, agency_auth_info):
+        self.agency_auth_info = agency_auth_info
+
+    @contextmanager
+    def __call__(self):
+        yield self.agency_auth_info
+
+
+def compute_point_metrics(data_frame):
+    """
+    Reduces the results of one sweep point to its throughput, latency and failure metrics.
+    """
+    throughput_stats = compute_throughput_stats(data_frame).loc[ALL_EXPERIMENTS]
+    latency_stats = compute_latency_stats(data_frame).loc[ALL_EXPERIMENTS]
+
+    metrics = {
+        'succeeded': int(throughput_stats['batches']),
+        MAKESPAN_LABEL: throughput_stats['duration'],
+        THROUGHPUT_LABEL: throughput_stats['sustained_batches_per_second'],
+        PEAK_THROUGHPUT_LABEL: throughput_stats['peak_batches_per_second'],
+    }
+    for phase in [QUEUEING_PHASE, CONTAINER_START_PHASE, RUN_PHASE]:
+        metrics['{}_p50'.format(phase)] = latency_stats.loc[phase, 'p50']
+        metrics['{}_p99'.format(phase)] = latency_stats.loc[phase, 'p99']
+
+    if TERMINAL_STATE_LABEL in data_frame.columns:
+        metrics[FAILURE_RATE_LABEL] = compute_failure_stats(data_frame).loc[ALL_EXPERIMENTS, 'failure_rate']
+
+    return metrics
+
+
+def run_point(agency_auth_info, template_data, num_batches, submit_mode, fetch_concurrency, label=None):
+    """
+    Executes one experiment, waits until it is finished and creates its results with the create_csv pipeline in the
+    current working directory.
+
+    :return: The metrics of the point as returned by compute_point_metrics()
+    """
+    if not os.path.isdir(EXECUTED_EXPERIMENTS_DIR):
+        os.mkdir(EXECUTED_EXPERIMENTS_DIR)
+
+    set_authentication_info(template_data, agency_auth_info)
+
+    if submit_mode == SUBMIT_MODE_DIRECT:
+        submit_experiment = AgencySubmitter(agency_auth_info)
+    else:
+        submit_experiment = execute_experiment
+
+    run_info = get_run_info(agency_auth_info, template_data, label, submit_mode)
+    experiment_id = TimedSubmission(submit_experiment, template_data, run_info=run_info)(num_batches)
+
+    run_while_working(agency_auth_info.hostname, experiment_id, agency_auth_info.username, agency_auth_info.password)
+
+    fetched_experiments = fetch_experiments(
+        agency_auth_info.hostname, [experiment_id], agency_auth_info.username, agency_auth_info.password,
+        fetch_concurrency
+    )
+    data_frame, quality_report = create_results(fetched_experiments)
+
+    metrics = compute_point_metrics(data_frame)
+    metrics[SKEWED_NODES_LABEL] = len(quality_report.get('skewed_nodes', []))
+    return metrics
+
+
+def run_sweep(agency, template_data, sweep_num_batches, concurrency_limits, repetitions, output_dir,
+              submit_mode=SUBMIT_MODE_DIRECT, fetch_concurrency=DEFAULT_FETCH_CONCURRENCY, label=None):
+    """
+    Runs one experiment for every combination of number of batches, concurrency limit and repetition.
+
+    :param agency: A callable returning a context manager, that yields the AuthenticationInfo of the agency to use for
+                   one point
+    :return: A data frame with one row of metrics per point
+    :rtype: pd.DataFrame
+    """
+    rows = []
+    for concurrency_limit in concurrency_limits:
+        point_template_data = with_concurrency_limit(template_data, concurrency_limit)
+        for num_batches in sweep_num_batches:
+            for repetition in range(repetitions):
+                point_name = 'n{}_limit{}_rep{}'.format(num_batches, concurrency_limit, repetition)
+                print('running {}'.format(point_name), flush=True)
+
+                with agency() as agency_auth_info, working_directory(os.path.join(output_dir, POINTS_DIR, point_name)):
+                    metrics = run_point(
+                        agency_auth_info, point_template_data, num_batches, submit_mode, fetch_concurrency, label
+                    )
+
+                row = {NUM_BATCHES_LABEL: num_batches, CONCURRENCY_LIMIT_LABEL: concurrency_limit,
+                       REPETITION_LABEL: repetition}
+                row.update(metrics)
+                rows.append(row)
+
+    return pd.DataFrame(rows)
+
+
+def fit_saturation_curve(loads, throughputs):
+    """
+    Fits the saturation curve throughput(n) = max_throughput * n / (n + half_saturation_load) to the measured points.
+
+    For every candidate half saturation load the best max_throughput is a linear least squares problem, so all
+    candidates are evaluated at once and the one with the smallest squared error is chosen.
+
+    :return: A dictionary containing 'max_throughput', 'half_saturation_load' and the coefficient of determination 'r2'
+    """
+    loads = np.asarray(loads, dtype=float)
+    throughputs = np.asarray(throughputs, dtype=float)
+
+    candidates = np.geomspace(
+        loads.min() * HALF_SATURATION_SEARCH_RANGE[0], loads.max() * HALF_SATURATION_SEARCH_RANGE[1],
+        NUM_HALF_SATURATION_CANDIDATES
+    )
+    shapes = loads[np.newaxis, :] / (loads[np.newaxis, :] + candidates[:, np.newaxis])
+    max_throughputs = (shapes @ throughputs) / np.sum(shapes * shapes, axis=1)
+    squared_errors = np.sum((max_throughputs[:, np.newaxis] * shapes - throughputs) ** 2, axis=1)
+
+    best = int(np.argmin(squared_errors))
+    total_squares = np.sum((throughputs - throughputs.mean()) ** 2)
+    return {
+        'max_throughput': float(max_throughputs[best]),
+        'half_saturation_load': float(candidates[best]),
+        'r2': float(1 - squared_errors[best] / total_squares) if total_squares > 0 else 1.0,
+    }
+
+
+def find_knee(loads, throughputs, fraction=KNEE_THROUGHPUT_FRACTION):
+    """
+    Returns the smallest load at which the throughput reaches fraction of the maximal measured throughput, i.e. the
+    point where adding more batches stops increasing the throughput and only increases the queueing delay.
+    """
+    loads = np.asarray(loads, dtype=float)
+    throughputs = np.asarray(throughputs, dtype=float)
+    if len(loads) == 0:
+        return None
+
+    saturated = throughputs >= fraction * np.nanmax(throughputs)
+    return float(loads[np.argmax(saturated)])
+
+
+def fit_queueing_growth(loads, queueing_delays):
+    """
+    Fits how the queueing delay grows with the load.
+
+    :return: A dictionary containing the exponent of a power law fit 'exponent' (1 means linear growth) and the slope
+             of a linear fit 'seconds_per_batch'
+    """
+    loads = np.asarray(loads, dtype=float)
+    queueing_delays = np.asarray(queueing_delays, dtype=float)
+
+    growth = {'exponent': None, 'seconds_per_batch': None}
+    if len(loads) < 2:
+        return growth
+
+    growth['seconds_per_batch'] = float(np.polyfit(loads, queueing_delays, 1)[0])
+    positive = queueing_delays > 0
+    if np.count_nonzero(positive) >= 2:
+        growth['exponent'] = float(np.polyfit(np.log(loads[positive]), np.log(queueing_delays[positive]), 1)[0])
+    return growth
+
+
+def analyse_sweep(points_df):
+    """
+    Fits the scaling curves of every concurrency limit over the number of batches. Repetitions are averaged first.
+
+    :return: A dictionary mapping every concurrency limit to its fitted curves
+    """
+    curves = {}
+    mean_points = points_df.groupby([CONCURRENCY_LIMIT_LABEL, NUM_BATCHES_LABEL], sort=True).mean(numeric_only=True)
+    for concurrency_limit, limit_points in mean_points.groupby(level=CONCURRENCY_LIMIT_LABEL):
+        loads = limit_points.index.get_level_values(NUM_BATCHES_LABEL).values
+        throughputs = limit_points[THROUGHPUT_LABEL].values
+
+        curves[str(concurrency_limit)] = {
+            'throughput': fit_saturation_curve(loads, throughputs),
+            'knee_num_batches': find_knee(loads, throughputs),
+            'queueing_p50_growth': fit_queueing_growth(loads, limit_points[QUEUEING_P50_LABEL].values),
+            'queueing_p99_growth': fit_queueing_growth(loads, limit_points[QUEUEING_P99_LABEL].values),
+        }
+    return curves
+
+
+def plot_sweep(points_df, curves, plot_path):
+    fig, (throughput_ax, queueing_ax) = plt.subplots(2, 1, sharex=True, figsize=(6.4, 7.2))
+
+    for concurrency_limit, limit_points in points_df.groupby(CONCURRENCY_LIMIT_LABEL, sort=True):
+        curve = curves[str(concurrency_limit)]
+        label = 'limit {}'.format(concurrency_limit)
+
+        line, = throughput_ax.plot(
+            limit_points[NUM_BATCHES_LABEL], limit_points[THROUGHPUT_LABEL], marker='o', linestyle='', label=label
+        )
+        loads = np.geomspace(limit_points[NUM_BATCHES_LABEL].min(), limit_points[NUM_BATCHES_LABEL].max(), 100)
+        fit = curve['throughput']
+        throughput_ax.plot(
+            loads, fit['max_throughput'] * loads / (loads + fit['half_saturation_load']), color=line.get_color()
+        )
+        if curve['knee_num_batches'] is not None:
+            throughput_ax.axvline(curve['knee_num_batches'], color=line.get_color(), linestyle=':', linewidth=1)
+
+        queueing_ax.plot(
+            limit_points[NUM_BATCHES_LABEL], limit_points[QUEUEING_P50_LABEL], marker='o', color=line.get_color(),
+            label='{} p50'.format(label)
+        )
+        queueing_ax.plot(
+            limit_points[NUM_BATCHES_LABEL], limit_points[QUEUEING_P99_LABEL], marker='^', linestyle='--',
+            color=line.get_color(), label='{} p99'.format(label)
+        )
+
+    throughput_ax.set_xscale('log')
+    throughput_ax.set_ylabel('succeeded batches per second')
+    throughput_ax.legend(fontsize='small')
+    queueing_ax.set_yscale('log')
+    queueing_ax.set_xlabel('number of batches')
+    queueing_ax.set_ylabel('queueing delay in seconds')
+    queueing_ax.legend(fontsize='small')
+
+    fig.savefig(plot_path, bbox_inches='tight')
+
+
+def write_report(points_df, curves, config, output_dir):
+    points_df.to_csv(os.path.join(output_dir, POINTS_CSV_FILENAME), index=False)
+
+    report = {
+        'config': config,
+        'curves': curves,
+        'points': json.loads(points_df.to_json(orient='records')),
+    }
+    with open(os.path.join(output_dir, SUMMARY_JSON_FILENAME), 'w') as summary_file:
+        json.dump(report, summary_file, indent=2)
+
+    plot_sweep(points_df, curves, os.path.join(output_dir, PLOT_FILENAME))
+
+
+def get_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Executes experiments for every combination of number of batches and concurrency limit and fits '
+                    'scaling curves to the results.'
+    )
+
+    int_list = lambda v: [int(n) for n in v.split(',')]  # noqa: E731
+    parser.add_argument(
+        '--num-batches', type=int_list, default=DEFAULT_SWEEP_NUM_BATCHES,
+        help='Comma separated numbers of batches (default {})'.format(','.join(map(str, DEFAULT_SWEEP_NUM_BATCHES)))
+    )
+    parser.add_argument(
+        '--concurrency-limits', type=int_list, default=None,
+        help='Comma separated batchConcurrencyLimit values, the limit of the template by default'
+    )
+    parser.add_argument('--repetitions', type=int, default=1, help='The number of experiments per point')
+    parser.add_argument(
+        '--output-dir', default=None, help='The directory of the sweep, benchmarks/<start time> by default'
+    )
+    parser.add_argument(
+        '--submit-mode', choices=[SUBMIT_MODE_FAICE, SUBMIT_MODE_DIRECT], default=SUBMIT_MODE_DIRECT,
+        help='Submit experiments with "faice exec" or post them directly to the agency'
+    )
+    parser.add_argument(
+        '--fetch-concurrency', type=int, default=DEFAULT_FETCH_CONCURRENCY,
+        help='The number of batches that are fetched concurrently'
+    )
+    parser.add_argument('--label', default=None, help='A name for this sweep')
+
+    mock_group = parser.add_argument_group(
+        'mock agency', 'Run every point against a fresh local mock agency instead of a real agency installation.'
+    )
+    mock_group.add_argument('--mock', action='store_true', help='Use a local mock agency')
+    mock_group.add_argument('--mock-nodes', type=int, default=DEFAULT_NUM_NODES, help='The number of cluster nodes')
+    mock_group.add_argument(
+        '--mock-slots-per-node', type=int, default=DEFAULT_SLOTS_PER_NODE, help='The number of containers per node'
+    )
+    mock_group.add_argument(
+        '--mock-scheduling-delay', type=float, default=DEFAULT_SCHEDULING_DELAY,
+        help='Seconds the scheduler needs per batch'
+    )
+    mock_group.add_argument(
+        '--mock-start-latency', type=float, default=DEFAULT_START_LATENCY, help='Median container start latency'
+    )
+    mock_group.add_argument(
+        '--mock-processing-time', type=float, default=DEFAULT_PROCESSING_TIME, help='Median processing time'
+    )
+    mock_group.add_argument(
+        '--mock-jitter', type=float, default=DEFAULT_JITTER, help='Shape of the log-normal latency distributions'
+    )
+    mock_group.add_argument(
+        '--mock-failure-rate', type=float, default=DEFAULT_FAILURE_RATE, help='Fraction of batches that fail'
+    )
+    mock_group.add_argument(
+        '--mock-time-scale', type=float, default=0,
+        help='How many times faster than real time the mock agency runs, 0 finishes every batch immediately'
+    )
+    mock_group.add_argument('--seed', type=int, default=0, help='Random seed of the mock scheduler')
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = get_arguments(argv)
+
+    with open(TEMPLATE_PATH, 'r') as experiment_template:
+        template_data = load_yaml(experiment_template)
+
+    concurrency_limits = args.concurrency_limits or [template_data['execution']['settings']['batchConcurrencyLimit']]
+    output_dir = os.path.abspath(
+        args.output_dir or os.path.join(BENCHMARK_DIR, time.strftime('%Y%m%d-%H%M%S'))
+    )
+    os.makedirs(output_dir, exist_ok=True)
+
+    config = {
+        'label': args.label,
+        'numBatches': args.num_batches,
+        'concurrencyLimits': concurrency_limits,
+        'repetitions': args.repetitions,
+        'submitMode': args.submit_mode,
+        'mock': args.mock,
+    }
+
+    if args.mock:
+        agency = MockAgencyFactory(
+            args.mock_nodes, args.mock_slots_per_node, args.mock_scheduling_delay, args.mock_start_latency,
+            args.mock_processing_time, args.mock_jitter, args.mock_failure_rate, args.mock_time_scale, args.seed
+        )
+        config['mockAgency'] = {
+            'nodes': args.mock_nodes,
+            'slotsPerNode': args.mock_slots_per_node,
+            'schedulingDelay': args.mock_scheduling_delay,
+            'startLatency': args.mock_start_latency,
+            'processingTime': args.mock_processing_time,
+            'jitter': args.mock_jitter,
+            'failureRate': args.mock_failure_rate,
+            'timeScale': args.mock_time_scale,
+            'seed': args.seed,
+        }
+    else:
+        agency = StaticAgency(AuthenticationInfo.agency_from_user_input())
+
+    points_df = run_sweep(
+        agency, template_data, args.num_batches, concurrency_limits, args.repetitions, output_dir, args.submit_mode,
+        args.fetch_concurrency, args.label
+    )
+    curves = analyse_sweep(points_df)
+    write_report(points_df, curves, config, output_dir)
+
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(points_df.round(3))
+    print(json.dumps(curves, indent=2))
+    print('benchmark report written to {}'.format(output_dir))
+
+
+if __name__ == '__main__':
+    main()
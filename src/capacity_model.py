@@ -0,0 +1,289 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+from config import RESULTS_PATH, RESULT_CSV_PATH, RESULT_STORE_PATH, TIME_REGISTERED_LABEL, TIME_SCHEDULED_LABEL, \
+    TIME_PROCESSING_LABEL, TIME_SUCCEEDED_LABEL
+from latency_stats import get_peak_counts
+from result_store import read_results
+from state_occupancy import StateOccupancy, get_exit_times, get_finish_times
+
+CAPACITY_MODEL_JSON_PATH = os.path.join(RESULTS_PATH, 'capacity_model.json')
+CAPACITY_MODEL_PLOT_PATH = os.path.join(RESULTS_PATH, 'capacity_model.pdf')
+
+# the queue and the running batches are sampled at this many equally spaced times
+NUM_SAMPLES = 10000
+# the scheduling and container start rates are measured in windows of this many seconds
+RATE_WINDOW = 10.0
+# the effective parallelism is this percentile of the running batches while batches were waiting
+PARALLELISM_PERCENTILE = 95
+
+SCHEDULING_BOTTLENECK = 'scheduling'
+CONTAINER_START_BOTTLENECK = 'container_start'
+PARALLELISM_BOTTLENECK = 'parallelism'
+
+
+def get_sample_times(start_time, end_time, num_samples=NUM_SAMPLES):
+    return np.linspace(start_time, end_time, num_samples)
+
+
+def solve_fluid_queue(times, arrivals, throughput, startup_delay=0.0):
+    """
+    Returns the number of waiting batches of a fluid queue, that is served with a constant throughput whenever it is
+    not empty, starting startup_delay seconds after the first time.
+
+    With the served capacity S(t) the queue length is Q(t) = max over s <= t of (A(t) - A(s-)) - (S(t) - S(s)), which
+    is computed for all times at once with a cumulative minimum instead of stepping through the times.
+
+    :param times: Equally spaced, increasing times. The queue is empty before the first time.
+    :param arrivals: The cumulative number of arrived batches at every time
+    :param throughput: The number of batches that leave the queue per second
+    :param startup_delay: The seconds until the first batch leaves the queue
+    :return: The queue length at every time
+    """
+    served = throughput * np.maximum(times - times[0] - startup_delay, 0)
+    arrivals_before = np.concatenate([[0], arrivals[:-1]])
+    queue = arrivals - served - np.minimum.accumulate(arrivals_before - served)
+    return np.maximum(queue, 0)
+
+
+def get_sustained_rate(event_times, times, backlogged, window=RATE_WINDOW):
+    """
+    Returns the mean number of events per second in the windows of window seconds, that start after the first event
+    and in which batches were waiting the whole time. A short burst, e.g. the agency scheduling many batches at once
+    after startup, does not tell how fast it keeps up with a long queue.
+
+    :param times: The sample times of backlogged
+    :param backlogged: Whether batches were waiting at every sample time
+    :return: The rate, or None if no window was backlogged
+    """
+    event_times = np.sort(event_times[~np.isnan(event_times)])
+    if len(event_times) == 0:
+        return None
+
+    edges = np.arange(event_times[0], times[-1], window)
+    counts = np.diff(np.searchsorted(event_times, edges, side='left'))
+    samples = np.minimum(np.searchsorted(times, edges), len(times) - 1)
+    backlogged_windows = backlogged[samples[:-1]] & backlogged[samples[1:]]
+    if not backlogged_windows.any():
+        return None
+    return float(counts[backlogged_windows].mean() / window)
+
+
+def fit_capacity_model(data_frame, num_samples=NUM_SAMPLES, window=RATE_WINDOW):
+    """
+    Fits a fluid model of the agency to the timestamps of the batches.
+
+    Batches wait in a queue from their registration until they are scheduled. A scheduled batch occupies one of
+    parallelism slots until it finished. The agency schedules at most scheduling_rate batches per second, the nodes
+    start at most container_start_rate containers per second and a slot is busy for mean_service_time seconds per batch
+    (container start and run), so the queue is served with
+    throughput = min(scheduling_rate, container_start_rate, parallelism / mean_service_time).
+
+    The rates are the sustained rates while batches were waiting, see get_sustained_rate(). If batches never waited,
+    the run tells nothing about the sustained rates and the peak rates within RATE_WINDOW seconds are used.
+
+    All parameters are computed with vectorized operations over all batches.
+
+    :return: A dictionary with the model parameters
+    """
+    registered = data_frame[TIME_REGISTERED_LABEL].values.astype(float)
+    scheduled = data_frame[TIME_SCHEDULED_LABEL].values.astype(float)
+    processing = data_frame[TIME_PROCESSING_LABEL].values.astype(float)
+    succeeded = data_frame[TIME_SUCCEEDED_LABEL].values.astype(float)
+    finished = get_finish_times(data_frame).astype(float)
+
+    times = get_sample_times(np.nanmin(registered), np.nanmax(finished), num_samples)
+    waiting = StateOccupancy(registered, get_exit_times(data_frame, TIME_REGISTERED_LABEL)).count(times)
+    running = StateOccupancy(scheduled, finished).count(times)
+
+    # while batches are waiting, the number of running batches is limited by the agency and not by the load. times
+    # without any running batch, e.g. before the agency picked up the experiment, do not tell anything about the limit.
+    backlogged = (waiting > 0) & (running > 0)
+    saturated = bool(backlogged.any())
+    observed_running = running[backlogged] if saturated else running
+    parallelism = float(np.percentile(observed_running, PARALLELISM_PERCENTILE))
+
+    # the time until the agency scheduled the first batch
+    startup_delay = float(np.nanmin(scheduled) - np.nanmin(registered))
+    container_start_time = float(np.nanmean(processing - scheduled))
+    run_time = float(np.nanmean(succeeded - processing))
+    mean_service_time = float(np.nanmean(finished - scheduled))
+
+    zero_codes = np.zeros(len(registered), dtype=np.int64)
+    scheduling_rate, container_start_rate = [
+        get_sustained_rate(event_times, times, backlogged, window) if saturated else None
+        for event_times in [scheduled, processing]
+    ]
+    if scheduling_rate is None:
+        scheduling_rate = float(get_peak_counts(zero_codes, scheduled, window, 1)[0] / window)
+    if container_start_rate is None:
+        container_start_rate = float(get_peak_counts(zero_codes, processing, window, 1)[0] / window)
+
+    slot_throughput = parallelism / mean_service_time
+    bottleneck, throughput = min(
+        [(SCHEDULING_BOTTLENECK, scheduling_rate), (CONTAINER_START_BOTTLENECK, container_start_rate),
+         (PARALLELISM_BOTTLENECK, slot_throughput)],
+        key=lambda rate: rate[1]
+    )
+
+    # the finishes per second in the sampled intervals that started with waiting batches
+    finished_before = np.searchsorted(np.sort(finished[~np.isnan(finished)]), times, side='right')
+    interval_finishes = np.diff(finished_before)[backlogged[:-1]]
+    interval_duration = times[1] - times[0]
+    observed_throughput = float(interval_finishes.mean() / interval_duration) if saturated else None
+
+    return {
+        'batches': len(registered),
+        'saturated': saturated,
+        'parallelism': parallelism,
+        'max_parallelism': int(running.max()),
+        'startup_delay': startup_delay,
+        'container_start_time': container_start_time,
+        'run_time': run_time,
+        'mean_service_time': mean_service_time,
+        'scheduling_rate': scheduling_rate,
+        'container_start_rate': container_start_rate,
+        'slot_throughput': slot_throughput,
+        'throughput': throughput,
+        'observed_throughput': observed_throughput,
+        'bottleneck': bottleneck,
+    }
+
+
+def predict(model, num_batches, arrival_rate=None, num_samples=NUM_SAMPLES):
+    """
+    Predicts how the agency described by the model handles num_batches batches, that are either submitted at once or
+    arrive with arrival_rate batches per second.
+
+    :return: A dictionary containing the time until the last batch finished 'completion_time', the maximal number of
+             waiting batches 'peak_queue', the mean time a batch waits until it is scheduled 'mean_queueing_time' and
+             the time series 'times' and 'queue'
+    """
+    throughput = model['throughput']
+    submission_duration = num_batches / arrival_rate if arrival_rate else 0.0
+    # the queue is empty after all batches arrived and the ones that waited are served
+    end_time = model['startup_delay'] + submission_duration + num_batches / throughput
+
+    times = get_sample_times(0, end_time * 1.05, num_samples)
+    if arrival_rate:
+        arrivals = np.minimum(np.floor(arrival_rate * times) + 1, num_batches)
+    else:
+        arrivals = np.full(num_samples, float(num_batches))
+
+    return predict_from_arrivals(model, times, arrivals)
+
+
+def predict_from_arrivals(model, times, arrivals):
+    queue = solve_fluid_queue(times, arrivals, model['throughput'], model['startup_delay'])
+
+    num_batches = arrivals[-1]
+    scheduled = arrivals - queue
+    # the time the last batch is scheduled, it finishes after one service time
+    all_scheduled = np.flatnonzero(scheduled >= num_batches - 0.5)
+    last_scheduled_time = times[all_scheduled[0]] if len(all_scheduled) else np.inf
+
+    interval_duration = times[1] - times[0]
+    return {
+        'batches': int(num_batches),
+        'completion_time': float(last_scheduled_time - times[0] + model['mean_service_time']),
+        'peak_queue': float(queue.max()),
+        # little's law: the mean waiting time is the area under the queue divided by the number of batches
+        'mean_queueing_time': float(queue.sum() * interval_duration / num_batches),
+        'times': times,
+        'queue': queue,
+    }
+
+
+def validate_model(data_frame, model, num_samples=NUM_SAMPLES):
+    """
+    Replays the observed registrations through the model and compares the predicted queue with the observed one.
+    """
+    registered = data_frame[TIME_REGISTERED_LABEL].values.astype(float)
+    finished = get_finish_times(data_frame).astype(float)
+
+    times = get_sample_times(np.nanmin(registered), np.nanmax(finished), num_samples)
+    arrivals = np.searchsorted(np.sort(registered), times, side='right').astype(float)
+    observed_queue = StateOccupancy(registered, get_exit_times(data_frame, TIME_REGISTERED_LABEL)).count(times)
+
+    prediction = predict_from_arrivals(model, times, arrivals)
+    observed_queueing_time = np.nanmean(data_frame[TIME_SCHEDULED_LABEL].values - registered)
+
+    validation = {
+        'observed_completion_time': float(np.nanmax(finished) - np.nanmin(registered)),
+        'predicted_completion_time': prediction['completion_time'],
+        'observed_peak_queue': int(observed_queue.max()),
+        'predicted_peak_queue': prediction['peak_queue'],
+        'observed_mean_queueing_time': float(observed_queueing_time),
+        'predicted_mean_queueing_time': prediction['mean_queueing_time'],
+        'queue_rmse': float(np.sqrt(np.mean((prediction['queue'] - observed_queue) ** 2))),
+    }
+    return validation, times, observed_queue, prediction['queue']
+
+
+def prediction_summary(prediction, arrival_rate=None):
+    summary = {key: value for key, value in prediction.items() if key not in ['times', 'queue']}
+    summary['arrival_rate'] = arrival_rate
+    return summary
+
+
+def plot_capacity_model(times, observed_queue, predicted_queue, plot_path=CAPACITY_MODEL_PLOT_PATH):
+    fig, ax = plt.subplots(1, 1)
+    ax.plot(times, observed_queue, label='observed', linewidth=1)
+    ax.plot(times, predicted_queue, label='fluid model', linewidth=1, linestyle='--')
+    ax.set_xlabel('time in seconds')
+    ax.set_ylabel('waiting batches')
+    ax.legend()
+    fig.savefig(plot_path, bbox_inches='tight')
+
+
+def get_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Fits a fluid queueing model to the results of executed experiments and predicts how long a given '
+                    'number of batches takes.'
+    )
+
+    parser.add_argument(
+        '--num-batches', type=lambda v: [int(n) for n in v.split(',')], default=None,
+        help='Comma separated numbers of batches to predict, 10 and 100 times the executed batches by default'
+    )
+    parser.add_argument(
+        '--arrival-rate', type=float, default=None,
+        help='Batches per second arriving at the agency, all batches are submitted at once by default'
+    )
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = get_arguments(argv)
+
+    data_frame = read_results(RESULT_STORE_PATH, RESULT_CSV_PATH)
+
+    model = fit_capacity_model(data_frame)
+    validation, times, observed_queue, predicted_queue = validate_model(data_frame, model)
+
+    sweep_num_batches = args.num_batches or [model['batches'] * 10, model['batches'] * 100]
+    predictions = [
+        prediction_summary(predict(model, num_batches, args.arrival_rate), args.arrival_rate)
+        for num_batches in sweep_num_batches
+    ]
+
+    with open(CAPACITY_MODEL_JSON_PATH, 'w') as model_file:
+        json.dump({'model': model, 'validation': validation, 'predictions': predictions}, model_file, indent=2)
+    plot_capacity_model(times, observed_queue, predicted_queue)
+
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(pd.Series(model).to_string())
+        print()
+        print(pd.Series(validation).round(3).to_string())
+        print()
+        print(pd.DataFrame(predictions).set_index('batches').round(3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import importlib
+import sys
+from collections import namedtuple
+
+from instrumentation import enable, disable, stage
+
+# the programs are only imported when their command is executed, so every command only pays for the libraries it uses
+Command = namedtuple('Command', ['module', 'description', 'arguments'])
+
+COMMANDS = {
+    'submit': Command('execute_experiment', 'Submit experiments and wait until they are finished', []),
+    'watch': Command('watch_experiments', 'Monitor submitted experiments until they are finished', []),
+    'fetch': Command('create_csv', 'Fetch the batches of the executed experiments and create the results', []),
+    'export': Command('create_csv', 'Create the results from the cached batches without fetching', ['--from-cache']),
+    'plot': Command('plot_results', 'Plot the results', []),
+    'stats': Command('latency_stats', 'Compute latency, throughput and failure statistics', []),
+    'nodes': Command('node_analysis', 'Analyse how the batches use the nodes', []),
+    'compare': Command('compare_runs', 'Compare the results of several runs', []),
+    'benchmark': Command('benchmark_sweep', 'Sweep the number of batches and fit scaling curves', []),
+    'capacity': Command('capacity_model', 'Fit a queueing model and predict larger experiments', []),
+    'timeline': Command('batch_timeline', 'Query the batches in a state at a time and draw a gantt chart', []),
+    'archive': Command('batch_archive', 'Pack the batch caches into compressed archives or unpack them', []),
+    'quality': Command('data_quality', 'Check the timestamps for out-of-order state changes and clock skew', []),
+    'mock': Command('mock_agency', 'Run a local mock agency', []),
+}
+
+
+def get_parser():
+    epilog = 'commands:\n' + '\n'.join(
+        '  {: <12}{}'.format(name, command.description) for name, command in COMMANDS.items()
+    )
+    parser = argparse.ArgumentParser(
+        prog='ccload', description='Executes and analyses load experiments on a cc-agency.', epilog=epilog,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        '--trace', default=None,
+        help='Record the stages, requests and memory usage of the command and write them to this Chrome trace file'
+    )
+    parser.add_argument(
+        '--profile', default=None, help='Profile the main thread with cProfile and write the statistics to this file'
+    )
+    parser.add_argument(
+        '--trace-memory', action='store_true', help='Trace the memory allocations with tracemalloc'
+    )
+    parser.add_argument('command', choices=list(COMMANDS), metavar='command', help='The command to execute')
+    parser.add_argument(
+        'arguments', nargs=argparse.REMAINDER, help='The arguments of the command, see ccload <command> --help'
+    )
+    return parser
+
+
+def main(argv=None):
+    # options after the command are passed to the command, including --help
+    args = get_parser().parse_args(argv)
+    command = COMMANDS[args.command]
+
+    if args.trace or args.profile or args.trace_memory:
+        enable(profile=args.profile is not None, trace_memory=args.trace_memory)
+
+    # the argument parser of the command names the program after sys.argv[0]
+    sys.argv[0] = 'ccload {}'.format(args.command)
+    try:
+        with stage('import {}'.format(command.module)):
+            module = importlib.import_module(command.module)
+        with stage(args.command):
+            module.main(command.arguments + args.arguments)
+    finally:
+        instrumentation = disable()
+        if instrumentation is not None:
+            summary = instrumentation.summary()
+            instrumentation.print_summary(summary)
+            if args.trace:
+                instrumentation.write_trace(args.trace, summary)
+                print('trace written to {}'.format(args.trace))
+            if args.profile:
+                instrumentation.write_profile(args.profile)
+                print('profile written to {}'.format(args.profile))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+from config import RESULT_CSV_PATH, RESULT_STORE_PATH, EXPERIMENT_INFO_PATH, EXPERIMENT_ID_LABEL, \
+    TIME_REGISTERED_LABEL, TIME_SCHEDULED_LABEL, TIME_PROCESSING_LABEL, TIME_SUCCEEDED_LABEL, RESULTS_PATH, \
+    EXECUTED_EXPERIMENTS_DIR
+from create_csv import normalize_times_per_experiment, read_experiment_infos
+from latency_stats import PHASES, PHASE_LABEL, compute_latency_stats, compute_throughput_stats
+from result_store import read_results
+from state_changes import get_bin_edges, count_state_changes
+
+COMPARISON_DIR = os.path.join(RESULTS_PATH, 'comparison')
+
+# only these columns are read from the results of every run
+COMPARISON_COLUMNS = [
+    EXPERIMENT_ID_LABEL, TIME_REGISTERED_LABEL, TIME_SCHEDULED_LABEL, TIME_PROCESSING_LABEL, TIME_SUCCEEDED_LABEL
+]
+
+METADATA_LABELS = ['label', 'numBatches', 'agencyVersion', 'numNodes', 'batchConcurrencyLimit', 'submitMode']
+
+RUN_LABEL = 'run'
+CURVE_LABEL = 'curve'
+TIME_LABEL = 'seconds since experiment start'
+THROUGHPUT_LABEL = 'succeeded batches per second'
+DURATION_LABEL = 'duration in seconds'
+PROBABILITY_LABEL = 'probability'
+TOTAL_PHASE = 'total'
+
+DEFAULT_THROUGHPUT_BIN_WIDTH = 10
+NUM_CDF_POINTS = 201
+
+
+def read_run_experiment_infos(run_path):
+    """
+    Reads the experiment information of a run from the results directory, or from the executed experiments of older
+    runs.
+    """
+    info_path = os.path.join(run_path, EXPERIMENT_INFO_PATH)
+    if os.path.isfile(info_path):
+        with open(info_path, 'r') as info_file:
+            return json.load(info_file)
+
+    executed_experiments_dir = os.path.join(run_path, EXECUTED_EXPERIMENTS_DIR)
+    if not os.path.isdir(executed_experiments_dir):
+        return {}
+    experiment_ids = [os.path.splitext(filename)[0] for filename in os.listdir(executed_experiments_dir)]
+    return read_experiment_infos(experiment_ids, executed_experiments_dir)
+
+
+def get_curve_name(run_name, experiment_id, experiment_info, num_run_experiments):
+    name = experiment_info.get('label') or run_name
+    if num_run_experiments > 1:
+        name = '{} {}'.format(name, experiment_id[:8])
+    num_batches = experiment_info.get('numBatches')
+    if num_batches:
+        name = '{} ({} batches)'.format(name, num_batches)
+    return name
+
+
+def make_unique(name, used_names):
+    """
+    Returns the name, with an index appended if it is already in used_names, and adds it to used_names. Runs in
+    directories with the same basename or experiments with the same label would otherwise get the same curve.
+    """
+    unique_name = name
+    index = 2
+    while unique_name in used_names:
+        unique_name = '{} #{}'.format(name, index)
+        index += 1
+    used_names.add(unique_name)
+    return unique_name
+
+
+def read_runs(run_paths):
+    """
+    Reads the results of several runs. Every run is a directory in which create_csv.py was executed. Only the columns
+    needed for the comparison are read, from the columnar result store if it exists.
+
+    :return: A tuple (data_frame, metadata). The data frame contains the timestamps of all batches, normalized to the
+             start of their experiment, and the column CURVE_LABEL naming the experiment. metadata contains one row per
+             experiment, indexed by the curve name.
+    """
+    data_frames = []
+    metadata_rows = []
+    used_names = set()
+    for run_path in run_paths:
+        run_name = os.path.basename(os.path.abspath(run_path))
+        data_frame = read_results(
+            os.path.join(run_path, RESULT_STORE_PATH), os.path.join(run_path, RESULT_CSV_PATH), COMPARISON_COLUMNS,
+            mmap=True
+        )
+        experiment_infos = read_run_experiment_infos(run_path)
+
+        experiment_ids = pd.Categorical(data_frame[EXPERIMENT_ID_LABEL])
+        curve_names = []
+        for experiment_id in experiment_ids.categories.astype(str):
+            experiment_info = experiment_infos.get(experiment_id, {})
+            curve_name = get_curve_name(run_name, experiment_id, experiment_info, len(experiment_ids.categories))
+            curve_name = make_unique(curve_name, used_names)
+            curve_names.append(curve_name)
+
+            metadata_row = {CURVE_LABEL: curve_name, RUN_LABEL: run_name, EXPERIMENT_ID_LABEL: experiment_id}
+            metadata_row.update({label: experiment_info.get(label) for label in METADATA_LABELS})
+            metadata_rows.append(metadata_row)
+
+        data_frame = data_frame.copy()
+        data_frame[CURVE_LABEL] = pd.Categorical.from_codes(experiment_ids.codes, curve_names)
+        normalize_times_per_experiment(data_frame)
+        data_frames.append(data_frame)
+
+    data_frame = pd.concat(data_frames, ignore_index=True)
+    data_frame[CURVE_LABEL] = data_frame[CURVE_LABEL].astype('category')
+    metadata = pd.DataFrame(metadata_rows).set_index(CURVE_LABEL)
+    return data_frame, metadata
+
+
+def create_throughput_df(data_frame, bin_width=DEFAULT_THROUGHPUT_BIN_WIDTH):
+    """
+    Returns the number of succeeded batches per second of every curve in time bins of bin_width seconds.
+
+    :return: A data frame with the bin start times as index and one column per curve
+    :rtype: pd.DataFrame
+    """
+    bin_edges = get_bin_edges(0, data_frame[TIME_SUCCEEDED_LABEL].max(), bin_width)
+    curve_names, counts = count_state_changes(data_frame, [TIME_SUCCEEDED_LABEL], bin_edges, CURVE_LABEL)
+
+    return pd.DataFrame(
+        data=counts[TIME_SUCCEEDED_LABEL].T / bin_width,
+        index=pd.Index(bin_edges[:-1], name=TIME_LABEL),
+        columns=curve_names
+    )
+
+
+def create_latency_cdf_df(data_frame, num_points=NUM_CDF_POINTS):
+    """
+    Returns the latency distribution of every phase and curve as num_points equally spaced quantiles.
+
+    :return: A data frame indexed by phase and probability with one column per curve
+    :rtype: pd.DataFrame
+    """
+    probabilities = np.linspace(0, 1, num_points)
+    phases = PHASES + [(TOTAL_PHASE, TIME_REGISTERED_LABEL, TIME_SUCCEEDED_LABEL)]
+
+    durations = pd.DataFrame(data={CURVE_LABEL: data_frame[CURVE_LABEL]})
+    for phase, begin_label, end_label in phases:
+        durations[phase] = data_frame[end_label].values - data_frame[begin_label].values
+
+    grouped = durations.groupby(CURVE_LABEL, observed=True)
+    phase_quantiles = {
+        phase: grouped[phase].quantile(probabilities).unstack(CURVE_LABEL).rename_axis(index=PROBABILITY_LABEL)
+        for phase, _, _ in phases
+    }
+    return pd.concat(phase_quantiles, names=[PHASE_LABEL])
+
+
+def create_summary_df(data_frame, metadata):
+    """
+    Returns the metadata, the throughput and the median and p99 latency of every phase for every curve.
+    """
+    stats_df = data_frame[COMPARISON_COLUMNS[1:]].copy()
+    stats_df[EXPERIMENT_ID_LABEL] = data_frame[CURVE_LABEL]
+
+    throughput_stats = compute_throughput_stats(stats_df)
+    latency_stats = compute_latency_stats(stats_df)[['p50', 'p99']].unstack()
+    latency_stats.columns = ['{}_{}'.format(phase, quantile) for quantile, phase in latency_stats.columns]
+
+    summary = metadata.join(throughput_stats).join(latency_stats)
+    summary.index.name = CURVE_LABEL
+    return summary
+
+
+def plot_throughput(throughput_df, output_dir):
+    fig, ax = plt.subplots(1, 1)
+    for curve_name in throughput_df.columns:
+        ax.plot(throughput_df.index, throughput_df[curve_name], label=curve_name, linewidth=1)
+    ax.set_xlabel(TIME_LABEL)
+    ax.set_ylabel(THROUGHPUT_LABEL)
+    ax.legend(fontsize='small')
+    fig.savefig(os.path.join(output_dir, 'throughput.pdf'), bbox_inches='tight')
+
+
+def plot_latency_cdfs(latency_cdf_df, output_dir):
+    phases = latency_cdf_df.index.get_level_values(PHASE_LABEL).unique()
+    fig, axes = plt.subplots(len(phases), 1, figsize=(6.4, 2.4 * len(phases)))
+    for ax, phase in zip(axes, phases):
+        phase_df = latency_cdf_df.loc[phase]
+        for curve_name in phase_df.columns:
+            ax.plot(phase_df[curve_name].values, phase_df.index.values, label=curve_name, linewidth=1)
+        ax.set_title(phase, fontsize='medium')
+        ax.set_ylabel(PROBABILITY_LABEL)
+    axes[-1].set_xlabel(DURATION_LABEL)
+    axes[0].legend(fontsize='small')
+    fig.tight_layout()
+    fig.savefig(os.path.join(output_dir, 'latency_cdfs.pdf'), bbox_inches='tight')
+
+
+def get_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compares the results of several runs. Every experiment is normalized to its own start.'
+    )
+
+    parser.add_argument(
+        'runs', nargs='*', default=['.'],
+        help='Directories in which create_csv.py was executed, the current directory by default'
+    )
+    parser.add_argument(
+        '--bin-width', type=float, default=DEFAULT_THROUGHPUT_BIN_WIDTH,
+        help='The width of the throughput time bins in seconds'
+    )
+    parser.add_argument('--output-dir', default=COMPARISON_DIR, help='The directory the comparison is written to')
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = get_arguments(argv)
+
+    data_frame, metadata = read_runs(args.runs)
+
+    if not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    summary = create_summary_df(data_frame, metadata)
+    throughput_df = create_throughput_df(data_frame, args.bin_width)
+    latency_cdf_df = create_latency_cdf_df(data_frame)
+
+    summary.to_csv(os.path.join(args.output_dir, 'summary.csv'))
+    throughput_df.to_csv(os.path.join(args.output_dir, 'throughput.csv'))
+    latency_cdf_df.to_csv(os.path.join(args.output_dir, 'latency_cdfs.csv'))
+
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(summary.round(3))
+
+    plot_throughput(throughput_df, args.output_dir)
+    plot_latency_cdfs(latency_cdf_df, args.output_dir)
+
+
+if __name__ == '__main__':
+    main()
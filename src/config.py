@@ -0,0 +1,83 @@
+# paths, batch states and result columns shared by all programs
+# this module is imported by every program, so it must not import heavy libraries
+import os
+from collections import defaultdict
+from getpass import getpass
+
+TEMPLATE_PATH = 'experiment_templates/echo_template.red'
+
+EXECUTED_EXPERIMENTS_DIR = 'executed_experiments'
+MONITORING_DIR = 'monitoring'
+CACHE_DIRECTORY = 'cache'
+
+RESULTS_PATH = 'results'
+RESULT_CSV_PATH = os.path.join(RESULTS_PATH, 'processing_timestamps.csv')
+RESULT_STORE_PATH = os.path.join(RESULTS_PATH, 'processing_timestamps')
+EXPERIMENT_INFO_PATH = os.path.join(RESULTS_PATH, 'experiments.json')
+
+FINISHED_STATES = ['succeeded', 'failed', 'cancelled']
+BATCH_STATES = ['registered', 'scheduled', 'processing'] + FINISHED_STATES
+
+SUBMIT_MODE_FAICE = 'faice'
+SUBMIT_MODE_DIRECT = 'direct'
+
+MONITOR_MODE_COUNT = 'count'
+MONITOR_MODE_FULL = 'full'
+
+DEFAULT_LIVE_WINDOW = 600
+DEFAULT_STALL_TIMEOUT = 120
+DEFAULT_PLOT_INTERVAL = 30
+
+TIME_REGISTERED_LABEL = 'timestamp_registered'
+TIME_SCHEDULED_LABEL = 'timestamp_scheduled'
+TIME_PROCESSING_LABEL = 'timestamp_processing'
+TIME_SUCCEEDED_LABEL = 'timestamp_succeeded'
+EXPERIMENT_ID_LABEL = 'experiment_id'
+NODE_LABEL = 'node'
+
+TIME_FINISHED_LABEL = 'timestamp_finished'
+TERMINAL_STATE_LABEL = 'terminal_state'
+ATTEMPTS_LABEL = 'attempts'
+RETRY_DURATION_LABEL = 'retry_duration'
+
+TIMESTAMP_LABELS = [
+    TIME_REGISTERED_LABEL, TIME_SCHEDULED_LABEL, TIME_PROCESSING_LABEL, TIME_SUCCEEDED_LABEL, TIME_FINISHED_LABEL
+]
+
+
+class AuthenticationInfo:
+    def __init__(self, hostname, username, password):
+        self.hostname = hostname
+        self.username = username
+        self.password = password
+
+    @staticmethod
+    def agency_from_user_input():
+        hostname = input('agency url: ')
+        username = input('agency username: ')
+        password = getpass('agency password: ')
+
+        if hostname.endswith('/'):
+            hostname = hostname[:-1]
+
+        return AuthenticationInfo(hostname, username, password)
+
+
+def get_experiment_ids_from_executed_experiments():
+    experiment_ids = []
+    for filename in os.listdir(EXECUTED_EXPERIMENTS_DIR):
+        if os.path.isfile(os.path.join(EXECUTED_EXPERIMENTS_DIR, filename)):
+            experiment_ids.append(os.path.splitext(filename)[0])
+
+    return experiment_ids
+
+
+def get_state_dict(batches):
+    state_dict = defaultdict(lambda: 0)
+    for batch in batches:
+        state_dict[batch['state']] += 1
+    return dict(state_dict)
+
+
+def check_finished(state_dict):
+    return all(map(lambda k: k in FINISHED_STATES, state_dict.keys()))
@@ -1,293 +1,545 @@
+import argparse
 import json
 import os
+import threading
+import time
+from contextlib import ExitStack
 from threading import Lock
 
+import numpy as np
 import pandas as pd
 import requests
 from multiprocessing.pool import ThreadPool
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from batch_archive import BatchArchive, find_archive, unpack_experiment
+from batch_cache import BatchCache
+from config import RESULTS_PATH, RESULT_CSV_PATH, RESULT_STORE_PATH, EXPERIMENT_INFO_PATH, EXECUTED_EXPERIMENTS_DIR, \
+    FINISHED_STATES, TIME_REGISTERED_LABEL, TIME_SCHEDULED_LABEL, TIME_PROCESSING_LABEL, TIME_SUCCEEDED_LABEL, \
+    TIME_FINISHED_LABEL, EXPERIMENT_ID_LABEL, NODE_LABEL, TERMINAL_STATE_LABEL, ATTEMPTS_LABEL, RETRY_DURATION_LABEL, \
+    TIMESTAMP_LABELS, AuthenticationInfo, get_experiment_ids_from_executed_experiments
+from data_quality import check_data_quality, print_data_quality_report, write_data_quality_report
+from result_store import remove_result_store, write_result_store
+from instrumentation import stage, record_operation
 
-from execute_experiment import AuthenticationInfo, EXECUTED_EXPERIMENTS_DIR, get_state_dict
-
-CACHE_DIRECTORY = 'cache'
-RESULTS_PATH = 'results'
-RESULT_CSV_PATH = os.path.join(RESULTS_PATH, 'processing_timestamps.csv')
 BAR_WIDTH = 70
-PROCESSING_DURATION_CSV_PATH = os.path.join(RESULTS_PATH, 'processing_durations.csv')
-SUCCESS_RATE_CSV_PATH = os.path.join(RESULTS_PATH, 'success_rate.csv')
-
-PROCESSING_DURATION_LABEL = 'processing duration in seconds'
-SCHEDULING_DURATION_LABEL = 'scheduling duration in seconds'
-TIME_REGISTERED_LABEL = 'timestamp_registered'
-TIME_SCHEDULED_LABEL = 'timestamp_scheduled'
-TIME_PROCESSING_LABEL = 'timestamp_processing'
-TIME_SUCCEEDED_LABEL = 'timestamp_succeeded'
-EXPERIMENT_ID_LABEL = 'experiment_id'
-
-
-def get_experiment_ids_from_executed_experiments():
-    experiment_ids = []
-    for filename in os.listdir(EXECUTED_EXPERIMENTS_DIR):
-        if os.path.isfile(os.path.join(EXECUTED_EXPERIMENTS_DIR, filename)):
-            experiment_ids.append(os.path.splitext(filename)[0])
+# the progress bar is redrawn at most this often, printing it for every batch slows fetching down
+PROGRESS_INTERVAL = 0.1
+
+FLOAT_LABELS = TIMESTAMP_LABELS + [RETRY_DURATION_LABEL]
+CATEGORICAL_LABELS = [NODE_LABEL, TERMINAL_STATE_LABEL]
+
+DEFAULT_FETCH_CONCURRENCY = 5
+DEFAULT_FETCH_RETRIES = 5
+FETCH_BACKOFF_FACTOR = 0.5
+FETCH_TIMEOUT = 30
+RETRY_STATUS_CODES = [500, 502, 503, 504]
+
+OUTPUT_FORMAT_CSV = 'csv'
+OUTPUT_FORMAT_COLUMNAR = 'columnar'
+OUTPUT_FORMAT_BOTH = 'both'
+
+
+def read_experiment_infos(experiment_ids, executed_experiments_dir=EXECUTED_EXPERIMENTS_DIR):
+    """
+    Reads the information stored by execute_experiment.py for every experiment, e.g. its number of batches and the
+    metadata of the run that submitted it.
+
+    :return: A dictionary mapping the experiment ids to their information
+    """
+    experiment_infos = {}
+    for experiment_id in experiment_ids:
+        info_path = os.path.join(executed_experiments_dir, experiment_id + '.json')
+        experiment_infos[experiment_id] = {'experimentId': experiment_id}
+        if os.path.isfile(info_path):
+            with open(info_path, 'r') as info_file:
+                experiment_infos[experiment_id].update(json.load(info_file))
+    return experiment_infos
+
+
+def create_session(pool_size=DEFAULT_FETCH_CONCURRENCY, retries=DEFAULT_FETCH_RETRIES):
+    """
+    Creates a requests session that keeps its connections alive and retries failed requests with exponential backoff
+    on connection errors, timeouts and 5xx responses.
+    """
+    retry = Retry(total=retries, backoff_factor=FETCH_BACKOFF_FACTOR, status_forcelist=RETRY_STATUS_CODES)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class WorkerSessions:
+    """
+    Provides one pooled session per worker thread, so that every worker reuses its connection to the agency.
+    """
+    def __init__(self):
+        self.local = threading.local()
+
+    def get(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = create_session(pool_size=1)
+            self.local.session = session
+        return session
+
+
+class RateLimiter:
+    def __init__(self, max_requests_per_second=None):
+        self.interval = 1 / max_requests_per_second if max_requests_per_second else 0
+        self.lock = Lock()
+        self.next_time = time.monotonic()
 
-    return experiment_ids
+    def wait(self):
+        if not self.interval:
+            return
 
+        with self.lock:
+            now = time.monotonic()
+            wait_time = self.next_time - now
+            self.next_time = max(self.next_time, now) + self.interval
 
-def get_detailed_result_with_cache(agency, experiment_id, username, pw):
-    if not os.path.isdir(CACHE_DIRECTORY):
-        os.mkdir(CACHE_DIRECTORY)
+        if wait_time > 0:
+            time.sleep(wait_time)
 
-    cache_filename = os.path.join(CACHE_DIRECTORY, 'result_{}.json'.format(experiment_id))
-    if os.path.isfile(cache_filename):
-        with open(cache_filename, 'r') as cache_file:
-            return json.load(cache_file)
-    else:
-        detailed_result = get_detailed_result(agency, experiment_id, username, pw)
 
-        with open(cache_filename, 'w') as cache_file:
-            json.dump(detailed_result, cache_file)
+class FetchStatistics:
+    def __init__(self):
+        self.lock = Lock()
+        self.latencies = []
+        self.start_time = time.monotonic()
 
-        return detailed_result
+    def add(self, latency):
+        with self.lock:
+            self.latencies.append(latency)
+
+    def summary(self):
+        duration = time.monotonic() - self.start_time
+        latencies = np.array(self.latencies)
+        return {
+            'requests': len(latencies),
+            'duration': duration,
+            'requests_per_second': len(latencies) / duration if duration > 0 else 0.0,
+            'latency_p50': float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            'latency_p99': float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+        }
+
+    def print_summary(self, name='batches'):
+        summary = self.summary()
+        print(
+            'fetched {} {} in {:.2f} sec: {:.1f} req/s, latency p50 {:.3f} sec, p99 {:.3f} sec'.format(
+                summary['requests'], name, summary['duration'], summary['requests_per_second'],
+                summary['latency_p50'], summary['latency_p99']
+            ),
+            flush=True
+        )
 
 
-def get_batches(agency, username, pw, experiment_id):
+def get_batches(agency, username, pw, experiment_id, session=None):
     url = '{}/{}?experimentId={}'.format(agency, 'batches', experiment_id)
-    resp = requests.get(url, auth=(username, pw))
+    start_time = time.perf_counter()
+    resp = (session or requests).get(url, auth=(username, pw), timeout=FETCH_TIMEOUT)
+    resp.raise_for_status()
+    record_operation('list batches', start_time, time.perf_counter() - start_time, len(resp.content))
 
     batches = list(filter(lambda b: b['experimentId'] == experiment_id, resp.json()))
 
     return batches
 
 
-class BatchFetcher:
-    def __init__(self, agency, username, password, num_batches, experiment_id=None):
-        self.agency = agency
-        self.username = username
-        self.password = password
+class FetchProgress:
+    """
+    Prints a single progress bar for all batches that are fetched, possibly belonging to several experiments.
+    """
+    def __init__(self, num_batches, name='batches'):
         self.num_batches = num_batches
+        self.name = name
         self.lock = Lock()
         self.counter = 0
-        self.experiment_id = experiment_id
+        self.next_print_time = 0
 
-    def __call__(self, batch):
-        result = requests.get(
-            '{}/{}/{}'.format(self.agency, 'batches', batch['_id']),
-            auth=(self.username, self.password)
-        ).json()
+    def update(self):
         with self.lock:
             self.counter += 1
+            counter = self.counter
 
-        percentage = self.counter / self.num_batches
+            now = time.monotonic()
+            if now < self.next_print_time and counter != self.num_batches:
+                return
+            self.next_print_time = now + PROGRESS_INTERVAL
+
+        percentage = counter / self.num_batches
 
         format_string = 'fetching {}: [{{:<{}}}/{{:<{}}}][{{:-<{}}}]'.format(
-            self.experiment_id or 'batches',
+            self.name,
             len(str(self.num_batches)),
             len(str(self.num_batches)),
             BAR_WIDTH
         )
 
         print(
-            format_string.format(self.counter, self.num_batches, '#' * int(percentage * BAR_WIDTH)),
-            end='\n' if self.counter == self.num_batches else '\r',
+            format_string.format(counter, self.num_batches, '#' * int(percentage * BAR_WIDTH)),
+            end='\n' if counter == self.num_batches else '\r',
             flush=True
         )
-        return result
 
 
-def fetch_batches(batches, agency, username, pw, experiment_id=None):
-    with ThreadPool(5) as p:
-        batch_list = list(p.map(BatchFetcher(agency, username, pw, len(batches), experiment_id), batches))
-
-    return batch_list
+class BatchLister:
+    def __init__(self, agency, username, password, sessions=None, rate_limiter=None):
+        self.agency = agency
+        self.username = username
+        self.password = password
+        self.sessions = sessions or WorkerSessions()
+        self.rate_limiter = rate_limiter or RateLimiter()
 
+    def __call__(self, experiment_id):
+        self.rate_limiter.wait()
+        return get_batches(self.agency, self.username, self.password, experiment_id, session=self.sessions.get())
 
-def get_total_time(batch_list):
-    start_time = batch_list[0]['history'][0]['time']
-    end_time = start_time
-    for history in batch_list:
-        history_start_time = min(history['history'], key=lambda he: he['time'])['time']
-        if history_start_time < start_time:
-            start_time = history_start_time
 
-        history_end_time = max(history['history'], key=lambda he: he['time'])['time']
-        if history_end_time > end_time:
-            end_time = history_end_time
+class BatchFetcher:
+    def __init__(
+            self, agency, username, password, num_batches, experiment_id=None, sessions=None, rate_limiter=None,
+            statistics=None, progress=None
+    ):
+        self.agency = agency
+        self.username = username
+        self.password = password
+        self.sessions = sessions or WorkerSessions()
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.statistics = statistics or FetchStatistics()
+        self.progress = progress or FetchProgress(num_batches, experiment_id or 'batches')
 
-    return end_time - start_time
+    def __call__(self, batch):
+        self.rate_limiter.wait()
 
+        start_time = time.perf_counter()
+        resp = self.sessions.get().get(
+            '{}/{}/{}'.format(self.agency, 'batches', batch['_id']),
+            auth=(self.username, self.password),
+            timeout=FETCH_TIMEOUT
+        )
+        resp.raise_for_status()
+        result = resp.json()
+        duration = time.perf_counter() - start_time
+        self.statistics.add(duration)
+        record_operation('fetch batch', start_time, duration, len(resp.content))
 
-def get_detailed_result(agency, experiment_id, username, pw):
-    batches = get_batches(agency, username, pw, experiment_id)
+        self.progress.update()
 
-    state_dict = get_state_dict(batches)
+        return result
 
-    cache_filename = '{}/{}.json'.format(CACHE_DIRECTORY, experiment_id)
-    if os.path.isfile(cache_filename):
-        # read cache
-        print('reading {} from cache'.format(experiment_id), flush=True)
-        with open(cache_filename, 'r') as cache_file:
-            batch_list = json.load(cache_file)
-    else:
-        batch_list = fetch_batches(batches, agency, username, pw, experiment_id)
 
-        # create cache
-        if not os.path.isdir('cache'):
-            os.mkdir('cache')
+def fetch_experiments(
+        agency, experiment_ids, username, pw, concurrency=DEFAULT_FETCH_CONCURRENCY, max_requests_per_second=None
+):
+    """
+    Makes sure that the batch caches of the given experiments contain the latest document of every batch.
+
+    All experiments are listed and fetched by the same worker threads, so they share the keep-alive connections, the
+    concurrency and the request rate limit. Experiments that are not cached at all are fetched first, experiments that
+    are partially cached last.
+
+    :return: A dictionary mapping every experiment id to a tuple (cache, batches) containing the BatchCache and the
+             batch list of the experiment
+    """
+    sessions = WorkerSessions()
+    rate_limiter = RateLimiter(max_requests_per_second)
+    statistics = FetchStatistics()
+
+    with ThreadPool(concurrency) as p:
+        with stage('list batches', experiments=len(experiment_ids)):
+            batch_lists = p.map(BatchLister(agency, username, pw, sessions, rate_limiter), experiment_ids)
+
+        caches = {}
+        missing_batches = {}
+        for experiment_id, batches in zip(experiment_ids, batch_lists):
+            cache = open_cache(experiment_id)
+            caches[experiment_id] = cache
+            missing_batches[experiment_id] = cache.get_missing_batches(batches)
+
+            if not missing_batches[experiment_id]:
+                print('reading {} from cache'.format(experiment_id), flush=True)
+            elif len(cache) > 0:
+                print('resuming {}: {} of {} batches are cached'.format(
+                    experiment_id, len(batches) - len(missing_batches[experiment_id]), len(batches)
+                ), flush=True)
+
+        fetch_order = sorted(
+            filter(lambda e: missing_batches[e], experiment_ids),
+            key=lambda e: (len(caches[e]) > 0, -len(missing_batches[e]))
+        )
+        jobs = [batch for experiment_id in fetch_order for batch in missing_batches[experiment_id]]
 
-        with open(cache_filename, 'w') as cache_file:
-            json.dump(batch_list, cache_file)
+        if jobs:
+            progress = FetchProgress(len(jobs), '{} experiments'.format(len(fetch_order)))
+            fetcher = BatchFetcher(
+                agency, username, pw, len(jobs), sessions=sessions, rate_limiter=rate_limiter, statistics=statistics,
+                progress=progress
+            )
 
-    batch_histories = []
-    batch_states = []
-    mount = False
-    for batch in batch_list:
-        if 'mount' in batch:
-            mount = batch['mount']
+            with ExitStack() as stack:
+                stack.enter_context(stage('fetch batches', batches=len(jobs)))
+                for experiment_id in fetch_order:
+                    stack.enter_context(caches[experiment_id])
 
-        batch_states.append(batch['state'])
+                for batch in p.imap_unordered(fetcher, jobs):
+                    caches[batch['experimentId']].append(batch)
 
-        if batch['history']:
-            batch_history = []
-            for history_entry in batch['history']:
-                batch_history.append({'state': history_entry['state'], 'time': history_entry['time']})
-            batch_histories.append({'history': batch_history, 'node': batch['node']})
+            statistics.print_summary()
 
     return {
-        'experimentId': experiment_id,
-        'states': state_dict,
-        'batchStates': batch_states,
-        'batchHistories': batch_histories,
-        'totalTime': get_total_time(batch_list),
-        'mount': mount,
+        experiment_id: (caches[experiment_id], batches)
+        for experiment_id, batches in zip(experiment_ids, batch_lists)
     }
 
 
-def get_state_duration(history, state):
-    begin_time = None
-    for history_entry in history:
-        if state == history_entry['state']:
-            begin_time = history_entry['time']
-
-    if begin_time is None:
-        raise ValueError('Could not find time of state "{}"'.format(state))
-
-    next_time = min(filter(lambda he: he['time'] > begin_time, history), key=lambda he: he['time'])['time']
-    return next_time - begin_time
-
-
-class BatchToStateDuration:
-    def __init__(self, state):
-        self.state = state
-
-    def __call__(self, batch):
-        try:
-            return get_state_duration(batch['history'], self.state)
-        except ValueError:
-            return 0
-
+def open_cache(experiment_id):
+    """
+    Returns the BatchCache of the experiment. An archived experiment without batch cache is unpacked first, so that
+    missing batches can be appended.
+    """
+    cache = BatchCache(experiment_id)
+    if not os.path.exists(cache.path) and find_archive(experiment_id) is not None:
+        print('unpacking {}'.format(find_archive(experiment_id)), flush=True)
+        unpack_experiment(experiment_id)
+        cache = BatchCache(experiment_id)
+    return cache
+
+
+def read_cached_experiments(experiment_ids):
+    """
+    Returns the batch caches of the given experiments like fetch_experiments(), but without contacting the agency. The
+    batch lists are None, so experiments that were not fetched completely contain only their cached batches.
+    Archived experiments are streamed from their archive.
+    """
+    fetched_experiments = {}
+    for experiment_id in experiment_ids:
+        cache = BatchCache(experiment_id)
+        if len(cache) == 0 and find_archive(experiment_id) is not None:
+            cache = BatchArchive(find_archive(experiment_id))
+        if len(cache) == 0:
+            print('{} is not cached, fetch it first'.format(experiment_id), flush=True)
+            continue
+        fetched_experiments[experiment_id] = (cache, None)
+    return fetched_experiments
+
+
+def extract_state_timestamps(batches, num_batches):
+    """
+    Extracts the state timestamps, the node, the terminal state and the retries of every batch in a single pass over
+    the batch documents. The values are written directly into preallocated arrays, so the batches can be streamed from
+    the cache without keeping them in memory. Batches without history are skipped.
+
+    Every scheduling of a batch is one attempt. A batch that failed and was retried or that was rescheduled contains the
+    states of every attempt in its history. The scheduled, processing and succeeded timestamps are taken from the last
+    attempt, the registered timestamp is the first registration. The retry duration is the time from the first to the
+    last scheduling, i.e. the time lost to earlier attempts. Timestamps of states that the batch never reached are NaN,
+    the terminal state is None if the batch is not finished.
+
+    :param batches: An iterable of batch documents or batch histories, each containing a 'history' list
+    :param num_batches: The expected number of batches, used to preallocate the arrays
+    :return: A dictionary mapping the column labels to arrays with one entry per batch
+    """
+    fill_values = {label: (np.nan, float) for label in FLOAT_LABELS}
+    fill_values[ATTEMPTS_LABEL] = (0, np.int32)
+    fill_values.update({label: (None, object) for label in CATEGORICAL_LABELS})
+
+    capacity = max(num_batches, 1)
+    columns = {label: np.full(capacity, *fill_values[label]) for label in fill_values}
+
+    nan = float('nan')
+    row = 0
+    for batch in batches:
+        history = batch['history']
+        if not history:
+            continue
+
+        if row == capacity:
+            capacity *= 2
+            for label, values in columns.items():
+                grown = np.full(capacity, *fill_values[label])
+                grown[:row] = values
+                columns[label] = grown
+
+        registered = scheduled = first_scheduled = processing = succeeded = nan
+        attempts = 0
+        for history_entry in history:
+            state = history_entry['state']
+            if state == 'registered':
+                if registered != registered:
+                    registered = history_entry['time']
+            elif state == 'scheduled':
+                scheduled = history_entry['time']
+                attempts += 1
+                if attempts == 1:
+                    first_scheduled = scheduled
+                # the timestamps of an earlier attempt do not belong to this one
+                processing = succeeded = nan
+            elif state == 'processing':
+                processing = history_entry['time']
+            elif state == 'succeeded':
+                succeeded = history_entry['time']
+
+        columns[TIME_REGISTERED_LABEL][row] = registered
+        columns[TIME_SCHEDULED_LABEL][row] = scheduled
+        columns[TIME_PROCESSING_LABEL][row] = processing
+        columns[TIME_SUCCEEDED_LABEL][row] = succeeded
+        columns[ATTEMPTS_LABEL][row] = attempts
+        columns[RETRY_DURATION_LABEL][row] = scheduled - first_scheduled if attempts > 1 else 0.0
+
+        last_state = history[-1]['state']
+        if last_state in FINISHED_STATES:
+            columns[TERMINAL_STATE_LABEL][row] = last_state
+            columns[TIME_FINISHED_LABEL][row] = history[-1]['time']
+
+        columns[NODE_LABEL][row] = batch.get('node')
+        row += 1
+
+    return {label: values[:row] for label, values in columns.items()}
+
+
+def batches_to_data_frame(experiment_id, batches, num_batches):
+    columns = extract_state_timestamps(batches, num_batches)
+
+    data = {EXPERIMENT_ID_LABEL: np.full(len(columns[TIME_REGISTERED_LABEL]), experiment_id, dtype=object)}
+    data.update(columns)
 
-def get_state_timestamp_from_history(history, state):
-    history_entries = list(filter(lambda history_entry: history_entry['state'] == state, history['history']))
-    if len(history_entries) != 1:
-        raise ValueError('Found state {} {} times'.format(state, len(history_entries)))
-    return history_entries[0]['time']
+    return pd.DataFrame(data=data)
 
 
-def get_state_timestamps(batch_list, state):
-    return list(
-        map(lambda batch_history: get_state_timestamp_from_history(batch_history, state), batch_list['batchHistories'])
-    )
+def concat_data_frames(data_frames):
+    """
+    Concatenates the data frames of multiple experiments. The node and terminal state columns are converted to
+    categorical columns afterwards, because the experiments can use different sets of nodes. Without data frames an
+    empty data frame with all columns is returned.
+    """
+    if not data_frames:
+        data_frames = [batches_to_data_frame(None, [], 0)]
+    times_df = pd.concat(data_frames, ignore_index=True)
+    for label in CATEGORICAL_LABELS:
+        times_df[label] = times_df[label].astype('category')
+    return times_df
 
 
-def get_state_durations(batch_list, state):
-    return list(map(BatchToStateDuration(state), batch_list))
+def normalize_times_df(times_df):
+    start_time = times_df[TIME_REGISTERED_LABEL].min()
 
+    for label in TIMESTAMP_LABELS:
+        times_df[label] = times_df[label] - start_time
 
-def detailed_results_to_data_frame(detailed_results):
-    data = {
-        EXPERIMENT_ID_LABEL: [],
-        TIME_REGISTERED_LABEL: [],
-        TIME_SCHEDULED_LABEL: [],
-        TIME_PROCESSING_LABEL: [],
-        TIME_SUCCEEDED_LABEL: [],
-    }
 
-    for experiment_id, detailed_result in detailed_results.items():
-        num_batches = len(detailed_result['batchHistories'])
+def normalize_times_per_experiment(times_df):
+    """
+    Shifts the timestamps of every experiment, so that each experiment starts at 0 independent of the others.
+    """
+    grouped = times_df.groupby(EXPERIMENT_ID_LABEL, observed=True, sort=False)
+    start_times = grouped[TIME_REGISTERED_LABEL].transform('min')
 
-        registered_timestamps = get_state_timestamps(detailed_result, 'registered')
-        scheduled_timestamps = get_state_timestamps(detailed_result, 'scheduled')
-        processing_timestamps = get_state_timestamps(detailed_result, 'processing')
-        succeeded_timestamps = get_state_timestamps(detailed_result, 'succeeded')
+    for label in TIMESTAMP_LABELS:
+        if label in times_df.columns:
+            times_df[label] = times_df[label] - start_times
 
-        assert(len(registered_timestamps) == num_batches)
-        assert(len(scheduled_timestamps) == num_batches)
-        assert(len(processing_timestamps) == num_batches)
-        assert(len(succeeded_timestamps) == num_batches)
 
-        data[EXPERIMENT_ID_LABEL].extend([experiment_id] * num_batches)
-        data[TIME_REGISTERED_LABEL].extend(registered_timestamps)
-        data[TIME_SCHEDULED_LABEL].extend(scheduled_timestamps)
-        data[TIME_PROCESSING_LABEL].extend(processing_timestamps)
-        data[TIME_SUCCEEDED_LABEL].extend(succeeded_timestamps)
+def create_results(fetched_experiments, output_format=OUTPUT_FORMAT_BOTH, correct_clock_skew=False):
+    """
+    Creates the result files of the fetched experiments in the results directory.
 
-    return pd.DataFrame(data=data)
+    :param fetched_experiments: A dictionary mapping experiment ids to tuples (cache, batches) as returned by
+                                fetch_experiments() or read_cached_experiments()
+    :param output_format: Write the csv file, the columnar result store or both
+    :param correct_clock_skew: Correct the estimated clock offsets of the nodes before the results are written
+    :return: A tuple (data_frame, quality_report) with the data frame with one row per batch and the data quality report
+             as written to results/data_quality.json
+    """
+    if not os.path.isdir(RESULTS_PATH):
+        os.mkdir(RESULTS_PATH)
 
+    data_frames = []
+    for experiment_id, (cache, batches) in fetched_experiments.items():
+        num_batches = len(batches) if batches is not None else len(cache)
+        with stage('extract timestamps', experiment_id=experiment_id, batches=num_batches):
+            data_frames.append(batches_to_data_frame(experiment_id, cache.iter_batches(), num_batches))
 
-def detailed_results_to_processing_time_data_frame(detailed_results):
-    data = {
-        'experimentId': [],
-        SCHEDULING_DURATION_LABEL: [],
-        PROCESSING_DURATION_LABEL: [],
-        'states': []
-    }
+    with stage('concat data frames'):
+        times_df = concat_data_frames(data_frames)
 
-    for experiment_id, detailed_result in detailed_results.items():
-        num_batches = len(detailed_result['batchHistories'])
+    # the resolution of the timestamps is checked before they are shifted
+    with stage('validate timestamps'):
+        quality_report, out_of_order = check_data_quality(times_df, correct_clock_skew)
 
-        try:
-            scheduled_durations = get_state_durations(detailed_result['batchHistories'], 'scheduled')
-            processing_durations = get_state_durations(detailed_result['batchHistories'], 'processing')
-        except ValueError:
-            raise ValueError('Failed to get durations for experiment "{}"'.format(experiment_id))
+    normalize_times_df(times_df)
+    write_data_quality_report(times_df, quality_report, out_of_order)
+    print_data_quality_report(quality_report)
+
+    if output_format in [OUTPUT_FORMAT_CSV, OUTPUT_FORMAT_BOTH]:
+        with stage('write csv'):
+            times_df.to_csv(RESULT_CSV_PATH)
+    if output_format in [OUTPUT_FORMAT_COLUMNAR, OUTPUT_FORMAT_BOTH]:
+        with stage('write result store'):
+            write_result_store(times_df, RESULT_STORE_PATH)
+    else:
+        # the store is read instead of the csv file, an old one would hide the new results
+        remove_result_store(RESULT_STORE_PATH)
 
-        assert(len(processing_durations) == num_batches)
-        assert(len(scheduled_durations) == num_batches)
+    # keep the run metadata next to the results, so that they can be compared without the executed experiments
+    with open(EXPERIMENT_INFO_PATH, 'w') as experiment_info_file:
+        json.dump(read_experiment_infos(fetched_experiments.keys()), experiment_info_file, indent=2)
 
-        data['experimentId'].extend([experiment_id] * num_batches)
-        data[SCHEDULING_DURATION_LABEL].extend(scheduled_durations)
-        data[PROCESSING_DURATION_LABEL].extend(processing_durations)
-        data['states'].extend(detailed_result['batchStates'])
+    return times_df, quality_report
 
-    return pd.DataFrame(data=data)
 
+def get_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Fetches the batches of executed experiments and creates a csv file.')
 
-def normalize_times_df(times_df):
-    start_time = times_df.min()[TIME_REGISTERED_LABEL]
+    parser.add_argument(
+        '--concurrency', type=int, default=DEFAULT_FETCH_CONCURRENCY,
+        help='The number of batches that are fetched concurrently'
+    )
+    parser.add_argument(
+        '--max-requests-per-second', type=float, default=None,
+        help='Limits the number of requests sent to the agency per second'
+    )
+    parser.add_argument(
+        '--output-format', choices=[OUTPUT_FORMAT_CSV, OUTPUT_FORMAT_COLUMNAR, OUTPUT_FORMAT_BOTH],
+        default=OUTPUT_FORMAT_BOTH,
+        help='Write the results as csv file, as columnar result store or both'
+    )
+    parser.add_argument(
+        '--from-cache', action='store_true',
+        help='Create the results from the cached batches without contacting the agency'
+    )
+    parser.add_argument(
+        '--correct-clock-skew', action='store_true',
+        help='Shift the processing and succeeded timestamps of every node by its estimated clock offset'
+    )
 
-    times_df[TIME_REGISTERED_LABEL] = times_df[TIME_REGISTERED_LABEL] - start_time
-    times_df[TIME_SCHEDULED_LABEL] = times_df[TIME_SCHEDULED_LABEL] - start_time
-    times_df[TIME_PROCESSING_LABEL] = times_df[TIME_PROCESSING_LABEL] - start_time
-    times_df[TIME_SUCCEEDED_LABEL] = times_df[TIME_SUCCEEDED_LABEL] - start_time
+    return parser.parse_args(argv)
 
 
-def main():
-    agency_auth_info = AuthenticationInfo.agency_from_user_input()
+def main(argv=None):
+    args = get_arguments(argv)
 
-    if not os.path.isdir(RESULTS_PATH):
-        os.mkdir(RESULTS_PATH)
+    experiment_ids = get_experiment_ids_from_executed_experiments()
+    if not experiment_ids:
+        print('no executed experiments found in {}, execute an experiment first'.format(EXECUTED_EXPERIMENTS_DIR))
+        return
+    if args.from_cache:
+        fetched_experiments = read_cached_experiments(experiment_ids)
+        if not fetched_experiments:
+            return
+    else:
+        agency_auth_info = AuthenticationInfo.agency_from_user_input()
 
-    detailed_results = {}
-    for experiment_id in get_experiment_ids_from_executed_experiments():
-        detailed_results[experiment_id] = get_detailed_result_with_cache(
-            agency_auth_info.hostname, experiment_id, agency_auth_info.username, agency_auth_info.password
+        fetched_experiments = fetch_experiments(
+            agency_auth_info.hostname, experiment_ids, agency_auth_info.username, agency_auth_info.password,
+            args.concurrency, args.max_requests_per_second
         )
 
-    times_df = detailed_results_to_data_frame(detailed_results)
-
-    normalize_times_df(times_df)
-
-    times_df.to_csv(RESULT_CSV_PATH)
+    create_results(fetched_experiments, args.output_format, args.correct_clock_skew)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,335 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from config import RESULTS_PATH, RESULT_CSV_PATH, RESULT_STORE_PATH, EXPERIMENT_ID_LABEL, NODE_LABEL, \
+    TIME_REGISTERED_LABEL, TIME_SCHEDULED_LABEL, TIME_PROCESSING_LABEL, TIME_SUCCEEDED_LABEL, TIME_FINISHED_LABEL, \
+    TIMESTAMP_LABELS
+from result_store import read_results
+
+DATA_QUALITY_JSON_PATH = os.path.join(RESULTS_PATH, 'data_quality.json')
+OUT_OF_ORDER_CSV_PATH = os.path.join(RESULTS_PATH, 'out_of_order_batches.csv')
+# the report of a check of existing results, which does not replace the report written by the export
+DATA_QUALITY_CHECK_JSON_PATH = os.path.join(RESULTS_PATH, 'data_quality_check.json')
+
+# consecutive state changes of a batch, the second must not happen before the first
+TRANSITIONS = [
+    ('registered_to_scheduled', TIME_REGISTERED_LABEL, TIME_SCHEDULED_LABEL),
+    ('scheduled_to_processing', TIME_SCHEDULED_LABEL, TIME_PROCESSING_LABEL),
+    ('processing_to_succeeded', TIME_PROCESSING_LABEL, TIME_SUCCEEDED_LABEL),
+]
+# the container start is the only transition from a timestamp of the agency to a timestamp of the node
+SKEW_TRANSITION = ('scheduled_to_processing', TIME_SCHEDULED_LABEL, TIME_PROCESSING_LABEL)
+# the timestamps taken on the node running the batch, which are shifted by the clock offset of the node
+NODE_TIMESTAMP_LABELS = [TIME_PROCESSING_LABEL, TIME_SUCCEEDED_LABEL]
+
+# the timestamps are checked for being multiples of these resolutions in seconds, from the coarsest to the finest
+RESOLUTIONS = [1.0, 0.1, 0.01, 0.001]
+# a timestamp is a multiple of a resolution if it differs from the next multiple by less than this fraction of it
+RESOLUTION_TOLERANCE = 1e-3
+# the minimal container start delay of a node is this quantile, which is robust against single skewed batches
+OFFSET_QUANTILE = 0.01
+MIN_BATCHES_PER_NODE = 20
+# the width of the confidence interval of the quantile of a node in standard deviations of the rank of the quantile
+OFFSET_CONFIDENCE_Z = 3.0
+# a significant offset also differs from the median by more than this many interquartile ranges of the node quantiles
+OFFSET_IQR_FACTOR = 3.0
+
+
+def get_resolution(timestamps):
+    """
+    Returns the coarsest resolution of RESOLUTIONS that all timestamps are multiples of, or None if the timestamps are
+    finer than all of them.
+    """
+    timestamps = timestamps[~np.isnan(timestamps)]
+    if len(timestamps) == 0:
+        return None
+    for resolution in RESOLUTIONS:
+        multiples = timestamps / resolution
+        if np.all(np.abs(multiples - np.round(multiples)) < RESOLUTION_TOLERANCE):
+            return resolution
+    return None
+
+
+def get_group_codes(data_frame, label):
+    groups = pd.Categorical(data_frame[label])
+    return np.asarray(groups.categories.astype(str)), groups.codes.astype(np.int64)
+
+
+def count_by_group(mask, group_codes, num_groups):
+    """
+    Returns the number of true values of the mask for every group. Rows with group code -1 (missing) are ignored.
+    """
+    valid = group_codes >= 0
+    return np.bincount(group_codes[valid], weights=mask[valid], minlength=num_groups).astype(np.int64)
+
+
+def get_out_of_order(data_frame):
+    """
+    Returns a data frame with one boolean column per transition, true for the batches whose second state change has an
+    earlier timestamp than the first. Missing timestamps are never out of order.
+    """
+    data = {}
+    for transition, begin_label, end_label in TRANSITIONS:
+        with np.errstate(invalid='ignore'):
+            data[transition] = data_frame[end_label].values < data_frame[begin_label].values
+    return pd.DataFrame(data=data, index=data_frame.index)
+
+
+def get_container_start_delays(data_frame):
+    _, begin_label, end_label = SKEW_TRANSITION
+    return data_frame[end_label].values - data_frame[begin_label].values
+
+
+def estimate_node_offsets(data_frame):
+    """
+    Estimates the clock offset of every node relative to the agency from the container start delays.
+
+    The scheduled timestamp is taken by the agency and the processing timestamp by the node, so the measured delay is
+    the real delay plus the offset of the node. All nodes are assumed to have the same minimal real delay, which is
+    estimated as the median of the OFFSET_QUANTILE quantiles of the delays of every node, or 0 if this median is
+    negative. The offset of a node is the difference between its quantile and this minimal delay.
+
+    The quantile of a node with few batches is noisy, e.g. it is one of the two smallest delays of a node with 80
+    batches. The distribution free confidence interval of the quantile is given by the delays whose ranks differ from
+    the rank of the quantile by OFFSET_CONFIDENCE_Z standard deviations of the binomial distribution. If a bound lies
+    beyond the smallest or largest delay of the node, e.g. the lower bound of the 1% quantile of less than a few hundred
+    delays, it is replaced by the quantile minus or plus OFFSET_IQR_FACTOR interquartile ranges of the quantiles of all
+    nodes. As the minimal delay is itself estimated from noisy quantiles, an offset is significant if the interval of the
+    node does not overlap the median interval of all nodes and if the offset is larger than OFFSET_IQR_FACTOR
+    interquartile ranges. Nodes whose clock is behind and nodes whose clock is ahead of the agency are detected alike.
+
+    :return: A data frame indexed by node with the number of batches, the quantile of the delay, the bounds of its
+             confidence interval, the offset in seconds, NaN for nodes with less than MIN_BATCHES_PER_NODE batches, and
+             whether the offset is significant
+    :rtype: pd.DataFrame
+    """
+    nodes, node_codes = get_group_codes(data_frame, NODE_LABEL)
+    delays = get_container_start_delays(data_frame)
+
+    valid = (node_codes >= 0) & ~np.isnan(delays)
+    order = np.lexsort((delays[valid], node_codes[valid]))
+    # the delays sorted by node and delay, the appended NaN is the delay of the nodes without batches
+    sorted_delays = np.append(delays[valid][order], np.nan)
+    counts = np.bincount(node_codes[valid], minlength=len(nodes))
+    starts = np.cumsum(counts) - counts
+    enough = counts >= MIN_BATCHES_PER_NODE
+
+    def delay_at(ranks, out_of_range=np.nan):
+        in_range = (ranks >= 0) & (ranks < counts)
+        ranks = np.clip(ranks, 0, np.maximum(counts - 1, 0)).astype(np.int64)
+        return np.where(enough, np.where(in_range, sorted_delays[starts + ranks], out_of_range), np.nan)
+
+    # linear interpolation between the neighbouring delays, like pd.Series.quantile()
+    positions = np.maximum(counts - 1, 0) * OFFSET_QUANTILE
+    lower_ranks = np.floor(positions)
+    quantiles = delay_at(lower_ranks) + (positions - lower_ranks) * (delay_at(lower_ranks + 1) - delay_at(lower_ranks))
+
+    # the number of delays below the quantile is binomially distributed. a rank beyond the smallest or largest delay
+    # has no delay, the bound is taken from the spread of all nodes instead.
+    rank_deviations = OFFSET_CONFIDENCE_Z * np.sqrt(counts * OFFSET_QUANTILE * (1 - OFFSET_QUANTILE))
+    delays_low = delay_at(np.floor(counts * OFFSET_QUANTILE - rank_deviations) - 1, -np.inf)
+    delays_high = delay_at(np.ceil(counts * OFFSET_QUANTILE + rank_deviations), np.inf)
+
+    min_delay, significant = 0.0, np.zeros(len(nodes), dtype=bool)
+    if enough.any():
+        min_delay = max(np.nanmedian(quantiles), 0.0)
+        quartiles = np.nanpercentile(quantiles, [25, 75])
+        spread = OFFSET_IQR_FACTOR * (quartiles[1] - quartiles[0])
+        delays_low = np.where(np.isneginf(delays_low), quantiles - spread, delays_low)
+        delays_high = np.where(np.isposinf(delays_high), quantiles + spread, delays_high)
+        with np.errstate(invalid='ignore'):
+            significant = ((delays_low > max(np.nanmedian(delays_high), 0.0)) |
+                           (delays_high < max(np.nanmedian(delays_low), 0.0))) & \
+                (np.abs(quantiles - min_delay) > spread)
+
+    return pd.DataFrame(
+        data={
+            'batches': counts,
+            'delay_quantile': quantiles,
+            'delay_low': delays_low,
+            'delay_high': delays_high,
+            'offset': quantiles - min_delay,
+            'significant': significant,
+        },
+        index=pd.Index(nodes, name=NODE_LABEL)
+    )
+
+
+def get_batch_offsets(data_frame, offsets):
+    """
+    Returns the offset of the node of every batch, 0 for batches on other nodes or without node.
+
+    :param offsets: The offsets as series indexed by node
+    """
+    nodes, node_codes = get_group_codes(data_frame, NODE_LABEL)
+    offset_by_code = offsets.reindex(nodes).fillna(0.0).values
+    return np.where(node_codes >= 0, offset_by_code[node_codes], 0.0)
+
+
+def correct_clock_skew(data_frame, node_offsets):
+    """
+    Subtracts the offset of the node of every batch from its node timestamps, in place. All significant offsets are
+    corrected: a node whose clock is behind the agency causes out-of-order container starts, a node whose clock is ahead
+    inflates the container start latencies. The finished timestamp is corrected if it is the succeeded timestamp.
+
+    :return: The corrected offsets by node
+    """
+    offsets = node_offsets['offset'][node_offsets['significant']]
+    if offsets.empty:
+        return offsets
+
+    batch_offsets = get_batch_offsets(data_frame, offsets)
+
+    if TIME_FINISHED_LABEL in data_frame.columns:
+        finished_is_succeeded = data_frame[TIME_FINISHED_LABEL].values == data_frame[TIME_SUCCEEDED_LABEL].values
+        data_frame[TIME_FINISHED_LABEL] = np.where(
+            finished_is_succeeded, data_frame[TIME_FINISHED_LABEL].values - batch_offsets,
+            data_frame[TIME_FINISHED_LABEL].values
+        )
+    for label in NODE_TIMESTAMP_LABELS:
+        data_frame[label] = data_frame[label].values - batch_offsets
+    return offsets
+
+
+def summarize_out_of_order(data_frame, out_of_order, label):
+    names, codes = get_group_codes(data_frame, label)
+    summary = {name: {} for name in names}
+    for transition in out_of_order.columns:
+        for name, count in zip(names, count_by_group(out_of_order[transition].values, codes, len(names))):
+            summary[name][transition] = int(count)
+    return summary
+
+
+def validate_timestamps(data_frame, check_resolutions=True):
+    """
+    Checks the timestamps of all batches in a few vectorized passes: the out-of-order transitions in total, per
+    experiment and per node, the zero and negative durations and the resolution of every timestamp column, and
+    estimates the clock offset of every node.
+
+    :param check_resolutions: Whether to check the resolutions. The timestamps of written results are normalized to the
+                              start of their experiment, which changes their resolution, so the resolutions are only
+                              reported as None for them.
+
+    :return: A tuple (report, out_of_order, node_offsets) with the report as dictionary, the out-of-order flags of every
+             batch as returned by get_out_of_order() and the node offsets as returned by estimate_node_offsets()
+    """
+    out_of_order = get_out_of_order(data_frame)
+
+    transitions = {}
+    for transition, begin_label, end_label in TRANSITIONS:
+        durations = data_frame[end_label].values - data_frame[begin_label].values
+        durations = durations[~np.isnan(durations)]
+        transitions[transition] = {
+            'batches': len(durations),
+            'out_of_order': int(out_of_order[transition].sum()),
+            'zero_duration': int(np.sum(durations == 0)),
+            'min_duration': float(durations.min()) if len(durations) else None,
+        }
+
+    report = {
+        'batches': len(data_frame),
+        'out_of_order_batches': int(out_of_order.any(axis=1).sum()),
+        'transitions': transitions,
+        'resolutions': {
+            label: get_resolution(data_frame[label].values)
+            for label in TIMESTAMP_LABELS if label in data_frame.columns
+        } if check_resolutions else None,
+        'experiments': summarize_out_of_order(data_frame, out_of_order, EXPERIMENT_ID_LABEL),
+    }
+
+    node_offsets = None
+    if NODE_LABEL in data_frame.columns:
+        node_offsets = estimate_node_offsets(data_frame)
+        node_summary = summarize_out_of_order(data_frame, out_of_order, NODE_LABEL)
+        for node, row in node_offsets.iterrows():
+            node_summary[node]['offset'] = None if np.isnan(row['offset']) else float(row['offset'])
+            node_summary[node]['skewed'] = bool(row['significant'])
+        report['nodes'] = node_summary
+        report['skewed_nodes'] = [node for node, summary in node_summary.items() if summary['skewed']]
+
+    return report, out_of_order, node_offsets
+
+
+def check_data_quality(data_frame, correct=False, check_resolutions=True):
+    """
+    Validates the timestamps and, if correct is True, corrects the clock offsets of the nodes in place and validates the
+    corrected timestamps again.
+
+    :return: A tuple (report, out_of_order) with the report and the out-of-order flags of the uncorrected timestamps
+    """
+    report, out_of_order, node_offsets = validate_timestamps(data_frame, check_resolutions)
+    report['corrected_offsets'] = {}
+
+    if correct and node_offsets is not None:
+        offsets = correct_clock_skew(data_frame, node_offsets)
+        report['corrected_offsets'] = {node: float(offset) for node, offset in offsets.items()}
+        if not offsets.empty:
+            corrected_report, _, _ = validate_timestamps(data_frame, check_resolutions=False)
+            report['after_correction'] = {
+                'out_of_order_batches': corrected_report['out_of_order_batches'],
+                'transitions': corrected_report['transitions'],
+            }
+
+    return report, out_of_order
+
+
+def write_data_quality_report(data_frame, report, out_of_order):
+    """
+    Writes the report to results/data_quality.json and the out-of-order batches to results/out_of_order_batches.csv.
+    """
+    with open(DATA_QUALITY_JSON_PATH, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+
+    flagged = out_of_order.any(axis=1).values
+    data_frame[flagged].join(out_of_order[flagged].add_prefix('out_of_order_')).to_csv(OUT_OF_ORDER_CSV_PATH)
+
+
+def print_data_quality_report(report):
+    print('{} of {} batches have out-of-order timestamps'.format(report['out_of_order_batches'], report['batches']))
+    for transition, summary in report['transitions'].items():
+        if summary['out_of_order']:
+            print('  {}: {} out of order, min duration {:.3f} sec'.format(
+                transition, summary['out_of_order'], summary['min_duration']
+            ))
+    for node in report.get('skewed_nodes', []):
+        print('  node {} has an estimated clock offset of {:.3f} sec'.format(node, report['nodes'][node]['offset']))
+    if report['corrected_offsets']:
+        print('corrected the clock offsets of {} nodes, {} batches are still out of order'.format(
+            len(report['corrected_offsets']), report['after_correction']['out_of_order_batches']
+        ))
+
+
+def get_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Checks the timestamps of the results for out-of-order state changes and the clock offsets of the '
+                    'nodes. The resolutions of the timestamps are only checked by create_csv.py, as the timestamps of '
+                    'the results are normalized.'
+    )
+
+    parser.add_argument(
+        '--output', default=DATA_QUALITY_CHECK_JSON_PATH,
+        help='The file the report is written to, {} by default. The report of create_csv.py is kept.'.format(
+            DATA_QUALITY_CHECK_JSON_PATH
+        )
+    )
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = get_arguments(argv)
+
+    data_frame = read_results(RESULT_STORE_PATH, RESULT_CSV_PATH)
+
+    report, _ = check_data_quality(data_frame, check_resolutions=False)
+    with open(args.output, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+    print_data_quality_report(report)
+
+
+if __name__ == '__main__':
+    main()
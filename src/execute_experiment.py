@@ -1,41 +1,44 @@
 import argparse
-import copy
+import csv
 import json
 import os
 import subprocess
 import tempfile
+import threading
 import time
-from collections import defaultdict
-from getpass import getpass
+from multiprocessing.pool import ThreadPool
 
 import requests
-from ruamel.yaml import YAML
 
-TEMPLATE_PATH = 'experiment_templates/echo_template.red'
+from arrival_patterns import ARRIVAL_PATTERNS, REQUIRED_ARGUMENTS, get_arrivals
+from config import TEMPLATE_PATH, EXECUTED_EXPERIMENTS_DIR, MONITORING_DIR, FINISHED_STATES, BATCH_STATES, \
+    MONITOR_MODE_COUNT, MONITOR_MODE_FULL, SUBMIT_MODE_FAICE, SUBMIT_MODE_DIRECT, DEFAULT_LIVE_WINDOW, \
+    DEFAULT_STALL_TIMEOUT, DEFAULT_PLOT_INTERVAL, AuthenticationInfo, get_state_dict, check_finished
+from instrumentation import stage, record_operation
 
-EXECUTED_EXPERIMENTS_DIR = 'executed_experiments'
 DEFAULT_NUM_BATCHES = 10000
 
-yaml = YAML(typ='safe')
-yaml.default_flow_style = False
+MIN_POLL_INTERVAL = 2
+MAX_POLL_INTERVAL = 30
+MONITOR_TIMEOUT = 30
+BATCH_WRITE_CHUNK_SIZE = 1000
 
+SUBMIT_TIMEOUT = 300
 
-class AuthenticationInfo:
-    def __init__(self, hostname, username, password):
-        self.hostname = hostname
-        self.username = username
-        self.password = password
+DEFAULT_BATCHES_PER_ARRIVAL = 100
+DEFAULT_SUBMISSION_CONCURRENCY = 8
+
+AGENCY_INFO_TIMEOUT = 10
 
-    @staticmethod
-    def agency_from_user_input():
-        hostname = input('agency url: ')
-        username = input('agency username: ')
-        password = getpass('agency password: ')
 
-        if hostname.endswith('/'):
-            hostname = hostname[:-1]
+def load_yaml(stream):
+    """
+    Parses the given yaml document. ruamel.yaml is only imported here, so that programs importing this module for
+    monitoring do not load it.
+    """
+    from ruamel.yaml import YAML
 
-        return AuthenticationInfo(hostname, username, password)
+    return YAML(typ='safe').load(stream)
 
 
 def set_authentication_info(data, agency_auth_info):
@@ -44,51 +47,272 @@ def set_authentication_info(data, agency_auth_info):
     data['execution']['settings']['access']['auth']['password'] = agency_auth_info.password
 
 
-def multiply_batches(template_data, num_batches):
-    first_batch = template_data['batches'][0]
-    new_batches = []
-    for i in range(num_batches):
-        new_batch = copy.deepcopy(first_batch)
-        new_batches.append(new_batch)
+def write_experiment_file(template_data, num_batches, experiment_file):
+    """
+    Writes the template RED data as JSON with num_batches copies of its first batch.
+
+    The batch is serialized once and its copies are streamed to the file in chunks, so the memory usage does not grow
+    with num_batches.
+
+    :param template_data: The RED data whose first batch is multiplied
+    :param num_batches: The number of batches in the written experiment
+    :param experiment_file: A file object opened for writing text
+    """
+    batch_json = json.dumps(template_data['batches'][0])
+
+    experiment_file.write('{')
+    for key, value in template_data.items():
+        if key != 'batches':
+            experiment_file.write('{}: {}, '.format(json.dumps(key), json.dumps(value)))
+
+    experiment_file.write('"batches": [')
+    for chunk_start in range(0, num_batches, BATCH_WRITE_CHUNK_SIZE):
+        chunk_size = min(BATCH_WRITE_CHUNK_SIZE, num_batches - chunk_start)
+        if chunk_start > 0:
+            experiment_file.write(', ')
+        experiment_file.write(', '.join([batch_json] * chunk_size))
+    experiment_file.write(']}')
 
-    template_data['batches'] = new_batches
 
+def split_batches(num_batches, batches_per_submission=None):
+    """
+    Returns the number of batches of every submission, if num_batches are submitted in experiments of at most
+    batches_per_submission batches.
+    """
+    if not batches_per_submission or batches_per_submission >= num_batches:
+        return [num_batches]
 
-def get_arguments():
+    submission_sizes = [batches_per_submission] * (num_batches // batches_per_submission)
+    if num_batches % batches_per_submission:
+        submission_sizes.append(num_batches % batches_per_submission)
+    return submission_sizes
+
+
+def add_monitor_arguments(parser):
+    parser.add_argument(
+        '--monitor-mode', choices=[MONITOR_MODE_COUNT, MONITOR_MODE_FULL], default=MONITOR_MODE_COUNT,
+        help='Monitor the experiment with one count query per state or by fetching the list of all batches'
+    )
+
+    live_group = parser.add_argument_group(
+        'live dashboard', 'Show the state counts and transitions per second of the running experiment while it runs.'
+    )
+    live_group.add_argument('--live', action='store_true', help='Show the live dashboard')
+    live_group.add_argument(
+        '--live-window', type=int, default=DEFAULT_LIVE_WINDOW,
+        help='The number of polls kept in memory and shown by the dashboard'
+    )
+    live_group.add_argument(
+        '--stall-timeout', type=float, default=DEFAULT_STALL_TIMEOUT,
+        help='Warn if no batch changed its state for this many seconds'
+    )
+    live_group.add_argument(
+        '--plot-interval', type=float, default=DEFAULT_PLOT_INTERVAL,
+        help='Seconds between updates of monitoring/<experiment-id>.png, 0 disables the plot'
+    )
+
+
+def get_arguments(argv=None):
     parser = argparse.ArgumentParser(description='Executes test experiments on a cc-agency.')
 
     parser.add_argument(
         '--num-batches', type=int, default=DEFAULT_NUM_BATCHES, help='The template RED file whose batch is multiplied'
     )
+    parser.add_argument(
+        '--batches-per-submission', type=int, default=None,
+        help='Split the batches into several experiments with at most this number of batches'
+    )
+    parser.add_argument(
+        '--submit-mode', choices=[SUBMIT_MODE_FAICE, SUBMIT_MODE_DIRECT], default=SUBMIT_MODE_FAICE,
+        help='Submit experiments with "faice exec", which validates the RED file, or post them directly to the agency'
+    )
+    parser.add_argument(
+        '--label', default=None,
+        help='A name for this run (e.g. the agency configuration), used to tell runs apart when comparing them'
+    )
 
-    return parser.parse_args()
+    add_monitor_arguments(parser)
 
+    load_group = parser.add_argument_group(
+        'load generation',
+        'Submit experiments over time according to an arrival pattern instead of submitting --num-batches at once. '
+        'Every arrival submits --batches-per-submission batches (default {}).'.format(DEFAULT_BATCHES_PER_ARRIVAL)
+    )
+    load_group.add_argument('--arrival-pattern', choices=ARRIVAL_PATTERNS, default=None, help='The arrival pattern')
+    load_group.add_argument(
+        '--rate', type=float, default=None, help='Submissions per second (constant, poisson) or start rate (ramp)'
+    )
+    load_group.add_argument('--end-rate', type=float, default=None, help='Submissions per second at the end of a ramp')
+    load_group.add_argument('--duration', type=float, default=None, help='Duration of the load in seconds')
+    load_group.add_argument(
+        '--step-rates', type=lambda v: [float(r) for r in v.split(',')], default=None,
+        help='Comma separated submissions per second of the steps'
+    )
+    load_group.add_argument('--step-duration', type=float, default=None, help='Duration of every step in seconds')
+    load_group.add_argument(
+        '--trace-file', default=None,
+        help='File with one submission per line: the offset in seconds and optionally the number of batches'
+    )
+    load_group.add_argument('--seed', type=int, default=None, help='Random seed of the poisson arrivals')
+    load_group.add_argument(
+        '--submission-concurrency', type=int, default=DEFAULT_SUBMISSION_CONCURRENCY,
+        help='The maximal number of submissions in progress at the same time'
+    )
 
-def execute_experiment(data):
+    args = parser.parse_args(argv)
+    if args.arrival_pattern:
+        check_arrival_arguments(parser, args)
+    return args
+
+
+def check_arrival_arguments(parser, args):
+    """
+    Exits with an error message if an option the arrival pattern needs is missing or a rate or duration is not positive.
+    """
+    missing = [
+        '--' + destination.replace('_', '-') for destination in REQUIRED_ARGUMENTS[args.arrival_pattern]
+        if getattr(args, destination) is None
+    ]
+    if missing:
+        parser.error('the {} arrival pattern requires {}'.format(args.arrival_pattern, ', '.join(missing)))
+
+    for destination in ['rate', 'duration', 'step_duration']:
+        value = getattr(args, destination)
+        if value is not None and value <= 0:
+            parser.error('--{} must be positive'.format(destination.replace('_', '-')))
+    if args.end_rate is not None and args.end_rate < 0:
+        parser.error('--end-rate must not be negative')
+    if args.step_rates is not None and (min(args.step_rates) < 0 or max(args.step_rates) <= 0):
+        parser.error('--step-rates must not be negative and at least one must be positive')
+
+
+def execute_experiment(template_data, num_batches):
     with tempfile.NamedTemporaryFile(mode='w') as execution_file:
-        json.dump(data, execution_file)
+        with stage('write experiment file', num_batches=num_batches):
+            write_experiment_file(template_data, num_batches, execution_file)
 
-        execution_file.flush()
+            execution_file.flush()
 
-        execution_result = subprocess.run(
-            ['faice', 'exec', execution_file.name, '--debug', '--disable-retry'],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )  # type: subprocess.CompletedProcess
+        with stage('faice exec', num_batches=num_batches):
+            execution_result = subprocess.run(
+                ['faice', 'exec', execution_file.name, '--debug', '--disable-retry'],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )  # type: subprocess.CompletedProcess
 
     try:
-        return yaml.load(execution_result.stdout)['response']['experimentId']
+        return load_yaml(execution_result.stdout)['response']['experimentId']
     except Exception as e:
         print('failed to execute experiment. faice stdout: {}'.format(execution_result.stdout))
         raise e
 
 
-def dump_experiment_info(experiment_id):
-    print('executing experiment {}'.format(experiment_id))
+def get_direct_submission_data(template_data):
+    """
+    Returns a copy of the template RED data as it is posted to the agency. Like "faice exec --disable-retry" the access
+    information is removed and retries of failed batches are disabled. Only the modified parts are copied.
+    """
+    settings = dict(template_data['execution']['settings'])
+    settings.pop('access', None)
+    settings['retryIfFailed'] = False
+
+    data = dict(template_data)
+    data['execution'] = dict(template_data['execution'])
+    data['execution']['settings'] = settings
+    return data
+
+
+class AgencySubmitter:
+    """
+    Submits experiments by posting the RED data directly to the red endpoint of the agency. The submissions of every
+    thread reuse one keep-alive session, which avoids starting a faice process per experiment. Like the WorkerSessions
+    of create_csv.py every thread has its own session, as a session is not safe to share between threads.
+    """
+    def __init__(self, agency_auth_info):
+        self.agency_auth_info = agency_auth_info
+        self.local = threading.local()
+
+    def get_session(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.auth = (self.agency_auth_info.username, self.agency_auth_info.password)
+            self.local.session = session
+        return session
+
+    def __call__(self, template_data, num_batches):
+        with tempfile.TemporaryFile(mode='w+') as execution_file:
+            with stage('write experiment file', num_batches=num_batches):
+                write_experiment_file(get_direct_submission_data(template_data), num_batches, execution_file)
+                execution_file.flush()
+                num_bytes = execution_file.tell()
+                execution_file.seek(0)
+
+            start_time = time.perf_counter()
+            resp = self.get_session().post(
+                '{}/{}'.format(self.agency_auth_info.hostname, 'red'),
+                data=execution_file,
+                headers={'Content-Type': 'application/json'},
+                timeout=SUBMIT_TIMEOUT
+            )
+            record_operation('submit experiment', start_time, time.perf_counter() - start_time, num_bytes)
+
+        if resp.status_code != 200:
+            raise Exception('failed to execute experiment. agency response ({}): {}'.format(resp.status_code, resp.text))
+
+        return resp.json()['experimentId']
+
+
+def get_agency_info(agency_auth_info):
+    """
+    Asks the agency for its version and its nodes. Information the agency does not provide is None.
+
+    :return: A dictionary containing 'agencyVersion' and 'numNodes'
+    """
+    auth = (agency_auth_info.username, agency_auth_info.password)
+    agency_info = {'agencyVersion': None, 'numNodes': None}
+
+    try:
+        resp = requests.get('{}/version'.format(agency_auth_info.hostname), auth=auth, timeout=AGENCY_INFO_TIMEOUT)
+        resp.raise_for_status()
+        agency_info['agencyVersion'] = resp.json().get('agencyVersion')
+    except (requests.RequestException, ValueError, AttributeError) as e:
+        print('could not get agency version: {}'.format(e))
+
+    try:
+        resp = requests.get('{}/nodes'.format(agency_auth_info.hostname), auth=auth, timeout=AGENCY_INFO_TIMEOUT)
+        resp.raise_for_status()
+        agency_info['numNodes'] = len(resp.json())
+    except (requests.RequestException, ValueError, TypeError) as e:
+        print('could not get agency nodes: {}'.format(e))
+
+    return agency_info
+
+
+def get_run_info(agency_auth_info, template_data, label=None, submit_mode=SUBMIT_MODE_FAICE, arrival_pattern=None):
+    """
+    Returns the metadata of this run, that is stored with every experiment submitted by it, so that runs with different
+    agency configurations can be compared later.
+    """
+    run_info = {
+        'label': label,
+        'runStartTime': time.time(),
+        'batchConcurrencyLimit': template_data['execution']['settings'].get('batchConcurrencyLimit'),
+        'submitMode': submit_mode,
+        'arrivalPattern': arrival_pattern,
+    }
+    run_info.update(get_agency_info(agency_auth_info))
+    return run_info
+
+
+def dump_experiment_info(experiment_id, submission_info=None):
+    print('executing experiment {}'.format(experiment_id), flush=True)
 
     info_data = {
         'experimentId': experiment_id,
     }
+    if submission_info:
+        info_data.update(submission_info)
 
     dump_path = os.path.join(EXECUTED_EXPERIMENTS_DIR, experiment_id + '.json')
 
@@ -96,43 +320,237 @@ def dump_experiment_info(experiment_id):
         json.dump(info_data, experiment_info_file)
 
 
-def get_batches(agency, username, pw, experiment_id):
+class TimedSubmission:
+    """
+    Submits one experiment and records when it was scheduled, when it was submitted and how long the submission took,
+    together with the metadata of the run.
+    """
+    def __init__(self, submit_experiment, template_data, load_start_time=None, run_info=None):
+        self.submit_experiment = submit_experiment
+        self.template_data = template_data
+        self.load_start_time = load_start_time
+        self.run_info = run_info or {}
+
+    def __call__(self, num_batches, scheduled_offset=None):
+        submission_time = time.time()
+        experiment_id = self.submit_experiment(self.template_data, num_batches)
+
+        submission_info = dict(self.run_info)
+        submission_info.update({
+            'numBatches': num_batches,
+            'submissionTime': submission_time,
+            'submissionDuration': time.time() - submission_time,
+        })
+        if self.load_start_time is not None:
+            submission_info['scheduledOffset'] = scheduled_offset
+            submission_info['submissionOffset'] = submission_time - self.load_start_time
+
+        dump_experiment_info(experiment_id, submission_info)
+        return experiment_id
+
+
+def run_load(
+        submit_experiment, template_data, arrivals, concurrency=DEFAULT_SUBMISSION_CONCURRENCY, run_info=None
+):
+    """
+    Submits experiments open-loop according to the given arrivals.
+
+    The main thread only waits for the arrival times and hands every submission to a pool of worker threads, so a slow
+    submission does not delay the following ones. Failed submissions are reported and skipped.
+
+    :param submit_experiment: A function submitting the template data with the given number of batches
+    :param arrivals: A list of tuples (offset, num_batches) sorted by the offset in seconds
+    :param run_info: The metadata of the run, stored with every experiment
+    :return: The experiment ids of the successful submissions
+    """
+    start_time = time.monotonic()
+    submission = TimedSubmission(submit_experiment, template_data, time.time(), run_info)
+
+    with ThreadPool(concurrency) as p:
+        results = []
+        for offset, num_batches in arrivals:
+            delay = start_time + offset - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            results.append(p.apply_async(submission, (num_batches, offset)))
+
+        experiment_ids = []
+        for result in results:
+            try:
+                experiment_ids.append(result.get())
+            except Exception as e:
+                print('submission failed: {}'.format(e), flush=True)
+
+    return experiment_ids
+
+
+def get_batches(agency, username, pw, experiment_id, session=None):
     url = '{}/{}?experimentId={}'.format(agency, 'batches', experiment_id)
-    resp = requests.get(url, auth=(username, pw))
+    resp = (session or requests).get(url, auth=(username, pw), timeout=MONITOR_TIMEOUT)
 
     batches = list(filter(lambda b: b['experimentId'] == experiment_id, resp.json()))
 
     return batches
 
 
-def get_state_dict(batches):
-    state_dict = defaultdict(lambda: 0)
-    for batch in batches:
-        state_dict[batch['state']] += 1
-    return dict(state_dict)
-
-
-def check_finished(state_dict):
-    return all(map(lambda k: k in ['succeeded', 'failed', 'cancelled'], state_dict.keys()))
-
+def get_batch_count(agency, username, pw, experiment_id, state, session=None):
+    url = '{}/{}'.format(agency, 'batches/count')
+    resp = (session or requests).get(
+        url, params={'experimentId': experiment_id, 'state': state}, auth=(username, pw), timeout=MONITOR_TIMEOUT
+    )
+    resp.raise_for_status()
 
-def run_while_working(agency, experiment_id, username, pw, verbose=False):
-    while True:
-        batches = get_batches(agency, username, pw, experiment_id)
-        state_dict = get_state_dict(batches)
+    return resp.json()['count']
 
-        if check_finished(state_dict):
-            if verbose:
-                print('{: <100}'.format(str(state_dict)), flush=True)
-            return state_dict
-        elif verbose:
-            print('{: <100}'.format(str(state_dict)), end='\r', flush=True)
 
-        time.sleep(2)
+class StateCountPoller:
+    """
+    Queries the number of batches in each state of an experiment.
 
+    In count mode only one count query per state is sent, instead of downloading the documents of all batches. If the
+    agency does not support count queries, the poller falls back to fetching the full batch list.
+    """
+    def __init__(self, agency, username, pw, experiment_id, mode=MONITOR_MODE_COUNT):
+        self.agency = agency
+        self.username = username
+        self.pw = pw
+        self.experiment_id = experiment_id
+        self.mode = mode
+        self.session = requests.Session()
+
+    def _count_states(self):
+        state_dict = {}
+        for state in BATCH_STATES:
+            count = get_batch_count(self.agency, self.username, self.pw, self.experiment_id, state, self.session)
+            if count:
+                state_dict[state] = count
+        return state_dict
+
+    def poll(self):
+        start_time = time.perf_counter()
+        state_dict = self._poll()
+        record_operation('poll {}'.format(self.mode), start_time, time.perf_counter() - start_time)
+        return state_dict
+
+    def _poll(self):
+        if self.mode == MONITOR_MODE_COUNT:
+            try:
+                return self._count_states()
+            except (requests.HTTPError, ValueError, KeyError):
+                print('agency does not support count queries, fetching full batch lists instead', flush=True)
+                self.mode = MONITOR_MODE_FULL
+
+        batches = get_batches(self.agency, self.username, self.pw, self.experiment_id, self.session)
+        return get_state_dict(batches)
+
+
+class PollBackoff:
+    """
+    Doubles the poll interval while the state counts do not change and resets it on every change.
+    """
+    def __init__(self, min_interval=MIN_POLL_INTERVAL, max_interval=MAX_POLL_INTERVAL):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.last_state_dict = None
+
+    def next_interval(self, state_dict):
+        if state_dict == self.last_state_dict:
+            self.interval = min(self.interval * 2, self.max_interval)
+        else:
+            self.interval = self.min_interval
+        self.last_state_dict = state_dict
+        return self.interval
+
+
+class StateCountRecorder:
+    """
+    Appends the state counts of every poll to monitoring/<experiment_id>.csv.
+    """
+    def __init__(self, experiment_id):
+        if not os.path.isdir(MONITORING_DIR):
+            os.mkdir(MONITORING_DIR)
+
+        path = os.path.join(MONITORING_DIR, '{}.csv'.format(experiment_id))
+        write_header = not os.path.isfile(path)
+
+        self.file = open(path, 'a', newline='')
+        self.writer = csv.writer(self.file)
+        if write_header:
+            self.writer.writerow(['time'] + BATCH_STATES)
+
+    def record(self, timestamp, state_dict):
+        self.writer.writerow([timestamp] + [state_dict.get(state, 0) for state in BATCH_STATES])
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def run_while_working(
+        agency, experiment_id, username, pw, verbose=False, mode=MONITOR_MODE_COUNT, record=True, dashboard=None
+):
+    """
+    Polls the state counts of the experiment until all batches are finished.
+
+    :param dashboard: A LiveDashboard that is updated after every poll instead of printing the state counts. The
+                      experiment is then polled every MIN_POLL_INTERVAL seconds without backoff, so the dashboard also
+                      shows when the experiment stalls.
+    :return: The final state counts
+    """
+    poller = StateCountPoller(agency, username, pw, experiment_id, mode)
+    backoff = PollBackoff() if dashboard is None else PollBackoff(max_interval=MIN_POLL_INTERVAL)
+    recorder = StateCountRecorder(experiment_id) if record else None
+    # the dashboard replaces the printed state counts
+    verbose = verbose and dashboard is None
 
-def main():
-    args = get_arguments()
+    try:
+        while True:
+            state_dict = poller.poll()
+            timestamp = time.time()
+            if recorder is not None:
+                recorder.record(timestamp, state_dict)
+            if dashboard is not None:
+                dashboard.update(timestamp, state_dict)
+
+            if check_finished(state_dict):
+                if verbose:
+                    print('{: <100}'.format(str(state_dict)), flush=True)
+                return state_dict
+            elif verbose:
+                print('{: <100}'.format(str(state_dict)), end='\r', flush=True)
+
+            time.sleep(backoff.next_interval(state_dict))
+    finally:
+        if recorder is not None:
+            recorder.close()
+        if dashboard is not None:
+            dashboard.close()
+
+
+def monitor_experiments(agency_auth_info, experiment_ids, args):
+    """
+    Waits until the given experiments are finished, one after the other, with the monitor options of
+    add_monitor_arguments().
+    """
+    for experiment_id in experiment_ids:
+        dashboard = None
+        if args.live:
+            # numpy is only needed for the dashboard
+            from live_dashboard import LiveDashboard
+
+            dashboard = LiveDashboard(
+                experiment_id, BATCH_STATES, FINISHED_STATES, MONITORING_DIR, args.live_window, args.stall_timeout,
+                args.plot_interval
+            )
+        run_while_working(
+            agency_auth_info.hostname, experiment_id, agency_auth_info.username, agency_auth_info.password,
+            verbose=True, mode=args.monitor_mode, dashboard=dashboard
+        )
+
+
+def main(argv=None):
+    args = get_arguments(argv)
 
     agency_auth_info = AuthenticationInfo.agency_from_user_input()
 
@@ -140,19 +558,34 @@ def main():
         os.mkdir(EXECUTED_EXPERIMENTS_DIR)
 
     with open(TEMPLATE_PATH, 'r') as experiment_template:
-        experiment_data = yaml.load(experiment_template)
+        experiment_data = load_yaml(experiment_template)
 
     set_authentication_info(experiment_data, agency_auth_info)
 
-    multiply_batches(experiment_data, args.num_batches)
-
-    experiment_id = execute_experiment(experiment_data)
-
-    dump_experiment_info(experiment_id)
-
-    run_while_working(
-        agency_auth_info.hostname, experiment_id, agency_auth_info.username, agency_auth_info.password, verbose=True
-    )
+    run_info = get_run_info(agency_auth_info, experiment_data, args.label, args.submit_mode, args.arrival_pattern)
+
+    if args.submit_mode == SUBMIT_MODE_DIRECT:
+        submit_experiment = AgencySubmitter(agency_auth_info)
+    else:
+        submit_experiment = execute_experiment
+
+    if args.arrival_pattern:
+        arrivals = get_arrivals(
+            args.arrival_pattern, args.batches_per_submission or DEFAULT_BATCHES_PER_ARRIVAL, rate=args.rate,
+            duration=args.duration, end_rate=args.end_rate, step_rates=args.step_rates,
+            step_duration=args.step_duration, trace_path=args.trace_file, seed=args.seed
+        )
+        print('submitting {} experiments with {} arrival pattern'.format(len(arrivals), args.arrival_pattern))
+        experiment_ids = run_load(
+            submit_experiment, experiment_data, arrivals, args.submission_concurrency, run_info
+        )
+    else:
+        submission = TimedSubmission(submit_experiment, experiment_data, run_info=run_info)
+        experiment_ids = [
+            submission(num_batches) for num_batches in split_batches(args.num_batches, args.batches_per_submission)
+        ]
+
+    monitor_experiments(agency_auth_info, experiment_ids, args)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,89 @@
+from multiprocessing import Pool
+
+import numpy as np
+from matplotlib.figure import Figure
+
+# long series are reduced to about this many points per line, which is more than a figure has pixels in width
+DEFAULT_MAX_POINTS = 4000
+DEFAULT_FORMATS = ['pdf']
+
+LINE_PLOT = 'line'
+STAIRS_PLOT = 'stairs'
+
+
+def downsample_min_max(x, y, max_points=DEFAULT_MAX_POINTS):
+    """
+    Reduces a series to at most max_points points by splitting it into equally sized buckets and keeping the first,
+    the last, the minimal and the maximal point of every bucket in their original order. Unlike averaging this keeps
+    every peak of the series, which matters for queue lengths and state counts.
+
+    :param x: The increasing x values
+    :param y: The y values
+    :param max_points: The maximal number of points returned
+    :return: A tuple (x, y) of the kept points
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(x) <= max_points:
+        return x, y
+
+    num_buckets = max(max_points // 4, 1)
+    bucket_edges = np.linspace(0, len(x), num_buckets + 1).astype(np.int64)
+    bucket_ids = np.repeat(np.arange(num_buckets), np.diff(bucket_edges))
+
+    # sorted by bucket and within a bucket by value, so the minimum is at the start and the maximum at the end
+    by_value = np.lexsort((y, bucket_ids))
+    keep = np.unique(np.concatenate([
+        bucket_edges[:-1], bucket_edges[1:] - 1, by_value[bucket_edges[:-1]], by_value[bucket_edges[1:] - 1]
+    ]))
+    return x[keep], y[keep]
+
+
+def save_figure(fig, path, formats=None):
+    """
+    Saves the figure as path.<format> for every format, e.g. pdf and png.
+    """
+    for output_format in formats or DEFAULT_FORMATS:
+        fig.savefig('{}.{}'.format(path, output_format), bbox_inches='tight')
+
+
+def render_figure(job):
+    """
+    Renders a single figure described by a dictionary, so that it can be sent to a worker process.
+
+    The job contains the 'kind' of the plot, the 'path' without extension and the 'formats' to write and a list of
+    'axes'. Every axis is a dictionary with its 'xlabel', 'ylabel' and 'series', a list of (label, x, y) tuples. For
+    line plots x and y have the same length, for stairs plots x contains the bin edges.
+    """
+    axes_jobs = job['axes']
+    fig = Figure()
+    axes = fig.subplots(len(axes_jobs), 1, sharex=True, squeeze=False)[:, 0]
+
+    for ax, axis_job in zip(axes, axes_jobs):
+        for label, x, y in axis_job['series']:
+            if job['kind'] == LINE_PLOT:
+                x, y = downsample_min_max(x, y, job.get('max_points', DEFAULT_MAX_POINTS))
+                ax.step(x, y, where='post', label=label, linewidth=1)
+            else:
+                # color=None would disable the color cycle, so the series of one axis could not be told apart
+                color = axis_job.get('color')
+                ax.stairs(y, x, label=label, fill=axis_job.get('fill', False), **({'color': color} if color else {}))
+        ax.set_xlabel(axis_job.get('xlabel', ''))
+        ax.set_ylabel(axis_job.get('ylabel', ''))
+        if any(label for label, _, _ in axis_job['series']):
+            ax.legend()
+
+    save_figure(fig, job['path'], job['formats'])
+    return job['path']
+
+
+def render_figures(jobs, processes=None):
+    """
+    Renders the figures, in parallel worker processes if processes is larger than one.
+
+    :return: The paths of the rendered figures without extension
+    """
+    if (processes is not None and processes <= 1) or len(jobs) <= 1:
+        return [render_figure(job) for job in jobs]
+    with Pool(min(processes or len(jobs), len(jobs))) as pool:
+        return pool.map(render_figure, jobs)
@@ -0,0 +1,256 @@
+import cProfile
+import json
+import math
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# only this many operations are exported as single trace events, all operations are part of the histograms
+MAX_OPERATION_EVENTS = 100000
+NUM_PROFILE_ENTRIES = 20
+NUM_TOP_ALLOCATIONS = 10
+HISTOGRAM_BASE_MS = 0.125
+
+_instrumentation = None
+
+
+def get_peak_rss_mb():
+    """
+    Returns the peak resident memory of this process in MiB, or None if the platform does not report it.
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is given in KiB on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def get_percentile(sorted_values, percentile):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(math.ceil(percentile * len(sorted_values))) - 1, len(sorted_values) - 1)]
+
+
+def get_histogram(durations_ms):
+    """
+    Counts the durations in buckets whose upper bounds double, starting at HISTOGRAM_BASE_MS.
+
+    :return: A dictionary mapping the upper bound of every non empty bucket in milliseconds to its count
+    """
+    counts = {}
+    for duration_ms in durations_ms:
+        bucket = max(0, int(math.ceil(math.log2(max(duration_ms, 1e-9) / HISTOGRAM_BASE_MS))))
+        counts[bucket] = counts.get(bucket, 0) + 1
+    return {HISTOGRAM_BASE_MS * 2 ** bucket: counts[bucket] for bucket in sorted(counts)}
+
+
+class Operation:
+    def __init__(self):
+        self.durations = []
+        self.num_bytes = 0
+
+    def summary(self):
+        durations_ms = sorted(duration * 1000 for duration in self.durations)
+        return {
+            'count': len(durations_ms),
+            'total_ms': sum(durations_ms),
+            'bytes': self.num_bytes,
+            'p50_ms': get_percentile(durations_ms, 0.5),
+            'p90_ms': get_percentile(durations_ms, 0.9),
+            'p99_ms': get_percentile(durations_ms, 0.99),
+            'max_ms': durations_ms[-1] if durations_ms else 0.0,
+            'histogram_ms': get_histogram(durations_ms),
+        }
+
+
+class Instrumentation:
+    """
+    Records the wall time of the stages of a program and the latency and size of single operations like requests.
+
+    Stages are recorded as trace events with the peak memory at their end. Operations are collected per name for
+    latency histograms. The events can be written in the Chrome trace format, which can be opened with
+    chrome://tracing or https://ui.perfetto.dev.
+
+    With profile=True the main thread is profiled with cProfile, with trace_memory=True the allocations are traced with
+    tracemalloc. Both slow the program down noticeably.
+    """
+    def __init__(self, profile=False, trace_memory=False):
+        self.start_time = time.perf_counter()
+        self.lock = threading.Lock()
+        self.events = []
+        self.stages = {}
+        self.operations = {}
+        self.num_operation_events = 0
+        self.thread_ids = {}
+        self.profiler = cProfile.Profile() if profile else None
+        self.trace_memory = trace_memory
+
+    def start(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+
+    def _get_thread_id(self):
+        # small thread ids keep the rows of the trace viewer in the order the threads started
+        return self.thread_ids.setdefault(threading.get_ident(), len(self.thread_ids))
+
+    def _add_event(self, name, category, start, duration, args=None):
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': (start - self.start_time) * 1e6,
+            'dur': duration * 1e6,
+            'pid': os.getpid(),
+            'tid': self._get_thread_id(),
+        }
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    @contextmanager
+    def stage(self, name, **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            args['peak_rss_mb'] = get_peak_rss_mb()
+            if self.trace_memory:
+                args['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+
+            with self.lock:
+                self._add_event(name, 'stage', start, duration, args)
+                stage_stats = self.stages.setdefault(name, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+                stage_stats['count'] += 1
+                stage_stats['total_ms'] += duration * 1000
+                stage_stats['max_ms'] = max(stage_stats['max_ms'], duration * 1000)
+
+    def record(self, name, start, duration, num_bytes=0):
+        with self.lock:
+            operation = self.operations.get(name)
+            if operation is None:
+                operation = self.operations[name] = Operation()
+            operation.durations.append(duration)
+            operation.num_bytes += num_bytes
+
+            if self.num_operation_events < MAX_OPERATION_EVENTS:
+                self.num_operation_events += 1
+                self._add_event(name, 'operation', start, duration, {'bytes': num_bytes} if num_bytes else None)
+
+    def summary(self):
+        summary = {
+            'duration_ms': (time.perf_counter() - self.start_time) * 1000,
+            'peak_rss_mb': get_peak_rss_mb(),
+            'stages': self.stages,
+            'operations': {name: operation.summary() for name, operation in self.operations.items()},
+        }
+        if self.trace_memory:
+            summary['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            summary['top_allocations'] = [
+                {'location': str(statistic.traceback), 'size_mb': statistic.size / 2 ** 20, 'count': statistic.count}
+                for statistic in tracemalloc.take_snapshot().statistics('lineno')[:NUM_TOP_ALLOCATIONS]
+            ]
+        return summary
+
+    def write_trace(self, path, summary=None):
+        thread_names = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread_id,
+             'args': {'name': 'thread {}'.format(thread_id)}}
+            for thread_id in self.thread_ids.values()
+        ]
+        with open(path, 'w') as trace_file:
+            json.dump({
+                'traceEvents': thread_names + self.events,
+                'displayTimeUnit': 'ms',
+                'otherData': summary or self.summary(),
+            }, trace_file)
+
+    def write_profile(self, path):
+        self.profiler.dump_stats(path)
+
+    def print_summary(self, summary=None):
+        summary = summary or self.summary()
+
+        print('\n{:<40}{:>8}{:>12}{:>12}'.format('stage', 'count', 'total [ms]', 'max [ms]'))
+        for name, stage in summary['stages'].items():
+            print('{:<40}{:>8}{:>12.1f}{:>12.1f}'.format(name, stage['count'], stage['total_ms'], stage['max_ms']))
+
+        if summary['operations']:
+            print('\n{:<24}{:>8}{:>12}{:>10}{:>10}{:>10}{:>10}{:>12}'.format(
+                'operation', 'count', 'total [ms]', 'p50 [ms]', 'p90 [ms]', 'p99 [ms]', 'max [ms]', 'MiB'
+            ))
+            for name, operation in summary['operations'].items():
+                print('{:<24}{:>8}{:>12.1f}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}{:>12.2f}'.format(
+                    name, operation['count'], operation['total_ms'], operation['p50_ms'], operation['p90_ms'],
+                    operation['p99_ms'], operation['max_ms'], operation['bytes'] / 2 ** 20
+                ))
+
+        if summary['peak_rss_mb'] is not None:
+            print('\npeak resident memory: {:.1f} MiB'.format(summary['peak_rss_mb']))
+        for allocation in summary.get('top_allocations', []):
+            print('{:>10.2f} MiB {:>10} blocks  {}'.format(
+                allocation['size_mb'], allocation['count'], allocation['location']
+            ))
+
+        if self.profiler is not None:
+            print()
+            pstats.Stats(self.profiler).sort_stats('cumulative').print_stats(NUM_PROFILE_ENTRIES)
+
+
+def enable(profile=False, trace_memory=False):
+    """
+    Starts recording stages and operations in this process.
+    """
+    global _instrumentation
+    _instrumentation = Instrumentation(profile, trace_memory)
+    _instrumentation.start()
+    return _instrumentation
+
+
+def disable():
+    """
+    Stops recording and returns the Instrumentation, or None if it was not enabled.
+    """
+    global _instrumentation
+    instrumentation, _instrumentation = _instrumentation, None
+    if instrumentation is not None:
+        instrumentation.stop()
+    return instrumentation
+
+
+def is_enabled():
+    """
+    Returns whether the instrumentation is enabled, so that hot loops can skip taking the time of every iteration.
+    """
+    return _instrumentation is not None
+
+
+def stage(name, **args):
+    """
+    Returns a context manager recording the wall time of a stage, if the instrumentation is enabled.
+    """
+    if _instrumentation is None:
+        return nullcontext()
+    return _instrumentation.stage(name, **args)
+
+
+def record_operation(name, start, duration, num_bytes=0):
+    """
+    Records a single operation of the given name, e.g. a request, that started at the time.perf_counter() value start.
+    Does nothing if the instrumentation is disabled.
+    """
+    if _instrumentation is not None:
+        _instrumentation.record(name, start, duration, num_bytes)
@@ -0,0 +1,130 @@
+import numpy as np
+
+from config import TIME_REGISTERED_LABEL, TIME_SCHEDULED_LABEL, TIME_PROCESSING_LABEL
+from state_occupancy import get_exit_times
+
+STATE_LABELS = {
+    'registered': TIME_REGISTERED_LABEL,
+    'scheduled': TIME_SCHEDULED_LABEL,
+    'processing': TIME_PROCESSING_LABEL,
+}
+
+
+class IntervalIndex:
+    """
+    Answers which batches were in one state at a point in time (stabbing query) or at any time within a time range
+    (range query).
+
+    The closed intervals [entry, exit) are sorted once by their entry time. All closed intervals overlapping [start,
+    end] entered at or before end and, as no interval is longer than the longest one, at or after start -
+    max_duration. Only this slice is compared with the query, so a query is two binary searches and one vectorized
+    comparison over the candidates instead of a scan over all batches.
+
+    Batches that never left the state have open intervals, which would make max_duration infinite and every query a
+    full scan. They are kept in a separate array sorted by entry time, of which all entered at or before end overlap.
+    """
+    def __init__(self, entry_times, exit_times=None, positions=None):
+        """
+        :param entry_times: The time every batch entered the state, NaN if it never did
+        :param exit_times: The time every batch left the state, NaN or None if it never left
+        :param positions: The row of every batch in the results, its index in entry_times by default
+        """
+        entry_times = np.asarray(entry_times, dtype=float)
+        if exit_times is None:
+            exit_times = np.full_like(entry_times, np.inf)
+        else:
+            exit_times = np.maximum(np.asarray(exit_times, dtype=float), entry_times)
+            exit_times[np.isnan(exit_times)] = np.inf
+        if positions is None:
+            positions = np.arange(len(entry_times))
+        positions = np.asarray(positions)
+
+        valid = ~np.isnan(entry_times)
+        closed = valid & np.isfinite(exit_times)
+        opened = valid & ~closed
+
+        order = np.argsort(entry_times[closed], kind='stable')
+        self.entry_times = entry_times[closed][order]
+        self.exit_times = exit_times[closed][order]
+        self.positions = positions[closed][order]
+        self.max_duration = (self.exit_times - self.entry_times).max() if len(self.entry_times) else 0.0
+
+        order = np.argsort(entry_times[opened], kind='stable')
+        self.open_entry_times = entry_times[opened][order]
+        self.open_positions = positions[opened][order]
+
+    @staticmethod
+    def from_data_frame(data_frame, state_label):
+        exit_times = get_exit_times(data_frame, state_label)
+        return IntervalIndex(data_frame[state_label].values, exit_times)
+
+    def __len__(self):
+        return len(self.entry_times) + len(self.open_entry_times)
+
+    def _candidates(self, start, end):
+        first = np.searchsorted(self.entry_times, start - self.max_duration, side='left')
+        last = np.searchsorted(self.entry_times, end, side='right')
+        return slice(first, last)
+
+    def _merge(self, closed, opened):
+        """
+        Returns the positions of the selected closed and open intervals, ordered by the time they entered the state.
+
+        :param closed: A boolean mask or slice of the closed intervals
+        :param opened: A slice of the open intervals
+        """
+        if len(self.open_entry_times[opened]) == 0:
+            return self.positions[closed]
+        entry_times = np.concatenate([self.entry_times[closed], self.open_entry_times[opened]])
+        positions = np.concatenate([self.positions[closed], self.open_positions[opened]])
+        return positions[np.argsort(entry_times, kind='stable')]
+
+    def overlapping(self, start, end):
+        """
+        Returns the positions of the batches that were in the state at any time t with start <= t <= end, ordered by
+        the time they entered the state.
+        """
+        candidates = self._candidates(start, end)
+        closed = np.arange(candidates.start, candidates.stop)[self.exit_times[candidates] > start]
+        opened = slice(0, np.searchsorted(self.open_entry_times, end, side='right'))
+        return self._merge(closed, opened)
+
+    def stab(self, time):
+        """
+        Returns the positions of the batches that were in the state at the given time, that is entered it at or before
+        and left it after the time.
+        """
+        return self.overlapping(time, time)
+
+    def entered(self, start, end):
+        """
+        Returns the positions of the batches that entered the state at a time t with start <= t <= end.
+        """
+        closed = slice(
+            np.searchsorted(self.entry_times, start, side='left'), np.searchsorted(self.entry_times, end, side='right')
+        )
+        opened = slice(
+            np.searchsorted(self.open_entry_times, start, side='left'),
+            np.searchsorted(self.open_entry_times, end, side='right')
+        )
+        return self._merge(closed, opened)
+
+
+class BatchIntervals:
+    """
+    An IntervalIndex for each of the states registered, scheduled and processing of the batches in a result data
+    frame.
+    """
+    def __init__(self, data_frame, states=None):
+        self.indexes = {
+            state: IntervalIndex.from_data_frame(data_frame, STATE_LABELS[state]) for state in states or STATE_LABELS
+        }
+
+    def overlapping(self, state, start, end):
+        return self.indexes[state].overlapping(start, end)
+
+    def stab(self, state, time):
+        return self.indexes[state].stab(time)
+
+    def entered(self, state, start, end):
+        return self.indexes[state].entered(start, end)
@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from config import RESULTS_PATH, RESULT_CSV_PATH, RESULT_STORE_PATH, EXPERIMENT_ID_LABEL, TIME_REGISTERED_LABEL, \
+    TIME_SCHEDULED_LABEL, TIME_PROCESSING_LABEL, TIME_SUCCEEDED_LABEL, TERMINAL_STATE_LABEL, ATTEMPTS_LABEL, \
+    RETRY_DURATION_LABEL
+from result_store import read_results
+
+LATENCY_STATS_CSV_PATH = os.path.join(RESULTS_PATH, 'latency_stats.csv')
+THROUGHPUT_STATS_CSV_PATH = os.path.join(RESULTS_PATH, 'throughput_stats.csv')
+FAILURE_STATS_CSV_PATH = os.path.join(RESULTS_PATH, 'failure_stats.csv')
+STATS_JSON_PATH = os.path.join(RESULTS_PATH, 'stats.json')
+
+ALL_EXPERIMENTS = 'all'
+PHASE_LABEL = 'phase'
+
+QUEUEING_PHASE = 'queueing'
+CONTAINER_START_PHASE = 'container_start'
+RUN_PHASE = 'run'
+
+# every phase is the time between two state changes
+PHASES = [
+    (QUEUEING_PHASE, TIME_REGISTERED_LABEL, TIME_SCHEDULED_LABEL),
+    (CONTAINER_START_PHASE, TIME_SCHEDULED_LABEL, TIME_PROCESSING_LABEL),
+    (RUN_PHASE, TIME_PROCESSING_LABEL, TIME_SUCCEEDED_LABEL),
+]
+
+QUANTILES = [0.5, 0.9, 0.99, 0.999]
+QUANTILE_LABELS = ['p50', 'p90', 'p99', 'p99.9']
+
+# the peak throughput is the maximal number of batches finishing within this many seconds
+PEAK_THROUGHPUT_WINDOW = 10.0
+
+
+def get_experiment_codes(data_frame):
+    """
+    Returns the distinct experiment ids and the index of the experiment of every batch. Grouping by these integer codes
+    is much faster than grouping by the experiment id strings of millions of batches.
+    """
+    experiment_ids = pd.Categorical(data_frame[EXPERIMENT_ID_LABEL]).remove_unused_categories()
+    return np.asarray(experiment_ids.categories.astype(str)), experiment_ids.codes.astype(np.int64)
+
+
+def compute_phase_durations(data_frame):
+    """
+    Returns a data frame with the duration of every phase of every batch.
+
+    The registered timestamp of a retried batch is its first registration, but the scheduled timestamp is taken from
+    its last attempt. The retry duration, the time from the first to the last scheduling, is therefore subtracted from
+    the queueing phase, so that only the time until the first scheduling is counted as queueing and the time lost to
+    earlier attempts is not counted twice.
+    """
+    data = {}
+    for phase, begin_label, end_label in PHASES:
+        data[phase] = data_frame[end_label].values - data_frame[begin_label].values
+    if RETRY_DURATION_LABEL in data_frame.columns:
+        retry_durations = data_frame[RETRY_DURATION_LABEL].values
+        data[QUEUEING_PHASE] = data[QUEUEING_PHASE] - np.where(np.isnan(retry_durations), 0.0, retry_durations)
+    return pd.DataFrame(data=data)
+
+
+def _latency_stats(phase_durations, group_codes, group_names):
+    grouped = phase_durations.groupby(group_codes, sort=True)
+
+    # negative durations are caused by skewed clocks, see data_quality.py
+    negative = (phase_durations < 0).groupby(group_codes, sort=True).sum()
+    stats = pd.concat(
+        {'count': grouped.count().stack(), 'negative': negative.stack(), 'mean': grouped.mean().stack()}, axis=1
+    )
+    quantiles = grouped.quantile(QUANTILES).stack().unstack(1)
+    quantiles.columns = QUANTILE_LABELS
+    stats = pd.concat([stats, quantiles, grouped.max().stack().rename('max')], axis=1)
+
+    codes, phases = stats.index.get_level_values(0), stats.index.get_level_values(1)
+    stats.index = pd.MultiIndex.from_arrays(
+        [group_names[codes], phases], names=[EXPERIMENT_ID_LABEL, PHASE_LABEL]
+    )
+    return stats.sort_index()
+
+
+def compute_latency_stats(data_frame):
+    """
+    Computes count, mean, p50, p90, p99, p99.9 and max of every phase for every experiment and for all experiments
+    together. All experiments and phases are aggregated by one grouped operation.
+
+    :param data_frame: The data frame with one row per batch, as written to processing_timestamps.csv
+    :type data_frame: pd.DataFrame
+    :return: A data frame indexed by experiment id and phase
+    :rtype: pd.DataFrame
+    """
+    phase_durations = compute_phase_durations(data_frame)
+    experiment_ids, experiment_codes = get_experiment_codes(data_frame)
+
+    per_experiment = _latency_stats(phase_durations, experiment_codes, experiment_ids)
+    overall = _latency_stats(
+        phase_durations, np.zeros(len(phase_durations), dtype=np.int64), np.array([ALL_EXPERIMENTS])
+    )
+
+    return pd.concat([per_experiment, overall])
+
+
+def get_peak_counts(group_codes, timestamps, window, num_groups):
+    """
+    Returns the maximal number of timestamps within any interval [t, t + window) for every group. Groups without any
+    timestamp have a peak count of 0.
+
+    :param num_groups: The number of groups, group_codes are in range(num_groups)
+
+    The timestamps of all groups are shifted apart and sorted once, so that a single binary search finds the end of the
+    window starting at every timestamp.
+    """
+    valid = ~np.isnan(timestamps)
+    group_codes = group_codes[valid]
+    timestamps = timestamps[valid]
+    peak_counts = np.zeros(num_groups, dtype=np.int64)
+    if len(timestamps) == 0:
+        return peak_counts
+
+    span = timestamps.max() - timestamps.min() + 2 * window
+    keys = np.sort((timestamps - timestamps.min()) + group_codes * span)
+    window_counts = np.searchsorted(keys, keys + window, side='left') - np.arange(len(keys))
+
+    sorted_groups = (keys // span).astype(np.int64)
+    np.maximum.at(peak_counts, sorted_groups, window_counts)
+    return peak_counts
+
+
+def compute_throughput_stats(data_frame, window=PEAK_THROUGHPUT_WINDOW):
+    """
+    Computes the sustained throughput (succeeded batches divided by the time from the first registration to the last
+    success) and the peak throughput (maximal number of batches succeeding within window seconds divided by window)
+    for every experiment and for all experiments together.
+
+    :return: A data frame indexed by experiment id
+    :rtype: pd.DataFrame
+    """
+    group_names, group_codes = get_experiment_codes(data_frame)
+    succeeded = data_frame[TIME_SUCCEEDED_LABEL].values
+
+    grouped = data_frame.groupby(group_codes)
+    batches = grouped[TIME_SUCCEEDED_LABEL].count().values
+    start_times = grouped[TIME_REGISTERED_LABEL].min().values
+    end_times = grouped[TIME_SUCCEEDED_LABEL].max().values
+    # the number of groups is not derived from the codes, experiments without succeeded batches have no timestamp
+    peak_counts = get_peak_counts(group_codes, succeeded, window, len(group_names))
+
+    overall_peak_count = get_peak_counts(np.zeros(len(succeeded), dtype=np.int64), succeeded, window, 1)
+
+    stats = pd.DataFrame(
+        data={
+            'batches': np.append(batches, np.sum(batches)),
+            'duration': np.append(end_times - start_times, np.nanmax(end_times) - np.nanmin(start_times)),
+            'peak_batches_per_second': np.append(peak_counts, overall_peak_count) / window,
+        },
+        index=pd.Index(list(group_names) + [ALL_EXPERIMENTS], name=EXPERIMENT_ID_LABEL)
+    )
+    stats.insert(2, 'sustained_batches_per_second', stats['batches'] / stats['duration'])
+    return stats
+
+
+def _failure_stats(data_frame, group_codes, group_names):
+    terminal_states = data_frame[TERMINAL_STATE_LABEL]
+    retry_durations = data_frame[RETRY_DURATION_LABEL].values
+    attempts = data_frame[ATTEMPTS_LABEL].values
+
+    indicators = pd.DataFrame(data={
+        'batches': np.ones(len(data_frame), dtype=np.int64),
+        'succeeded': (terminal_states == 'succeeded').values,
+        'failed': (terminal_states == 'failed').values,
+        'cancelled': (terminal_states == 'cancelled').values,
+        'unfinished': terminal_states.isna().values,
+        'retried': attempts > 1,
+        'attempts': attempts,
+        'retry_duration': retry_durations,
+    })
+    grouped = indicators.groupby(group_codes, sort=True)
+
+    stats = grouped[['batches', 'succeeded', 'failed', 'cancelled', 'unfinished', 'retried']].sum()
+    stats['failure_rate'] = (stats['failed'] + stats['cancelled']) / (stats['batches'] - stats['unfinished'])
+    stats['mean_attempts'] = grouped['attempts'].mean()
+    stats['retry_duration_total'] = grouped['retry_duration'].sum()
+    stats['retry_duration_mean'] = grouped['retry_duration'].mean()
+    stats['retry_duration_p99'] = grouped['retry_duration'].quantile(0.99)
+    stats['retry_duration_max'] = grouped['retry_duration'].max()
+    stats.index = pd.Index(group_names[stats.index], name=EXPERIMENT_ID_LABEL)
+    return stats
+
+
+def compute_failure_stats(data_frame):
+    """
+    Computes the number of succeeded, failed, cancelled and unfinished batches, the failure rate of the finished
+    batches and the time lost to retries for every experiment and for all experiments together.
+
+    :return: A data frame indexed by experiment id
+    :rtype: pd.DataFrame
+    """
+    experiment_ids, experiment_codes = get_experiment_codes(data_frame)
+    per_experiment = _failure_stats(data_frame, experiment_codes, experiment_ids)
+    overall = _failure_stats(data_frame, np.zeros(len(data_frame), dtype=np.int64), np.array([ALL_EXPERIMENTS]))
+    return pd.concat([per_experiment, overall])
+
+
+def stats_to_json(latency_stats, throughput_stats, failure_stats=None):
+    report = {}
+    for experiment_id, throughput in throughput_stats.iterrows():
+        report[experiment_id] = {'throughput': throughput.to_dict(), 'phases': {}}
+
+    for (experiment_id, phase), latency in latency_stats.iterrows():
+        report[experiment_id]['phases'][phase] = latency.to_dict()
+
+    if failure_stats is not None:
+        for experiment_id, failures in failure_stats.iterrows():
+            report.setdefault(experiment_id, {'phases': {}})['failures'] = failures.to_dict()
+
+    return report
+
+
+def write_stats(data_frame):
+    latency_stats = compute_latency_stats(data_frame)
+    throughput_stats = compute_throughput_stats(data_frame)
+    # results created before failed batches were exported do not contain the terminal state
+    failure_stats = None
+    if TERMINAL_STATE_LABEL in data_frame.columns:
+        failure_stats = compute_failure_stats(data_frame)
+        failure_stats.to_csv(FAILURE_STATS_CSV_PATH)
+
+    latency_stats.to_csv(LATENCY_STATS_CSV_PATH)
+    throughput_stats.to_csv(THROUGHPUT_STATS_CSV_PATH)
+    with open(STATS_JSON_PATH, 'w') as stats_file:
+        json.dump(stats_to_json(latency_stats, throughput_stats, failure_stats), stats_file, indent=2, sort_keys=True)
+
+    return latency_stats, throughput_stats, failure_stats
+
+
+def get_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Computes latency percentiles, throughput and failure statistics of executed experiments.'
+    )
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    get_arguments(argv)
+
+    data_frame = read_results(RESULT_STORE_PATH, RESULT_CSV_PATH, mmap=True)
+
+    latency_stats, throughput_stats, failure_stats = write_stats(data_frame)
+
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(latency_stats.round(3))
+        print(throughput_stats.round(3))
+        if failure_stats is not None:
+            print(failure_stats.round(3))
+
+
+if __name__ == '__main__':
+    main()
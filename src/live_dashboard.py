@@ -0,0 +1,209 @@
+import os
+import shutil
+import sys
+
+import numpy as np
+
+from config import DEFAULT_LIVE_WINDOW, DEFAULT_STALL_TIMEOUT, DEFAULT_PLOT_INTERVAL
+
+SPARK_CHARACTERS = ' ▁▂▃▄▅▆▇█'
+FINISHED_STAGE = 'finished'
+LABEL_WIDTH = 25
+
+
+class RingBuffer:
+    """
+    Keeps the last capacity rows of a time series of fixed width in preallocated arrays, so long experiments can be
+    monitored with constant memory.
+    """
+    def __init__(self, capacity, width):
+        self.times = np.zeros(capacity)
+        self.values = np.zeros((capacity, width))
+        self.capacity = capacity
+        self.size = 0
+        self.next_index = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, timestamp, values):
+        self.times[self.next_index] = timestamp
+        self.values[self.next_index] = values
+        self.next_index = (self.next_index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def arrays(self):
+        """
+        Returns the times and values of the buffered rows from the oldest to the newest.
+        """
+        if self.size < self.capacity:
+            return self.times[:self.size], self.values[:self.size]
+        order = np.roll(np.arange(self.capacity), -self.next_index)
+        return self.times[order], self.values[order]
+
+
+def get_stages(states, finished_states):
+    """
+    Returns the stages a batch passes in order. The finished states are merged into one stage, because a batch reaches
+    only one of them.
+    """
+    return [state for state in states if state not in finished_states] + [FINISHED_STAGE]
+
+
+def count_reached(state_counts, states, finished_states):
+    """
+    Returns how many batches reached every stage, i.e. are in the stage or in a later one. The number of transitions
+    into a stage is the change of this number. Batches that are scheduled again after a failed attempt are only counted
+    once.
+
+    :param state_counts: An array of shape (num_samples, len(states)) with the number of batches in every state
+    :return: An array of shape (num_samples, len(stages))
+    """
+    stages = get_stages(states, finished_states)
+    finished = np.isin(states, finished_states)
+
+    stage_counts = np.zeros((state_counts.shape[0], len(stages)))
+    stage_counts[:, :-1] = state_counts[:, ~finished]
+    stage_counts[:, -1] = state_counts[:, finished].sum(axis=1)
+    return np.cumsum(stage_counts[:, ::-1], axis=1)[:, ::-1]
+
+
+def sparkline(values, width):
+    """
+    Renders the last width values as a line of block characters scaled to their maximum.
+    """
+    values = np.asarray(values[-width:], dtype=float)
+    if len(values) == 0:
+        return ''
+    top = values.max()
+    if top <= 0:
+        return SPARK_CHARACTERS[0] * len(values)
+    levels = np.ceil(values / top * (len(SPARK_CHARACTERS) - 1)).astype(int)
+    return ''.join(SPARK_CHARACTERS[level] for level in np.clip(levels, 0, len(SPARK_CHARACTERS) - 1))
+
+
+class LiveDashboard:
+    """
+    Shows the state counts of a running experiment and the transitions per second into every stage.
+
+    The samples of every poll are kept in a ring buffer of window samples. On a terminal the dashboard is redrawn in
+    place, otherwise one line per poll is printed. Every plot_interval seconds the buffered time series are plotted to
+    monitoring/<experiment_id>.png. If no batch changed its stage for stall_timeout seconds, a warning is shown, so a
+    stalled experiment can be aborted early.
+    """
+    def __init__(self, experiment_id, states, finished_states, monitoring_dir, window=DEFAULT_LIVE_WINDOW,
+                 stall_timeout=DEFAULT_STALL_TIMEOUT, plot_interval=DEFAULT_PLOT_INTERVAL, stream=None):
+        self.experiment_id = experiment_id
+        self.states = list(states)
+        self.finished_states = list(finished_states)
+        self.stages = get_stages(self.states, self.finished_states)
+        self.buffer = RingBuffer(window, len(self.states))
+        self.stall_timeout = stall_timeout
+        self.plot_interval = plot_interval
+        self.plot_path = os.path.join(monitoring_dir, '{}.png'.format(experiment_id))
+        if plot_interval and not os.path.isdir(monitoring_dir):
+            os.mkdir(monitoring_dir)
+        self.stream = stream or sys.stdout
+        self.interactive = self.stream.isatty()
+
+        self.start_time = None
+        self.last_change_time = None
+        self.last_reached = None
+        self.last_plot_time = None
+        self.num_drawn_lines = 0
+
+    def update(self, timestamp, state_dict):
+        counts = [state_dict.get(state, 0) for state in self.states]
+        self.buffer.append(timestamp, counts)
+
+        reached = count_reached(np.array([counts], dtype=float), self.states, self.finished_states)[0]
+        if self.start_time is None:
+            self.start_time = timestamp
+        if self.last_reached is None or not np.array_equal(reached, self.last_reached):
+            self.last_change_time = timestamp
+        self.last_reached = reached
+
+        self.draw(timestamp)
+
+        plot_due = self.last_plot_time is None or timestamp - self.last_plot_time >= self.plot_interval
+        if self.plot_interval and plot_due:
+            self.plot()
+            self.last_plot_time = timestamp
+
+    def is_stalled(self, timestamp):
+        finished = self.last_reached[-1] >= self.last_reached[0]
+        return not finished and timestamp - self.last_change_time >= self.stall_timeout
+
+    def get_rates(self):
+        """
+        Returns the sample times and the transitions per second into every stage between consecutive samples.
+        """
+        times, counts = self.buffer.arrays()
+        reached = count_reached(counts, self.states, self.finished_states)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = np.diff(reached, axis=0) / np.diff(times)[:, np.newaxis]
+        return times[1:], np.nan_to_num(rates, nan=0.0, posinf=0.0, neginf=0.0)
+
+    def get_header(self, timestamp):
+        total, finished = self.last_reached[0], self.last_reached[-1]
+        header = '{}  {:.0f}s  {:.0f}/{:.0f} finished ({:.1%})'.format(
+            self.experiment_id, timestamp - self.start_time, finished, total, finished / total if total else 0
+        )
+        if self.is_stalled(timestamp):
+            header += '  WARNING: no state change for {:.0f}s'.format(timestamp - self.last_change_time)
+        return header
+
+    def get_lines(self, timestamp):
+        width = max(shutil.get_terminal_size().columns - LABEL_WIDTH - 1, 10)
+        _, counts = self.buffer.arrays()
+        _, rates = self.get_rates()
+
+        lines = [self.get_header(timestamp)]
+        for index, state in enumerate(self.states):
+            lines.append('{:<14}{:>10.0f} {}'.format(state, counts[-1, index], sparkline(counts[:, index], width)))
+        # every batch has been registered, so only the later stages have transitions
+        for index, stage in enumerate(self.stages[1:], 1):
+            current_rate = rates[-1, index] if len(rates) else 0
+            lines.append('{:<14}{:>8.1f}/s {}'.format(
+                '-> ' + stage, current_rate, sparkline(rates[:, index], width)
+            ))
+        return lines
+
+    def draw(self, timestamp):
+        if not self.interactive:
+            print(self.get_header(timestamp), file=self.stream, flush=True)
+            return
+
+        lines = self.get_lines(timestamp)
+        if self.num_drawn_lines:
+            # move the cursor back to the first line of the dashboard
+            self.stream.write('\x1b[{}F'.format(self.num_drawn_lines))
+        self.stream.write(''.join('{}\x1b[K\n'.format(line) for line in lines))
+        self.stream.flush()
+        self.num_drawn_lines = len(lines)
+
+    def plot(self):
+        # pyplot takes longer to import than everything else the monitor loop needs, so it is only imported for plots
+        import matplotlib.pyplot as plt
+
+        times, counts = self.buffer.arrays()
+        rate_times, rates = self.get_rates()
+
+        fig, (count_ax, rate_ax) = plt.subplots(2, 1, sharex=True)
+        for index, state in enumerate(self.states):
+            count_ax.plot(times - self.start_time, counts[:, index], label=state)
+        count_ax.set_ylabel('number of batches')
+        count_ax.legend(fontsize='small')
+        for index, stage in enumerate(self.stages[1:], 1):
+            rate_ax.plot(rate_times - self.start_time, rates[:, index], label=stage)
+        rate_ax.set_ylabel('transitions per second')
+        rate_ax.set_xlabel('seconds since monitoring start')
+        rate_ax.legend(fontsize='small')
+        count_ax.set_title(self.experiment_id, fontsize='medium')
+
+        fig.savefig(self.plot_path, bbox_inches='tight')
+        plt.close(fig)
+
+    def close(self):
+        if self.plot_interval and len(self.buffer):
+            self.plot()
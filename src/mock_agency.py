@@ -0,0 +1,459 @@
+import argparse
+import heapq
+import json
+import math
+import os
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+DEFAULT_PORT = 8080
+DEFAULT_NUM_NODES = 10
+DEFAULT_SLOTS_PER_NODE = 4
+DEFAULT_SCHEDULING_DELAY = 0.01
+DEFAULT_START_LATENCY = 1.5
+DEFAULT_PROCESSING_TIME = 2.0
+DEFAULT_JITTER = 0.3
+DEFAULT_FAILURE_RATE = 0.0
+
+MOCK_USERNAME = 'mock'
+MOCK_AGENCY_VERSION = 'mock'
+
+STATE_REGISTERED = 'registered'
+STATE_SCHEDULED = 'scheduled'
+STATE_PROCESSING = 'processing'
+STATE_SUCCEEDED = 'succeeded'
+STATE_FAILED = 'failed'
+
+# states indexed by the number of transitions a batch has made, the last one depends on the failure flag
+STATE_SEQUENCE = [STATE_REGISTERED, STATE_SCHEDULED, STATE_PROCESSING]
+
+
+class AgencyClock:
+    """
+    The clock of the mock agency. It runs time_scale times faster than the wall clock, starting at the wall clock time
+    of its creation. In instant mode the clock is infinitely far in the future, so every batch is finished as soon as
+    it is submitted.
+    """
+    def __init__(self, time_scale=1.0, instant=False):
+        self.time_scale = time_scale
+        self.instant = instant
+        self.start_time = time.time()
+
+    def now(self):
+        if self.instant:
+            return math.inf
+        return self.start_time + (time.time() - self.start_time) * self.time_scale
+
+    def registration_time(self):
+        if self.instant:
+            return time.time()
+        return self.now()
+
+
+class SchedulerModel:
+    """
+    A discrete-event model of the agency scheduler.
+
+    The cluster consists of num_nodes nodes with slots_per_node container slots each. Batches are scheduled one after
+    another, every scheduling decision takes scheduling_delay seconds. A batch is scheduled as soon as a slot is free
+    and the experiment has less than batchConcurrencyLimit batches in progress. Afterwards its container starts within
+    the container start latency and processes for the processing time. Both durations are log-normally distributed
+    around the configured medians with the shape parameter jitter. A fraction of failure_rate batches ends in the failed
+    state.
+
+    The cluster state is kept between submissions, so concurrently submitted experiments compete for the same slots.
+    """
+    def __init__(
+            self, num_nodes=DEFAULT_NUM_NODES, slots_per_node=DEFAULT_SLOTS_PER_NODE,
+            scheduling_delay=DEFAULT_SCHEDULING_DELAY, start_latency=DEFAULT_START_LATENCY,
+            processing_time=DEFAULT_PROCESSING_TIME, jitter=DEFAULT_JITTER, failure_rate=DEFAULT_FAILURE_RATE, seed=None
+    ):
+        self.num_nodes = num_nodes
+        self.slots_per_node = slots_per_node
+        self.scheduling_delay = scheduling_delay
+        self.start_latency = start_latency
+        self.processing_time = processing_time
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.rng = np.random.default_rng(seed)
+        self.node_names = ['node{}'.format(node) for node in range(num_nodes)]
+
+        self.slots = [(0.0, node) for node in range(num_nodes) for _ in range(slots_per_node)]
+        heapq.heapify(self.slots)
+        self.scheduler_free_time = 0.0
+
+    def _sample(self, median, num_batches):
+        if self.jitter <= 0:
+            return np.full(num_batches, float(median))
+        return median * self.rng.lognormal(0.0, self.jitter, num_batches)
+
+    def simulate(self, registration_time, num_batches, concurrency_limit=None):
+        """
+        Simulates the execution of num_batches batches registered at registration_time.
+
+        :return: A dictionary containing the arrays 'scheduled', 'processing' and 'finished' with the timestamps of the
+                 state changes, 'node' with the node index and 'failed' with the failure flag of every batch
+        """
+        start_latencies = self._sample(self.start_latency, num_batches)
+        processing_times = self._sample(self.processing_time, num_batches)
+        failed = self.rng.random(num_batches) < self.failure_rate
+
+        scheduled = np.empty(num_batches)
+        processing = np.empty(num_batches)
+        finished = np.empty(num_batches)
+        nodes = np.empty(num_batches, dtype=np.int32)
+
+        in_progress = []
+        scheduler_time = max(registration_time, self.scheduler_free_time)
+        for i in range(num_batches):
+            if concurrency_limit and len(in_progress) >= concurrency_limit:
+                scheduler_time = max(scheduler_time, heapq.heappop(in_progress))
+
+            slot_free_time, node = heapq.heappop(self.slots)
+            scheduled[i] = max(scheduler_time, slot_free_time)
+            processing[i] = scheduled[i] + start_latencies[i]
+            finished[i] = processing[i] + processing_times[i]
+            nodes[i] = node
+
+            heapq.heappush(self.slots, (finished[i], node))
+            if concurrency_limit:
+                heapq.heappush(in_progress, finished[i])
+            scheduler_time = scheduled[i] + self.scheduling_delay
+
+        self.scheduler_free_time = scheduler_time
+
+        return {
+            'scheduled': scheduled,
+            'processing': processing,
+            'finished': finished,
+            'node': nodes,
+            'failed': failed,
+        }
+
+
+class MockExperiment:
+    def __init__(self, experiment_id, batch_id_prefix, registration_time, batch_template, timeline, node_names):
+        self.experiment_id = experiment_id
+        self.batch_id_prefix = batch_id_prefix
+        self.registration_time = registration_time
+        self.batch_template = batch_template
+        self.timeline = timeline
+        self.node_names = node_names
+        self.num_batches = len(timeline['scheduled'])
+
+    def batch_id(self, index):
+        return '{}{:08x}'.format(self.batch_id_prefix, index)
+
+    def get_state_codes(self, now):
+        """
+        Returns the number of state transitions every batch has made until now.
+        """
+        timeline = self.timeline
+        return (
+            (timeline['scheduled'] <= now).astype(np.int8)
+            + (timeline['processing'] <= now)
+            + (timeline['finished'] <= now)
+        )
+
+    def get_states(self, now):
+        """
+        Returns an array of state names, one per batch.
+        """
+        states = np.array(STATE_SEQUENCE + [STATE_SUCCEEDED, STATE_FAILED])
+        codes = self.get_state_codes(now).astype(np.int64)
+        codes[(codes == 3) & self.timeline['failed']] = 4
+        return states[codes]
+
+    def get_node(self, index, state_code):
+        if state_code == 0:
+            return None
+        return self.node_names[self.timeline['node'][index]]
+
+    def batch_summary(self, index, state):
+        state_code = STATE_SEQUENCE.index(state) if state in STATE_SEQUENCE else 3
+        return {
+            '_id': self.batch_id(index),
+            'experimentId': self.experiment_id,
+            'username': MOCK_USERNAME,
+            'registrationTime': self.registration_time,
+            'state': state,
+            'node': self.get_node(index, state_code),
+        }
+
+    def batch_document(self, index, now):
+        timeline = self.timeline
+        transition_times = [
+            self.registration_time, timeline['scheduled'][index], timeline['processing'][index],
+            timeline['finished'][index]
+        ]
+        end_state = STATE_FAILED if timeline['failed'][index] else STATE_SUCCEEDED
+        states = STATE_SEQUENCE + [end_state]
+
+        history = []
+        for state_code, (state, transition_time) in enumerate(zip(states, transition_times)):
+            if transition_time > now:
+                break
+            node = self.get_node(index, state_code)
+            history.append({'state': state, 'time': float(transition_time), 'debugInfo': None, 'node': node})
+
+        batch = self.batch_summary(index, history[-1]['state'])
+        batch.update({
+            'inputs': self.batch_template.get('inputs', {}),
+            'outputs': self.batch_template.get('outputs', {}),
+            'notifications': [],
+            'mount': False,
+            'history': history,
+        })
+        return batch
+
+
+class MockAgency:
+    """
+    Holds the experiments of the mock agency and answers the requests of its HTTP handler.
+    """
+    def __init__(self, scheduler_model=None, clock=None):
+        self.scheduler_model = scheduler_model or SchedulerModel()
+        self.clock = clock or AgencyClock()
+        self.lock = threading.Lock()
+        self.experiments = {}
+        self.experiments_by_batch_prefix = {}
+
+    def _new_id(self, num_hex_digits):
+        return os.urandom(num_hex_digits // 2).hex()
+
+    def submit(self, red_data):
+        batches = red_data.get('batches') or [{}]
+        num_batches = len(red_data.get('batches', []))
+        settings = red_data.get('execution', {}).get('settings', {})
+        return self.add_experiment(num_batches, batches[0], settings.get('batchConcurrencyLimit'))
+
+    def add_experiment(self, num_batches, batch_template=None, concurrency_limit=None):
+        with self.lock:
+            registration_time = self.clock.registration_time()
+            timeline = self.scheduler_model.simulate(registration_time, num_batches, concurrency_limit)
+
+            experiment = MockExperiment(
+                self._new_id(24), self._new_id(16), registration_time, batch_template or {}, timeline,
+                self.scheduler_model.node_names
+            )
+            self.experiments[experiment.experiment_id] = experiment
+            self.experiments_by_batch_prefix[experiment.batch_id_prefix] = experiment
+
+        return experiment.experiment_id
+
+    def _select_experiments(self, experiment_id):
+        # the experiments are only read under the lock, as submissions add experiments from other handler threads.
+        # the experiments themselves are not changed after they were added.
+        with self.lock:
+            if experiment_id is None:
+                return list(self.experiments.values())
+            experiment = self.experiments.get(experiment_id)
+        return [experiment] if experiment else []
+
+    def list_batches(self, experiment_id=None, state=None, skip=0, limit=None):
+        now = self.clock.now()
+        batches = []
+        for experiment in self._select_experiments(experiment_id):
+            states = experiment.get_states(now)
+            indices = np.arange(experiment.num_batches) if state is None else np.flatnonzero(states == state)
+            for index in indices:
+                batches.append(experiment.batch_summary(int(index), str(states[index])))
+
+        end = None if limit is None else skip + limit
+        return batches[skip:end]
+
+    def count_batches(self, experiment_id=None, state=None):
+        now = self.clock.now()
+        count = 0
+        for experiment in self._select_experiments(experiment_id):
+            if state is None:
+                count += experiment.num_batches
+            else:
+                count += int(np.count_nonzero(experiment.get_states(now) == state))
+        return count
+
+    def list_nodes(self):
+        return [
+            {'nodeName': node_name, 'state': 'online', 'slots': self.scheduler_model.slots_per_node}
+            for node_name in self.scheduler_model.node_names
+        ]
+
+    def get_batch(self, batch_id):
+        with self.lock:
+            experiment = self.experiments_by_batch_prefix.get(batch_id[:16])
+        if experiment is None:
+            return None
+        try:
+            index = int(batch_id[16:], 16)
+        except ValueError:
+            return None
+        if not 0 <= index < experiment.num_batches:
+            return None
+        return experiment.batch_document(index, self.clock.now())
+
+
+class MockAgencyRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, which would otherwise be delayed on keep-alive connections
+    disable_nagle_algorithm = True
+    agency = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        # every user is accepted, but like the agency requests without basic auth are rejected
+        if not self.headers.get('Authorization', '').startswith('Basic '):
+            self._send_json({'error': 'authorization required'}, 401)
+            return False
+        return True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = url.path.rstrip('/')
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        if path == '':
+            self._send_json({'Hello': 'World', 'mock': True})
+            return
+
+        if not self._authorized():
+            return
+
+        if path == '/batches':
+            skip = int(query.get('skip', 0))
+            limit = int(query['limit']) if 'limit' in query else None
+            self._send_json(self.agency.list_batches(query.get('experimentId'), query.get('state'), skip, limit))
+        elif path == '/batches/count':
+            self._send_json({'count': self.agency.count_batches(query.get('experimentId'), query.get('state'))})
+        elif path == '/version':
+            self._send_json({'agencyVersion': MOCK_AGENCY_VERSION})
+        elif path == '/nodes':
+            self._send_json(self.agency.list_nodes())
+        elif path.startswith('/batches/'):
+            batch = self.agency.get_batch(path[len('/batches/'):])
+            if batch is None:
+                self._send_json({'error': 'batch not found'}, 404)
+            else:
+                self._send_json(batch)
+        else:
+            self._send_json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+
+        if urlparse(self.path).path.rstrip('/') != '/red':
+            self._send_json({'error': 'not found'}, 404)
+            return
+
+        content_length = int(self.headers.get('Content-Length', 0))
+        try:
+            red_data = json.loads(self.rfile.read(content_length))
+        except ValueError:
+            self._send_json({'error': 'invalid json'}, 400)
+            return
+
+        self._send_json({'experimentId': self.agency.submit(red_data)})
+
+
+def create_server(agency, port=DEFAULT_PORT, host='127.0.0.1'):
+    handler = type('BoundMockAgencyRequestHandler', (MockAgencyRequestHandler,), {'agency': agency})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_mock_agency(agency=None, port=0, host='127.0.0.1'):
+    """
+    Starts a mock agency in a background thread.
+
+    :param agency: The MockAgency to serve, a default one is created if None
+    :param port: The port to listen on, 0 chooses a free port
+    :return: A tuple (server, url). Call server.shutdown() to stop it.
+    """
+    server = create_server(agency or MockAgency(), port, host)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, 'http://{}:{}'.format(host, server.server_address[1])
+
+
+def get_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Runs a local mock CC-Agency with a simulated scheduler.')
+
+    parser.add_argument('--host', default='127.0.0.1', help='The host to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='The port to listen on')
+    parser.add_argument('--nodes', type=int, default=DEFAULT_NUM_NODES, help='The number of cluster nodes')
+    parser.add_argument(
+        '--slots-per-node', type=int, default=DEFAULT_SLOTS_PER_NODE,
+        help='The number of containers that can run on a node at the same time'
+    )
+    parser.add_argument(
+        '--scheduling-delay', type=float, default=DEFAULT_SCHEDULING_DELAY,
+        help='Seconds the scheduler needs per batch'
+    )
+    parser.add_argument(
+        '--start-latency', type=float, default=DEFAULT_START_LATENCY,
+        help='Median container start latency in seconds'
+    )
+    parser.add_argument(
+        '--processing-time', type=float, default=DEFAULT_PROCESSING_TIME, help='Median processing time in seconds'
+    )
+    parser.add_argument(
+        '--jitter', type=float, default=DEFAULT_JITTER,
+        help='Shape parameter of the log-normal start latency and processing time distributions, 0 disables jitter'
+    )
+    parser.add_argument(
+        '--failure-rate', type=float, default=DEFAULT_FAILURE_RATE, help='Fraction of batches that fail'
+    )
+    parser.add_argument(
+        '--time-scale', type=float, default=1.0, help='How many times faster than real time the agency clock runs'
+    )
+    parser.add_argument(
+        '--instant', action='store_true', help='Finish every batch immediately, e.g. to benchmark fetching'
+    )
+    parser.add_argument(
+        '--preload', type=int, default=0, help='Create an experiment with this number of batches on startup'
+    )
+    parser.add_argument('--seed', type=int, default=None, help='Random seed of the scheduler model')
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = get_arguments(argv)
+
+    scheduler_model = SchedulerModel(
+        args.nodes, args.slots_per_node, args.scheduling_delay, args.start_latency, args.processing_time, args.jitter,
+        args.failure_rate, args.seed
+    )
+    agency = MockAgency(scheduler_model, AgencyClock(args.time_scale, args.instant))
+
+    if args.preload:
+        experiment_id = agency.add_experiment(args.preload)
+        print('preloaded experiment {} with {} batches'.format(experiment_id, args.preload))
+
+    server = create_server(agency, args.port, args.host)
+    print('mock agency listening on http://{}:{}'.format(args.host, server.server_address[1]), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
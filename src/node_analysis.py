@@ -0,0 +1,185 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+from config import RESULTS_PATH, RESULT_CSV_PATH, RESULT_STORE_PATH, NODE_LABEL, TIME_REGISTERED_LABEL, \
+    TIME_SCHEDULED_LABEL, TIME_PROCESSING_LABEL, TIME_SUCCEEDED_LABEL
+from latency_stats import QUANTILES, QUANTILE_LABELS
+from result_store import read_results
+from state_occupancy import GroupedStateOccupancy, get_finish_times
+
+NODE_STATS_CSV_PATH = os.path.join(RESULTS_PATH, 'node_stats.csv')
+NODE_CONCURRENCY_CSV_PATH = os.path.join(RESULTS_PATH, 'node_concurrency.csv')
+NODE_CONCURRENCY_PLOT_PATH = os.path.join(RESULTS_PATH, 'node_concurrency.pdf')
+NODE_STATS_PLOT_PATH = os.path.join(RESULTS_PATH, 'node_stats.pdf')
+
+NODE_CONCURRENCY_TIME_STEP = 4
+
+TIME_LABEL = 'time'
+NUM_BATCHES_ON_NODE_LABEL = 'number batches on node'
+BATCHES_LABEL = 'batches'
+BATCH_SHARE_LABEL = 'share'
+MAX_CONCURRENCY_LABEL = 'max_concurrency'
+CONTAINER_START_LABEL = 'container_start'
+RUN_LABEL = 'run'
+
+
+def get_node_codes(data_frame):
+    """
+    Returns the distinct node names and the index of the node of every batch. Batches without node get the code -1.
+    """
+    nodes = pd.Categorical(data_frame[NODE_LABEL])
+    return np.asarray(nodes.categories.astype(str)), nodes.codes.astype(np.int64)
+
+
+def get_node_occupancy(data_frame, node_codes, num_nodes):
+    """
+    Returns the occupancy of the batches, that are on a node from the time they are scheduled to it until they
+    finished.
+    """
+    return GroupedStateOccupancy(
+        node_codes, num_nodes, data_frame[TIME_SCHEDULED_LABEL].values, get_finish_times(data_frame)
+    )
+
+
+def compute_node_stats(data_frame):
+    """
+    Computes for every node the number and share of batches, the maximal number of batches on the node at the same
+    time, percentiles of the container start time (scheduled to processing) and the mean run time (processing to
+    succeeded).
+
+    :param data_frame: The data frame with one row per batch, including the node column
+    :type data_frame: pd.DataFrame
+    :return: A data frame indexed by node
+    :rtype: pd.DataFrame
+    """
+    node_names, node_codes = get_node_codes(data_frame)
+    num_nodes = len(node_names)
+
+    on_node = node_codes >= 0
+    node_codes_on_node = node_codes[on_node]
+    container_start = (data_frame[TIME_PROCESSING_LABEL].values - data_frame[TIME_SCHEDULED_LABEL].values)[on_node]
+    run = (data_frame[TIME_SUCCEEDED_LABEL].values - data_frame[TIME_PROCESSING_LABEL].values)[on_node]
+
+    batches = np.bincount(node_codes_on_node, minlength=num_nodes)
+
+    durations = pd.DataFrame(data={CONTAINER_START_LABEL: container_start, RUN_LABEL: run})
+    grouped = durations.groupby(node_codes_on_node, sort=True)
+    duration_stats = grouped[CONTAINER_START_LABEL].quantile(QUANTILES).unstack()
+    duration_stats.columns = [
+        '{}_{}'.format(CONTAINER_START_LABEL, quantile_label) for quantile_label in QUANTILE_LABELS
+    ]
+    duration_stats['{}_max'.format(CONTAINER_START_LABEL)] = grouped[CONTAINER_START_LABEL].max()
+    duration_stats['{}_mean'.format(RUN_LABEL)] = grouped[RUN_LABEL].mean()
+    # nodes without batches
+    duration_stats = duration_stats.reindex(np.arange(num_nodes))
+    duration_stats.index = pd.Index(node_names, name=NODE_LABEL)
+
+    stats = pd.DataFrame(
+        data={
+            BATCHES_LABEL: batches,
+            BATCH_SHARE_LABEL: batches / max(batches.sum(), 1),
+            MAX_CONCURRENCY_LABEL: get_node_occupancy(data_frame, node_codes, num_nodes).max_counts(),
+        },
+        index=duration_stats.index
+    )
+    return pd.concat([stats, duration_stats], axis=1)
+
+
+def create_node_concurrency_data_frame(data_frame, time_step=NODE_CONCURRENCY_TIME_STEP):
+    """
+    Creates a data frame with the number of batches on every node every time_step seconds.
+
+    :return: A data frame with the node names as columns, indexed by time
+    :rtype: pd.DataFrame
+    """
+    node_names, node_codes = get_node_codes(data_frame)
+
+    start_time = data_frame[TIME_REGISTERED_LABEL].min()
+    end_time = np.nanmax(get_finish_times(data_frame))
+    times = np.arange(start_time, end_time, time_step)
+
+    counts = get_node_occupancy(data_frame, node_codes, len(node_names)).count(times)
+
+    return pd.DataFrame(data=counts.T, index=pd.Index(times, name=TIME_LABEL), columns=node_names)
+
+
+def plot_node_concurrency(node_concurrency_df):
+    fig, ax = plt.subplots(1, 1)
+
+    times = node_concurrency_df.index.values
+    image = ax.imshow(
+        node_concurrency_df.values.T, aspect='auto', interpolation='nearest', origin='lower',
+        extent=(times[0], times[-1], -0.5, len(node_concurrency_df.columns) - 0.5)
+    )
+    fig.colorbar(image, ax=ax, label=NUM_BATCHES_ON_NODE_LABEL)
+    ax.set_xlabel('time in seconds')
+    ax.set_ylabel(NODE_LABEL)
+    # with hundreds of nodes the names are not readable anymore
+    if len(node_concurrency_df.columns) <= 50:
+        ax.set_yticks(np.arange(len(node_concurrency_df.columns)))
+        ax.set_yticklabels(node_concurrency_df.columns, fontsize='small')
+
+    fig.savefig(NODE_CONCURRENCY_PLOT_PATH, bbox_inches='tight')
+
+
+def plot_node_stats(node_stats):
+    fig, (share_ax, container_start_ax) = plt.subplots(2, 1, sharex=True)
+
+    positions = np.arange(len(node_stats))
+    share_ax.bar(positions, node_stats[BATCH_SHARE_LABEL])
+    share_ax.axhline(1 / len(node_stats), color='black', linestyle='--', linewidth=1)
+    share_ax.set_ylabel('share of batches')
+
+    for quantile_label in ['p50', 'p99']:
+        container_start_ax.plot(
+            positions, node_stats['{}_{}'.format(CONTAINER_START_LABEL, quantile_label)], marker='.', linestyle='',
+            label=quantile_label
+        )
+    container_start_ax.set_ylabel('container start in seconds')
+    container_start_ax.set_xlabel(NODE_LABEL)
+    container_start_ax.legend()
+    if len(node_stats) <= 50:
+        container_start_ax.set_xticks(positions)
+        container_start_ax.set_xticklabels(node_stats.index, rotation=90, fontsize='small')
+
+    fig.savefig(NODE_STATS_PLOT_PATH, bbox_inches='tight')
+
+
+def get_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Analyses how the batches of executed experiments use the nodes.')
+
+    parser.add_argument(
+        '--time-step', type=float, default=NODE_CONCURRENCY_TIME_STEP,
+        help='The time in seconds between two node concurrency samples'
+    )
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = get_arguments(argv)
+
+    data_frame = read_results(RESULT_STORE_PATH, RESULT_CSV_PATH)
+    if NODE_LABEL not in data_frame.columns:
+        print('The results do not contain the node of the batches. Execute create_csv.py again to fetch them.')
+        return
+
+    node_stats = compute_node_stats(data_frame)
+    node_concurrency_df = create_node_concurrency_data_frame(data_frame, args.time_step)
+
+    node_stats.to_csv(NODE_STATS_CSV_PATH)
+    node_concurrency_df.to_csv(NODE_CONCURRENCY_CSV_PATH)
+
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(node_stats.round(3))
+
+    plot_node_concurrency(node_concurrency_df)
+    plot_node_stats(node_stats)
+
+
+if __name__ == '__main__':
+    main()
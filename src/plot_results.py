@@ -1,19 +1,25 @@
+import argparse
 import os
 
 import pandas as pd
 import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
 
-from create_csv import RESULT_CSV_PATH, TIME_REGISTERED_LABEL, TIME_SUCCEEDED_LABEL, TIME_SCHEDULED_LABEL, \
-    TIME_PROCESSING_LABEL, RESULTS_PATH
+from config import RESULT_CSV_PATH, TIME_REGISTERED_LABEL, TIME_SUCCEEDED_LABEL, TIME_SCHEDULED_LABEL, \
+    TIME_PROCESSING_LABEL, RESULTS_PATH, RESULT_STORE_PATH, TERMINAL_STATE_LABEL, RETRY_DURATION_LABEL, ATTEMPTS_LABEL
+from fast_plot import DEFAULT_FORMATS, DEFAULT_MAX_POINTS, LINE_PLOT, STAIRS_PLOT, render_figures, save_figure
+from instrumentation import stage
+from result_store import read_results
+from state_changes import get_bin_edges, count_state_changes, get_bin_labels, sum_by_bin
+from state_occupancy import StateOccupancy, get_finish_times
 
 NUM_BATCHES_TIME_STEP = 4
 NUM_BINS_NEW_BATCHES = 15
+STATE_CHANGE_BIN_WIDTH = 60
 NUM_BATCHES_LABEL = 'number of batch state changes'
 STATE_LABEL = 'state changes'
 
 TIME_LABEL = 'one minute time bins'
+STATE_COUNT_TIME_LABEL = 'time in seconds'
 NUM_SCHEDULED_LABEL = 'num batches scheduled'
 NUM_REGISTERED_BATCHES_LABEL = 'number registered batches'
 NUM_SCHEDULED_BATCHES_LABEL = 'number scheduled batches'
@@ -24,140 +30,265 @@ NUM_NEW_SCHEDULED_LABEL = 'from registered to scheduled'
 NUM_NEW_PROCESSING_LABEL = 'from scheduled to processing'
 NUM_NEW_SUCCEEDED_LABEL = 'from processing to succeeded'
 
-NEXT_STATE_LABEL = {
-    TIME_REGISTERED_LABEL: TIME_SCHEDULED_LABEL,
-    TIME_SCHEDULED_LABEL: TIME_PROCESSING_LABEL,
-    TIME_PROCESSING_LABEL: TIME_SUCCEEDED_LABEL,
-    TIME_SUCCEEDED_LABEL: None
-}
+NUM_FINISHED_LABEL = 'finished batches'
+NUM_UNSUCCESSFUL_LABEL = 'failed or cancelled batches'
+NUM_RETRIED_LABEL = 'retried batches'
+FAILURE_RATE_LABEL = 'failure rate'
+MEAN_RETRY_DURATION_LABEL = 'mean retry duration in seconds'
+UNSUCCESSFUL_STATES = ['failed', 'cancelled']
 
+STATE_COUNT_LABELS = [
+    (TIME_REGISTERED_LABEL, NUM_REGISTERED_BATCHES_LABEL),
+    (TIME_SCHEDULED_LABEL, NUM_SCHEDULED_BATCHES_LABEL),
+    (TIME_PROCESSING_LABEL, NUM_PROCESSING_BATCHES_LABEL),
+    (TIME_SUCCEEDED_LABEL, NUM_SUCCEEDED_BATCHES_LABEL),
+]
 
-def get_batches_in_state(data_frame, time, state_label):
-    if state_label is TIME_SUCCEEDED_LABEL:
-        return data_frame[(data_frame[state_label] <= time)]
+STATE_CHANGE_LABELS = [
+    (TIME_SCHEDULED_LABEL, NUM_NEW_SCHEDULED_LABEL),
+    (TIME_PROCESSING_LABEL, NUM_NEW_PROCESSING_LABEL),
+    (TIME_SUCCEEDED_LABEL, NUM_NEW_SUCCEEDED_LABEL),
+]
 
-    next_state_label = NEXT_STATE_LABEL[state_label]
 
-    return data_frame[(data_frame[state_label] <= time) & (data_frame[next_state_label] > time)]
+def create_state_count_data_frame(data_frame):
+    """
+    Creates a pandas Dataframe that contains the number of batches for the states 'registered', 'scheduled',
+    'processing' and 'succeeded'. Each value is present for multiple timestamps.
 
+    :param data_frame: The dataframe to get data from
+    :type data_frame: pd.DataFrame
+    :return:
+    """
+    start_time = data_frame[TIME_REGISTERED_LABEL].min()
+    end_time = np.nanmax(get_finish_times(data_frame))
 
-def count_batches_in_state(data_frame, time, state_label):
-    return len(get_batches_in_state(data_frame, time, state_label))
+    times = np.arange(start_time, end_time, NUM_BATCHES_TIME_STEP)
 
+    data = {TIME_LABEL: times}
+    for state_label, count_label in STATE_COUNT_LABELS:
+        data[count_label] = StateOccupancy.from_data_frame(data_frame, state_label).count(times)
 
-def count_new_batches_in_state(data_frame, start_time, end_time, state_label):
-    new_batches_in_state = data_frame[(data_frame[state_label] >= start_time) & (data_frame[state_label] < end_time)]
-    return len(new_batches_in_state)
+    return pd.DataFrame(data=data)
 
 
-def create_state_count_data_frame(data_frame):
+def create_state_change_df(data_frame, bin_width=STATE_CHANGE_BIN_WIDTH, group_label=None):
     """
-    Creates a pandas Dataframe that contains the number of batches for the states 'registered', 'scheduled',
-    'processing' and 'succeeded'. Each value is present for multiple timestamps.
+    Creates a pandas Dataframe that contains the number of batches that changed from 'registered' to 'scheduled', from
+    'scheduled' to 'processing' and from 'processing' to 'succeeded' in every time bin.
 
     :param data_frame: The dataframe to get data from
     :type data_frame: pd.DataFrame
+    :param bin_width: The width of a time bin in seconds
+    :param group_label: If given, the state changes are counted separately for every value of this column (e.g. the
+                        experiment id) and the column is added to the result
     :return:
     """
-    start_time = data_frame.min()[TIME_REGISTERED_LABEL]
-    end_time = data_frame.max()[TIME_SUCCEEDED_LABEL]
-
-    data = {
-        TIME_LABEL: [],
-        NUM_REGISTERED_BATCHES_LABEL: [],
-        NUM_SCHEDULED_BATCHES_LABEL: [],
-        NUM_PROCESSING_BATCHES_LABEL: [],
-        NUM_SUCCEEDED_BATCHES_LABEL: []
-    }
-
-    for time in np.arange(start_time, end_time, NUM_BATCHES_TIME_STEP):
-        data[TIME_LABEL].append(time)
-
-        registered_batch_count = count_batches_in_state(data_frame, time, TIME_REGISTERED_LABEL)
-        scheduled_batch_count = count_batches_in_state(data_frame, time, TIME_SCHEDULED_LABEL)
-        processing_batch_count = count_batches_in_state(data_frame, time, TIME_PROCESSING_LABEL)
-        succeeded_batch_count = count_batches_in_state(data_frame, time, TIME_SUCCEEDED_LABEL)
-
-        data[NUM_REGISTERED_BATCHES_LABEL].append(registered_batch_count)
-        data[NUM_SCHEDULED_BATCHES_LABEL].append(scheduled_batch_count)
-        data[NUM_PROCESSING_BATCHES_LABEL].append(processing_batch_count)
-        data[NUM_SUCCEEDED_BATCHES_LABEL].append(succeeded_batch_count)
+    start_time = data_frame[TIME_REGISTERED_LABEL].min()
+    end_time = np.nanmax(get_finish_times(data_frame))
 
-    return pd.DataFrame(data=data)
+    bin_edges = get_bin_edges(start_time, end_time, bin_width)
+    state_labels = [state_label for state_label, _ in STATE_CHANGE_LABELS]
+    group_names, counts = count_state_changes(data_frame, state_labels, bin_edges, group_label)
 
+    num_bins = len(bin_edges) - 1
 
-def create_state_change_df(data_frame):
-    start_time = data_frame.min()[TIME_REGISTERED_LABEL]
-    end_time = data_frame.max()[TIME_SUCCEEDED_LABEL]
+    data = {}
+    if group_label is not None:
+        data[group_label] = np.repeat(group_names, num_bins)
+    data[TIME_LABEL] = np.tile(get_bin_labels(bin_edges), len(group_names))
+    for state_label, count_label in STATE_CHANGE_LABELS:
+        data[count_label] = counts[state_label].ravel()
 
-    # round up end_time to a number divisible by NUM_BINS_NEW_BATCHES
-    # end_time = (int(end_time) // NUM_BINS_NEW_BATCHES + 1) * NUM_BINS_NEW_BATCHES
-    end_time = (int(end_time) // 60 + 1) * 60
+    return pd.DataFrame(data=data)
 
-    data = {
-        TIME_LABEL: [],
-        NUM_NEW_SCHEDULED_LABEL: [],
-        NUM_NEW_PROCESSING_LABEL: [],
-        NUM_NEW_SUCCEEDED_LABEL: []
-    }
 
-    # times_linspace = np.linspace(start_time, end_time, NUM_BINS_NEW_BATCHES + 1).astype(int)
-    times_linspace = np.arange(start_time, end_time+1, 60).astype(int)
+def create_failure_df(data_frame, bin_width=STATE_CHANGE_BIN_WIDTH):
+    """
+    Creates a pandas Dataframe that contains for every time bin the number of batches that finished, the share of them
+    that failed or were cancelled, the number of them that needed more than one attempt and the mean time they lost to
+    retries.
 
-    bin_start_time = times_linspace[0]
-    end_times = times_linspace[1:]
-    for bin_end_time in end_times:
-        data[TIME_LABEL].append(int(bin_end_time) // 60)
+    :param data_frame: The dataframe to get data from, containing the terminal state and retry columns
+    :type data_frame: pd.DataFrame
+    :param bin_width: The width of a time bin in seconds
+    :return:
+    """
+    finish_times = get_finish_times(data_frame)
+    bin_edges = get_bin_edges(data_frame[TIME_REGISTERED_LABEL].min(), np.nanmax(finish_times), bin_width)
 
-        new_scheduled_batch_count = count_new_batches_in_state(
-            data_frame, bin_start_time, bin_end_time, TIME_SCHEDULED_LABEL
-        )
-        new_processing_batch_count = count_new_batches_in_state(
-            data_frame, bin_start_time, bin_end_time, TIME_PROCESSING_LABEL
-        )
-        new_succeeded_batch_count = count_new_batches_in_state(
-            data_frame, bin_start_time, bin_end_time, TIME_SUCCEEDED_LABEL
-        )
+    unsuccessful = data_frame[TERMINAL_STATE_LABEL].isin(UNSUCCESSFUL_STATES).values
+    retried = data_frame[ATTEMPTS_LABEL].values > 1
 
-        data[NUM_NEW_SCHEDULED_LABEL].append(new_scheduled_batch_count)
-        data[NUM_NEW_PROCESSING_LABEL].append(new_processing_batch_count)
-        data[NUM_NEW_SUCCEEDED_LABEL].append(new_succeeded_batch_count)
+    num_finished = sum_by_bin(finish_times, bin_edges)
+    num_unsuccessful = sum_by_bin(finish_times, bin_edges, unsuccessful)
+    retry_duration = sum_by_bin(finish_times, bin_edges, data_frame[RETRY_DURATION_LABEL].values)
 
-        bin_start_time = bin_end_time
+    with np.errstate(invalid='ignore', divide='ignore'):
+        failure_rate = num_unsuccessful / num_finished
+        mean_retry_duration = retry_duration / num_finished
 
-    return pd.DataFrame(data=data)
+    return pd.DataFrame(data={
+        TIME_LABEL: get_bin_labels(bin_edges),
+        NUM_FINISHED_LABEL: num_finished.astype(int),
+        NUM_UNSUCCESSFUL_LABEL: num_unsuccessful.astype(int),
+        NUM_RETRIED_LABEL: sum_by_bin(finish_times, bin_edges, retried).astype(int),
+        FAILURE_RATE_LABEL: failure_rate,
+        MEAN_RETRY_DURATION_LABEL: mean_retry_duration,
+    })
 
 
 def analyse_data_frame(data_frame):
-    start_time = data_frame.min()[TIME_REGISTERED_LABEL]
-    end_time = data_frame.max()[TIME_SUCCEEDED_LABEL]
-
-    max_scheduled_batch_count = 0
-    max_processing_batch_count = 0
+    start_time = data_frame[TIME_REGISTERED_LABEL].min()
+    end_time = np.nanmax(get_finish_times(data_frame))
 
-    for time in np.arange(start_time, end_time, 0.1):
-        scheduled_batch_count = count_batches_in_state(data_frame, time, TIME_SCHEDULED_LABEL)
-        processing_batch_count = count_batches_in_state(data_frame, time, TIME_PROCESSING_LABEL)
-
-        max_scheduled_batch_count = max(max_scheduled_batch_count, scheduled_batch_count)
-        max_processing_batch_count = max(max_processing_batch_count, processing_batch_count)
+    max_scheduled_batch_count = StateOccupancy.from_data_frame(data_frame, TIME_SCHEDULED_LABEL).max_count()
+    max_processing_batch_count = StateOccupancy.from_data_frame(data_frame, TIME_PROCESSING_LABEL).max_count()
 
     print('max scheduled batch count: {}'.format(max_scheduled_batch_count))
     print('max processing batch count: {}'.format(max_processing_batch_count))
     print('total duration: {:.2f} sec'.format(end_time - start_time))
 
+    if TERMINAL_STATE_LABEL in data_frame.columns:
+        num_unsuccessful = data_frame[TERMINAL_STATE_LABEL].isin(UNSUCCESSFUL_STATES).sum()
+        num_finished = data_frame[TERMINAL_STATE_LABEL].notna().sum()
+        print('failed or cancelled batches: {} of {} finished'.format(num_unsuccessful, num_finished))
+        print('retried batches: {}'.format((data_frame[ATTEMPTS_LABEL] > 1).sum()))
+        print('time lost to retries: {:.2f} sec'.format(data_frame[RETRY_DURATION_LABEL].sum()))
+
+
+def get_state_changes_xlabel(bin_width):
+    if bin_width != STATE_CHANGE_BIN_WIDTH:
+        return '{:g} second time bins'.format(bin_width)
+    return TIME_LABEL
+
+
+def get_stairs_edges(bin_labels):
+    """
+    Returns the edges of consecutive bins from the bin labels, which are the ends of the bins in multiples of the bin
+    width.
+    """
+    return np.append(bin_labels[0] - 1, bin_labels)
 
-def main():
-    data_frame = pd.read_csv(RESULT_CSV_PATH, index_col=0)
-    # analyse_data_frame(data_frame)
-    state_count_df = create_state_count_data_frame(data_frame)
-    new_state_count_df = create_state_change_df(data_frame)
 
-    plot_state_count_df(state_count_df)
-    plot_new_state_count(new_state_count_df)
+def get_fast_plot_jobs(state_count_df, new_state_count_df, failure_df=None, bin_width=STATE_CHANGE_BIN_WIDTH,
+                       formats=None, max_points=DEFAULT_MAX_POINTS):
+    """
+    Creates the fast_plot jobs for the state counts, the state changes and if given the failures. The series are passed
+    as they are, so the figures show exactly the precomputed values without any aggregation.
+    """
+    times = state_count_df[TIME_LABEL].values
+    jobs = [{
+        'kind': LINE_PLOT,
+        'path': os.path.join(RESULTS_PATH, 'state_counts'),
+        'formats': formats,
+        'max_points': max_points,
+        'axes': [{
+            'xlabel': STATE_COUNT_TIME_LABEL,
+            'ylabel': NUM_BATCHES_LABEL,
+            'series': [(label, times, state_count_df[label].values) for _, label in STATE_COUNT_LABELS],
+        }],
+    }]
+
+    bin_edges = get_stairs_edges(new_state_count_df[TIME_LABEL].values)
+    jobs.append({
+        'kind': STAIRS_PLOT,
+        'path': os.path.join(RESULTS_PATH, 'state_changes'),
+        'formats': formats,
+        'axes': [{
+            'xlabel': get_state_changes_xlabel(bin_width),
+            'ylabel': NUM_BATCHES_LABEL,
+            'series': [(label, bin_edges, new_state_count_df[label].values) for _, label in STATE_CHANGE_LABELS],
+        }],
+    })
+
+    if failure_df is not None:
+        bin_edges = get_stairs_edges(failure_df[TIME_LABEL].values)
+        jobs.append({
+            'kind': STAIRS_PLOT,
+            'path': os.path.join(RESULTS_PATH, 'failures'),
+            'formats': formats,
+            'axes': [
+                {'ylabel': FAILURE_RATE_LABEL, 'color': 'tab:red', 'fill': True,
+                 'series': [(None, bin_edges, np.nan_to_num(failure_df[FAILURE_RATE_LABEL].values))]},
+                {'xlabel': get_state_changes_xlabel(bin_width), 'ylabel': MEAN_RETRY_DURATION_LABEL,
+                 'color': 'tab:blue', 'fill': True,
+                 'series': [(None, bin_edges, np.nan_to_num(failure_df[MEAN_RETRY_DURATION_LABEL].values))]},
+            ],
+        })
+
+    return jobs
+
+
+def get_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Plots the results of executed experiments.')
+
+    parser.add_argument(
+        '--bin-width', type=float, default=STATE_CHANGE_BIN_WIDTH,
+        help='The width of the state change time bins in seconds'
+    )
+    parser.add_argument(
+        '--fast', action='store_true',
+        help='Draw the precomputed series directly with matplotlib instead of seaborn, with long series downsampled '
+             'and the figures rendered in parallel processes. Recommended for long runs with many time bins.'
+    )
+    parser.add_argument(
+        '--formats', type=lambda v: v.split(','), default=DEFAULT_FORMATS,
+        help='Comma separated output formats of the figures, e.g. pdf,png. Default: pdf'
+    )
+    parser.add_argument(
+        '--processes', type=int, default=None,
+        help='The number of processes rendering figures with --fast, one per figure by default'
+    )
+    parser.add_argument(
+        '--max-points', type=int, default=DEFAULT_MAX_POINTS,
+        help='The maximal number of points per line with --fast, long lines keep the minima and maxima'
+    )
 
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = get_arguments(argv)
+
+    with stage('read results'):
+        data_frame = read_results(RESULT_STORE_PATH, RESULT_CSV_PATH)
+    analyse_data_frame(data_frame)
+    with stage('create state counts'):
+        state_count_df = create_state_count_data_frame(data_frame)
+    with stage('create state changes'):
+        new_state_count_df = create_state_change_df(data_frame, args.bin_width)
+
+    # results created before failed batches were exported do not contain the terminal state
+    failure_df = None
+    if TERMINAL_STATE_LABEL in data_frame.columns:
+        with stage('create failures'):
+            failure_df = create_failure_df(data_frame, args.bin_width)
+
+    if args.fast:
+        with stage('render figures'):
+            render_figures(
+                get_fast_plot_jobs(
+                    state_count_df, new_state_count_df, failure_df, args.bin_width, args.formats, args.max_points
+                ),
+                args.processes
+            )
+        return
+
+    with stage('plot state counts'):
+        plot_state_count_df(state_count_df, args.formats)
+    with stage('plot state changes'):
+        plot_new_state_count(new_state_count_df, args.bin_width, args.formats)
+    if failure_df is not None:
+        with stage('plot failures'):
+            plot_failure_df(failure_df, args.bin_width, args.formats)
+
+
+def plot_state_count_df(state_count_df, formats=None):
+    # seaborn is only imported by the seaborn plots, so that --fast does not load it
+    import seaborn as sns
+    import matplotlib.pyplot as plt
 
-def plot_state_count_df(state_count_df):
     fig, ax = plt.subplots(1, 1)
 
     df = state_count_df.melt(TIME_LABEL, var_name=STATE_LABEL, value_name=NUM_BATCHES_LABEL)
@@ -169,11 +300,14 @@ def plot_state_count_df(state_count_df):
         data=df,
         ax=ax
     )
-    plot_path = os.path.join(RESULTS_PATH, 'state_counts.pdf')
-    fig.savefig(plot_path, bibox_inches='tight')
+    ax.set_xlabel(STATE_COUNT_TIME_LABEL)
+    save_figure(fig, os.path.join(RESULTS_PATH, 'state_counts'), formats)
+
 
+def plot_new_state_count(data_frame, bin_width=STATE_CHANGE_BIN_WIDTH, formats=None):
+    import seaborn as sns
+    import matplotlib.pyplot as plt
 
-def plot_new_state_count(data_frame):
     fig, ax = plt.subplots(1, 1)
 
     df = data_frame.melt(TIME_LABEL, var_name=STATE_LABEL, value_name=NUM_BATCHES_LABEL)
@@ -185,8 +319,24 @@ def plot_new_state_count(data_frame):
         data=df,
         ax=ax
     )
-    plot_path = os.path.join(RESULTS_PATH, 'state_changes.pdf')
-    fig.savefig(plot_path, bibox_inches='tight')
+    if bin_width != STATE_CHANGE_BIN_WIDTH:
+        ax.set_xlabel('{:g} second time bins'.format(bin_width))
+    save_figure(fig, os.path.join(RESULTS_PATH, 'state_changes'), formats)
+
+
+def plot_failure_df(failure_df, bin_width=STATE_CHANGE_BIN_WIDTH, formats=None):
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+
+    fig, (failure_rate_ax, retry_ax) = plt.subplots(2, 1, sharex=True)
+
+    sns.barplot(x=TIME_LABEL, y=FAILURE_RATE_LABEL, data=failure_df, color='tab:red', ax=failure_rate_ax)
+    sns.barplot(x=TIME_LABEL, y=MEAN_RETRY_DURATION_LABEL, data=failure_df, color='tab:blue', ax=retry_ax)
+    failure_rate_ax.set_xlabel('')
+    if bin_width != STATE_CHANGE_BIN_WIDTH:
+        retry_ax.set_xlabel('{:g} second time bins'.format(bin_width))
+
+    save_figure(fig, os.path.join(RESULTS_PATH, 'failures'), formats)
 
 
 if __name__ == '__main__':
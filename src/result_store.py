@@ -0,0 +1,127 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+STORE_META_FILENAME = 'columns.json'
+STORE_VERSION = 1
+
+NUMERIC_COLUMN = 'numeric'
+CATEGORICAL_COLUMN = 'categorical'
+
+
+def _column_path(path, column, suffix):
+    return os.path.join(path, '{}.{}.npy'.format(column, suffix))
+
+
+def write_result_store(data_frame, path):
+    """
+    Writes a data frame as columnar result store. The store is a directory containing one uncompressed .npy file per
+    numeric column. Other columns (e.g. the experiment id) are stored as categorical columns, consisting of an int32
+    array of codes and an array holding every distinct value once.
+
+    The column description of an existing store is removed first and the new one is written last, so that an
+    interrupted write never leaves a readable store with columns of different writes.
+
+    :param data_frame: The data frame to store. Its index is not stored.
+    :type data_frame: pd.DataFrame
+    :param path: The directory of the store
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    meta_path = os.path.join(path, STORE_META_FILENAME)
+    if os.path.isfile(meta_path):
+        os.remove(meta_path)
+
+    columns = []
+    for column in data_frame.columns:
+        values = data_frame[column]
+        if pd.api.types.is_numeric_dtype(values) and not isinstance(values.dtype, pd.CategoricalDtype):
+            np.save(_column_path(path, column, 'values'), values.to_numpy())
+            columns.append({'name': column, 'kind': NUMERIC_COLUMN, 'dtype': str(values.dtype)})
+        else:
+            categorical = values.astype('category')
+            codes = categorical.cat.codes.to_numpy().astype(np.int32)
+            categories = np.array(categorical.cat.categories.astype(str), dtype=str)
+            np.save(_column_path(path, column, 'codes'), codes)
+            np.save(_column_path(path, column, 'categories'), categories)
+            columns.append({'name': column, 'kind': CATEGORICAL_COLUMN})
+
+    with open(meta_path + '.partial', 'w') as meta_file:
+        json.dump({'version': STORE_VERSION, 'rows': len(data_frame), 'columns': columns}, meta_file, indent=2)
+    os.replace(meta_path + '.partial', meta_path)
+
+
+def remove_result_store(path):
+    """
+    Removes the result store, if it exists. The column description is removed first, so that an interrupted removal
+    leaves no readable store.
+    """
+    if not os.path.isdir(path):
+        return
+    meta_path = os.path.join(path, STORE_META_FILENAME)
+    if os.path.isfile(meta_path):
+        os.remove(meta_path)
+    for filename in os.listdir(path):
+        if filename.endswith('.npy'):
+            os.remove(os.path.join(path, filename))
+    if not os.listdir(path):
+        os.rmdir(path)
+
+
+def is_result_store(path):
+    return os.path.isfile(os.path.join(path, STORE_META_FILENAME))
+
+
+def read_result_store(path, columns=None, mmap=True):
+    """
+    Reads a columnar result store written by write_result_store().
+
+    :param path: The directory of the store
+    :param columns: If given, only these columns are read
+    :param mmap: If True, numeric columns and categorical codes are memory-mapped instead of read into memory. The
+                 memory-mapped columns are read-only, assigning to them raises a ValueError.
+    :return: A data frame with the stored columns, categorical columns have the pandas category dtype
+    :rtype: pd.DataFrame
+    """
+    with open(os.path.join(path, STORE_META_FILENAME), 'r') as meta_file:
+        meta = json.load(meta_file)
+
+    mmap_mode = 'r' if mmap else None
+
+    data = {}
+    for column in meta['columns']:
+        name = column['name']
+        if columns is not None and name not in columns:
+            continue
+
+        if column['kind'] == NUMERIC_COLUMN:
+            data[name] = np.load(_column_path(path, name, 'values'), mmap_mode=mmap_mode)
+        else:
+            codes = np.load(_column_path(path, name, 'codes'), mmap_mode=mmap_mode)
+            categories = np.load(_column_path(path, name, 'categories'))
+            data[name] = pd.Categorical.from_codes(codes, categories)
+
+    if columns is not None:
+        missing_columns = [column for column in columns if column not in data]
+        if missing_columns:
+            raise KeyError('Columns {} are not present in result store "{}"'.format(missing_columns, path))
+        data = {column: data[column] for column in columns}
+
+    return pd.DataFrame(data=data, copy=False)
+
+
+def read_results(store_path, csv_path, columns=None, mmap=False):
+    """
+    Reads the experiment results from the columnar result store, if it exists, and from the csv file otherwise.
+
+    :param mmap: If True, the columns of the result store are memory-mapped and read-only, see read_result_store().
+                 The data frame read from the csv file is always writable.
+    """
+    if is_result_store(store_path):
+        return read_result_store(store_path, columns, mmap)
+
+    if columns is not None:
+        return pd.read_csv(csv_path, usecols=columns)[columns]
+    return pd.read_csv(csv_path, index_col=0)
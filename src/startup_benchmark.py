@@ -0,0 +1,112 @@
+import argparse
+import csv
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from ccload import COMMANDS
+
+CCLOAD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ccload.py')
+DEFAULT_REPETITIONS = 5
+NUM_SLOWEST_IMPORTS = 3
+INTERPRETER_LABEL = 'python'
+
+
+def measure_startup(arguments, repetitions):
+    """
+    Starts a new interpreter with the given arguments repetitions times and returns the wall clock time of every start.
+    """
+    durations = []
+    for _ in range(repetitions):
+        start_time = time.perf_counter()
+        subprocess.run([sys.executable] + arguments, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        durations.append(time.perf_counter() - start_time)
+    return durations
+
+
+def get_slowest_imports(arguments, num_imports=NUM_SLOWEST_IMPORTS):
+    """
+    Returns the top level packages with the largest cumulative import time in microseconds, as reported by
+    python -X importtime.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime'] + arguments, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        check=True, universal_newlines=True
+    )
+
+    import_times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        if '.' not in name and not name.startswith('_'):
+            import_times[name] = max(import_times.get(name, 0), int(cumulative))
+
+    return sorted(import_times.items(), key=lambda item: item[1], reverse=True)[:num_imports]
+
+
+def run_startup_benchmark(commands, repetitions=DEFAULT_REPETITIONS):
+    """
+    Measures how long it takes until every ccload command has parsed its arguments, i.e. the time spent starting the
+    interpreter and importing the command. The start of an interpreter without imports is measured as reference.
+
+    :return: A list of dictionaries with the command, the minimal and median startup time in seconds and the slowest
+             imports of the command
+    """
+    rows = []
+    runs = [(INTERPRETER_LABEL, ['-c', 'pass'])]
+    runs += [(command, [CCLOAD_PATH, command, '--help']) for command in commands]
+
+    for name, arguments in runs:
+        durations = measure_startup(arguments, repetitions)
+        rows.append({
+            'command': name,
+            'min': min(durations),
+            'median': statistics.median(durations),
+            'slowest_imports': ' '.join(
+                '{}={:.0f}ms'.format(package, micro_seconds / 1000)
+                for package, micro_seconds in get_slowest_imports(arguments)
+            ),
+        })
+    return rows
+
+
+def get_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Measures the cold start time of every ccload command.')
+
+    parser.add_argument('commands', nargs='*', metavar='command', help='The commands to measure, all by default')
+    parser.add_argument(
+        '--repetitions', type=int, default=DEFAULT_REPETITIONS, help='The number of starts measured per command'
+    )
+    parser.add_argument('--output', default=None, help='Write the startup times to this csv file')
+
+    args = parser.parse_args(argv)
+    unknown_commands = [command for command in args.commands if command not in COMMANDS]
+    if unknown_commands:
+        parser.error('unknown commands: {}'.format(', '.join(unknown_commands)))
+    return args
+
+
+def main(argv=None):
+    args = get_arguments(argv)
+
+    rows = run_startup_benchmark(args.commands or list(COMMANDS), args.repetitions)
+
+    print('{: <12}{: >12}{: >12}  {}'.format('command', 'min [s]', 'median [s]', 'slowest imports'))
+    for row in rows:
+        print('{: <12}{: >12.3f}{: >12.3f}  {}'.format(
+            row['command'], row['min'], row['median'], row['slowest_imports']
+        ))
+
+    if args.output:
+        with open(args.output, 'w', newline='') as output_file:
+            writer = csv.DictWriter(output_file, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+
+def get_bin_edges(start_time, end_time, bin_width):
+    """
+    Returns the edges of equally sized time bins covering [start_time, end_time].
+
+    The start is floored to whole seconds and the end is rounded up to the next multiple of bin_width, so that the last
+    state change always falls into a bin.
+    """
+    start_time = np.floor(start_time)
+    end_time = (np.floor(end_time / bin_width) + 1) * bin_width
+    num_bins = int(np.ceil((end_time - start_time) / bin_width))
+    return start_time + np.arange(num_bins + 1) * bin_width
+
+
+def get_bin_labels(bin_edges):
+    """
+    Returns the end of every bin in multiples of the bin width, e.g. minutes for one minute bins.
+    """
+    bin_width = bin_edges[1] - bin_edges[0]
+    return np.round(bin_edges[1:] / bin_width).astype(int)
+
+
+def get_bin_indices(times, bin_edges):
+    """
+    Returns a mask of the timestamps that fall into one of the bins and the bin index of each of these timestamps.
+    """
+    num_bins = len(bin_edges) - 1
+    bin_width = bin_edges[1] - bin_edges[0]
+
+    with np.errstate(invalid='ignore'):
+        bin_indices = np.floor((times - bin_edges[0]) / bin_width)
+    valid = (bin_indices >= 0) & (bin_indices < num_bins)
+    return valid, bin_indices[valid].astype(np.int64)
+
+
+def sum_by_bin(times, bin_edges, weights=None):
+    """
+    Returns the sum of the weights of the timestamps in every bin, or the number of timestamps if weights is None.
+    """
+    valid, bin_indices = get_bin_indices(np.asarray(times, dtype=float), bin_edges)
+    if weights is not None:
+        weights = np.asarray(weights, dtype=float)[valid]
+    return np.bincount(bin_indices, weights=weights, minlength=len(bin_edges) - 1)
+
+
+def count_state_changes(data_frame, state_labels, bin_edges, group_label=None):
+    """
+    Counts how many batches entered each state in each time bin. A timestamp t belongs to the bin [start, end) with
+    start <= t < end. Timestamps outside of the bins and missing timestamps are ignored.
+
+    Every state column is binned with a single np.bincount call, also if the counts are grouped.
+
+    :param data_frame: The dataframe containing one timestamp column per state
+    :type data_frame: pd.DataFrame
+    :param state_labels: The timestamp columns to count
+    :param bin_edges: Equally spaced bin edges as returned by get_bin_edges()
+    :param group_label: Optional column (e.g. the experiment id) to count separately for each of its values
+    :return: A tuple (group_names, counts). counts maps every state label to an array of shape
+             (len(group_names), num_bins). If group_label is None group_names is [None].
+    """
+    num_bins = len(bin_edges) - 1
+
+    if group_label is None:
+        group_names = [None]
+        group_codes = np.zeros(len(data_frame), dtype=np.int64)
+    else:
+        # categorical codes avoid sorting the group values of every batch
+        groups = pd.Categorical(data_frame[group_label]).remove_unused_categories()
+        group_names = list(groups.categories)
+        group_codes = groups.codes.astype(np.int64)
+
+    counts = {}
+    for state_label in state_labels:
+        valid, bin_indices = get_bin_indices(data_frame[state_label].values, bin_edges)
+
+        flat_indices = group_codes[valid] * num_bins + bin_indices
+        state_counts = np.bincount(flat_indices, minlength=len(group_names) * num_bins)
+        counts[state_label] = state_counts.reshape(len(group_names), num_bins)
+
+    return group_names, counts
@@ -0,0 +1,150 @@
+import numpy as np
+
+from config import TIME_REGISTERED_LABEL, TIME_SCHEDULED_LABEL, TIME_PROCESSING_LABEL, TIME_SUCCEEDED_LABEL, \
+    TIME_FINISHED_LABEL
+
+NEXT_STATE_LABEL = {
+    TIME_REGISTERED_LABEL: TIME_SCHEDULED_LABEL,
+    TIME_SCHEDULED_LABEL: TIME_PROCESSING_LABEL,
+    TIME_PROCESSING_LABEL: TIME_SUCCEEDED_LABEL,
+    TIME_SUCCEEDED_LABEL: None
+}
+
+
+def get_finish_times(data_frame):
+    """
+    Returns the time every batch finished. Results without the finished column only contain succeeded batches.
+    """
+    if TIME_FINISHED_LABEL in data_frame.columns:
+        return data_frame[TIME_FINISHED_LABEL].values
+    return data_frame[TIME_SUCCEEDED_LABEL].values
+
+
+def get_exit_times(data_frame, state_label):
+    """
+    Returns the time every batch left the given state. This is the time it entered the next state or, if the batch
+    failed or was cancelled before, the time it finished. A retried batch counts as registered until the scheduling of
+    its last attempt.
+    """
+    next_state_label = NEXT_STATE_LABEL[state_label]
+    if next_state_label is None:
+        return None
+    return np.fmin(data_frame[next_state_label].values, get_finish_times(data_frame))
+
+
+class StateOccupancy:
+    """
+    Answers how many batches are in one state at arbitrary points in time.
+
+    A batch is in the state at time t, if it entered the state at or before t and left it after t. The entry and exit
+    timestamps are sorted once, so that every query is answered by two binary searches instead of a scan over all
+    batches.
+    """
+    def __init__(self, entry_times, exit_times=None):
+        entry_times = np.asarray(entry_times, dtype=float)
+        if exit_times is None:
+            exit_times = np.full_like(entry_times, np.inf)
+        else:
+            # a batch that leaves the state before entering it is never counted
+            exit_times = np.maximum(np.asarray(exit_times, dtype=float), entry_times)
+
+        valid = ~np.isnan(entry_times)
+        self.entry_times = np.sort(entry_times[valid])
+        self.exit_times = np.sort(exit_times[valid])
+
+    @staticmethod
+    def from_data_frame(data_frame, state_label):
+        return StateOccupancy(data_frame[state_label].values, get_exit_times(data_frame, state_label))
+
+    def count(self, times):
+        """
+        Returns the number of batches in the state for every given time.
+
+        :param times: A scalar or array of timestamps
+        :return: The batch counts with the shape of times
+        """
+        times = np.asarray(times, dtype=float)
+        entered = np.searchsorted(self.entry_times, times, side='right')
+        left = np.searchsorted(self.exit_times, times, side='right')
+        return entered - left
+
+    def max_count(self):
+        """
+        Returns the exact maximum number of batches that were in the state at the same time.
+
+        The count only increases at entry timestamps, so the maximum is always attained at one of them and does not
+        depend on the resolution of a time grid.
+        """
+        if len(self.entry_times) == 0:
+            return 0
+        return int(self.count(self.entry_times).max())
+
+
+class GroupedStateOccupancy:
+    """
+    Answers how many batches of every group (e.g. every node) are in one state at arbitrary points in time.
+
+    The timestamps of group g are shifted by g times a span larger than the range of all timestamps, so that the
+    timestamps of all groups are sorted once into a single array and the counts of all groups and times are answered by
+    one binary search.
+    """
+    def __init__(self, group_codes, num_groups, entry_times, exit_times=None):
+        group_codes = np.asarray(group_codes, dtype=np.int64)
+        entry_times = np.asarray(entry_times, dtype=float)
+        if exit_times is None:
+            exit_times = np.full_like(entry_times, np.inf)
+        else:
+            exit_times = np.maximum(np.asarray(exit_times, dtype=float), entry_times)
+            # a batch without exit timestamp never left the state
+            exit_times[np.isnan(exit_times)] = np.inf
+
+        valid = ~np.isnan(entry_times) & (group_codes >= 0)
+        group_codes = group_codes[valid]
+        entry_times = entry_times[valid]
+        exit_times = exit_times[valid]
+
+        self.num_groups = num_groups
+        self.offset = entry_times.min() if len(entry_times) else 0.0
+        finite_exit_times = exit_times[np.isfinite(exit_times)]
+        last_time = max(
+            entry_times.max() if len(entry_times) else self.offset,
+            finite_exit_times.max() if len(finite_exit_times) else self.offset
+        )
+        self.time_range = last_time - self.offset
+        # keys of group g lie in [g * span + 0.5, g * span + time_range + 2], so the groups never overlap
+        self.span = self.time_range + 3.0
+
+        self.entry_keys = np.sort(self._keys(group_codes, entry_times))
+        # batches that never leave the state get a key behind every query key of their group
+        self.exit_keys = np.sort(np.where(
+            np.isinf(exit_times), group_codes * self.span + self.time_range + 2.0, self._keys(group_codes, exit_times)
+        ))
+        self.entry_group_codes = np.floor(self.entry_keys / self.span).astype(np.int64)
+
+    def _keys(self, group_codes, times):
+        return group_codes * self.span + 1.0 + np.clip(times - self.offset, -0.5, self.time_range + 0.5)
+
+    def count(self, times):
+        """
+        Returns the number of batches in the state for every group and every given time.
+
+        :param times: An array of timestamps
+        :return: An array with shape (num_groups, len(times))
+        """
+        times = np.asarray(times, dtype=float)
+        group_codes = np.arange(self.num_groups)[:, np.newaxis]
+        keys = self._keys(group_codes, times[np.newaxis, :])
+        entered = np.searchsorted(self.entry_keys, keys, side='right')
+        left = np.searchsorted(self.exit_keys, keys, side='right')
+        return entered - left
+
+    def max_counts(self):
+        """
+        Returns the exact maximum number of batches of every group that were in the state at the same time.
+        """
+        max_counts = np.zeros(self.num_groups, dtype=np.int64)
+        if len(self.entry_keys):
+            counts = np.searchsorted(self.entry_keys, self.entry_keys, side='right') \
+                - np.searchsorted(self.exit_keys, self.entry_keys, side='right')
+            np.maximum.at(max_counts, self.entry_group_codes, counts)
+        return max_counts
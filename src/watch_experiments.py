@@ -0,0 +1,33 @@
+import argparse
+
+from config import AuthenticationInfo, get_experiment_ids_from_executed_experiments
+from execute_experiment import add_monitor_arguments, monitor_experiments
+
+
+def get_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Monitors already submitted experiments until they are finished, e.g. after execute_experiment.py '
+                    'was interrupted or from a second terminal.'
+    )
+
+    parser.add_argument(
+        'experiment_ids', nargs='*',
+        help='The experiments to monitor, all executed experiments by default'
+    )
+    add_monitor_arguments(parser)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = get_arguments(argv)
+
+    experiment_ids = args.experiment_ids or get_experiment_ids_from_executed_experiments()
+
+    agency_auth_info = AuthenticationInfo.agency_from_user_input()
+
+    monitor_experiments(agency_auth_info, experiment_ids, args)
+
+
+if __name__ == '__main__':
+    main()